@@ -30,14 +30,165 @@ import time
 import logging
 import math
 import numpy as np
+from collections import namedtuple
 
 import mpl.roc as roc
 from mpl import JointEnum as MplId
 from utilities import user_config
+from utilities.orientation import relative_rotation
 
 from transforms3d.euler import mat2euler
 
 
+# Map classes to joint id and direction of motion
+# Class Name: IsGrasp, JointId, Direction, GraspId
+# rather than listing out all grasps, just list the arm motions and assume others are grasps
+CLASS_LOOKUP = {
+    'No Movement': [False, None, 0, None],
+    'Shoulder Flexion': [False, MplId.SHOULDER_FE, +1, None],
+    'Shoulder Extension': [False, MplId.SHOULDER_FE, -1, None],
+    'Shoulder Adduction': [False, MplId.SHOULDER_AB_AD, +1, None],
+    'Shoulder Abduction': [False, MplId.SHOULDER_AB_AD, -1, None],
+    'Humeral Internal Rotation': [False, MplId.HUMERAL_ROT, +1, None],
+    'Humeral External Rotation': [False, MplId.HUMERAL_ROT, -1, None],
+    'Elbow Flexion': [False, MplId.ELBOW, +1, None],
+    'Elbow Extension': [False, MplId.ELBOW, -1, None],
+    'Wrist Rotate In': [False, MplId.WRIST_ROT, +1, None],
+    'Wrist Rotate Out': [False, MplId.WRIST_ROT, -1, None],
+    'Wrist Adduction': [False, MplId.WRIST_AB_AD, +1, None],
+    'Wrist Abduction': [False, MplId.WRIST_AB_AD, -1, None],
+    'Wrist Flex In': [False, MplId.WRIST_FE, +1, None],
+    'Wrist Extend Out': [False, MplId.WRIST_FE, -1, None],
+    'Thumb Adduct In': [False, MplId.THUMB_CMC_AB_AD, +1, None],
+    'Thumb Abduct Out': [False, MplId.THUMB_CMC_AB_AD, -1, None],
+    'Hand Open': [True, None, -1, None],
+    # 'Spherical Grasp': [True, None, +1, 'Spherical Grasp'],
+    # 'Tip Grasp': [True, None, +1, 'Tip Grasp'],
+}
+
+# Joint command for a class
+ClassAction = namedtuple('ClassAction', ['is_grasp', 'joint_id', 'direction', 'grasp_id'])
+
+
+def class_action(class_name):
+    """ Return the ClassAction for a class name.  Names not in CLASS_LOOKUP are assumed to be grasps in the ROC table """
+    if class_name in CLASS_LOOKUP:
+        return ClassAction(*CLASS_LOOKUP[class_name])
+    # logging.warning('Unmatched class name {}'.format(class_name))
+    return ClassAction(True, None, +1, class_name)
+
+
+def compile_class_actions(motion_names, roc_table=None):
+    """
+    Build the action table for a list of class names.  The table is a tuple of ClassAction indexed by class id
+
+    Grasp classes that are not in the roc_table (if given) are logged since they will not move the hand
+    """
+    actions = tuple(class_action(name) for name in motion_names)
+    if roc_table is not None:
+        missing = [a.grasp_id for a in actions if a.grasp_id is not None and a.grasp_id not in roc_table]
+        if missing:
+            logging.info('Grasp classes without a ROC: {}'.format(', '.join(missing)))
+    return actions
+
+
+def integrate_clipped(initial, steps, lower, upper, reset=None, reset_values=None):
+    """
+    Integrate a sequence of steps with limits applied at every step, for all steps at once
+
+        x[t] = clip(x[t-1] + steps[t], lower, upper), starting from x[-1] = initial
+
+    This is what repeated Plant.update() calls compute, but done with a cumulative sum per column followed by
+    reflection off the limits.  Where reset[t] is True, x[t] = reset_values[t] instead and integration continues
+    from that value (e.g. joints set by a ROC).
+
+    :param initial: starting value, scalar or [N]
+    :param steps: [T] or [T by N] increments
+    :param lower: lower limit, scalar or [N]
+    :param upper: upper limit, scalar or [N]
+    :param reset: optional [T by N] bool mask of values to set rather than integrate
+    :param reset_values: [T by N] values used where reset is True
+    :return: integrated values, same shape as steps
+    """
+    steps = np.asarray(steps, dtype=float)
+    is_vector = steps.ndim == 1
+    if is_vector:
+        steps = steps[:, np.newaxis]
+    num_steps, num_columns = steps.shape
+    initial = np.broadcast_to(np.asarray(initial, dtype=float), (num_columns,))
+    lower = np.broadcast_to(np.asarray(lower, dtype=float), (num_columns,))
+    upper = np.broadcast_to(np.asarray(upper, dtype=float), (num_columns,))
+
+    x = np.empty_like(steps)
+    if reset is None:
+        free = np.ones(num_columns, dtype=bool)
+    else:
+        reset = np.asarray(reset, dtype=bool).reshape(num_steps, num_columns)
+        free = ~reset.any(axis=0)
+
+    # columns that are only integrated
+    x[:, free] = _integrate_limited(initial[free], steps[:, free], lower[free], upper[free])
+
+    # columns with reset values are integrated run by run between resets
+    for j in np.flatnonzero(~free):
+        column_reset = reset[:, j]
+        x[column_reset, j] = np.asarray(reset_values)[column_reset, j]
+        integrated = ~column_reset
+        starts = np.flatnonzero(integrated & ~np.r_[False, integrated[:-1]])
+        ends = np.flatnonzero(integrated & ~np.r_[integrated[1:], False]) + 1
+        for start, end in zip(starts, ends):
+            x0 = initial[j:j + 1] if start == 0 else x[start - 1, j:j + 1]
+            x[start:end, j:j + 1] = _integrate_limited(x0, steps[start:end, j:j + 1], lower[j:j + 1], upper[j:j + 1])
+
+    return x[:, 0] if is_vector else x
+
+
+# Steps integrated per block by _integrate_limited, and limit passes tried per block before stepping through it
+LIMIT_BLOCK_SIZE = 256
+LIMIT_MAX_PASSES = 4
+
+
+def _integrate_limited(initial, steps, lower, upper):
+    # Integrate steps [T by N] from initial [N] with limits [N] applied at every step.  Blocks of LIMIT_BLOCK_SIZE
+    # steps are integrated in turn from the last value of the previous block, so the limit passes in
+    # _apply_limits only span one block and the total cost stays proportional to T
+    x = np.empty_like(steps)
+    x0 = initial
+    for start in range(0, steps.shape[0], LIMIT_BLOCK_SIZE):
+        block = steps[start:start + LIMIT_BLOCK_SIZE]
+        path = x[start:start + block.shape[0]]
+        np.cumsum(block, axis=0, out=path)
+        path += x0
+        _apply_limits(path, block, x0, lower, upper)
+        # drop rounding left over from the limit passes so values stay within the limits exactly
+        np.clip(path, lower, upper, out=path)
+        x0 = path[-1]
+    return x
+
+
+def _apply_limits(path, steps, initial, lower, upper):
+    # Push an integrated path [T by N] off its limits, in place, as if it had been clipped at every step.  A one
+    # sided limit is applied with the running max of the violation (Lindley recursion).  Alternating lower and
+    # upper passes resolves one switch between the limits per pass.  Columns that switch more often than that
+    # (e.g. bouncing between limits) are stepped through one value at a time instead
+    for _ in range(LIMIT_MAX_PASSES):
+        path += np.maximum.accumulate(np.maximum(lower - path, 0), axis=0)
+        path -= np.maximum.accumulate(np.maximum(path - upper, 0), axis=0)
+        unresolved = np.any(path < lower - 1e-9, axis=0)
+        if not unresolved.any():
+            return path
+
+    for j in np.flatnonzero(unresolved):
+        lo, hi = float(lower[j]), float(upper[j])
+        value = float(initial[j])
+        column = []
+        for step in steps[:, j].tolist():
+            value = min(max(value + step, lo), hi)
+            column.append(value)
+        path[:, j] = column
+    return path
+
+
 def class_map(class_name):
     """ Map a pattern recognition class name to a joint command
 
@@ -46,50 +197,11 @@ def class_map(class_name):
 
      return JointId, Direction, IsGrasp, Grasp
 
-       'No Movement' is not necessary in dict_Joint with '.get default return
-     JointId, Direction = self.Joint.get(class_name,[ [], 0 ])
+     For per update use, see Plant.get_class_actions() which returns a precomputed table indexed by class id
     """
-    class_info = {'IsGrasp': None, 'JointId': None, 'Direction': 0, 'GraspId': None}
-
-    # Map classes to joint id and direction of motion
-    # Class Name: IsGrasp, JointId, Direction, GraspId
-    class_lookup = {
-        'No Movement': [False, None, 0, None],
-        'Shoulder Flexion': [False, MplId.SHOULDER_FE, +1, None],
-        'Shoulder Extension': [False, MplId.SHOULDER_FE, -1, None],
-        'Shoulder Adduction': [False, MplId.SHOULDER_AB_AD, +1, None],
-        'Shoulder Abduction': [False, MplId.SHOULDER_AB_AD, -1, None],
-        'Humeral Internal Rotation': [False, MplId.HUMERAL_ROT, +1, None],
-        'Humeral External Rotation': [False, MplId.HUMERAL_ROT, -1, None],
-        'Elbow Flexion': [False, MplId.ELBOW, +1, None],
-        'Elbow Extension': [False, MplId.ELBOW, -1, None],
-        'Wrist Rotate In': [False, MplId.WRIST_ROT, +1, None],
-        'Wrist Rotate Out': [False, MplId.WRIST_ROT, -1, None],
-        'Wrist Adduction': [False, MplId.WRIST_AB_AD, +1, None],
-        'Wrist Abduction': [False, MplId.WRIST_AB_AD, -1, None],
-        'Wrist Flex In': [False, MplId.WRIST_FE, +1, None],
-        'Wrist Extend Out': [False, MplId.WRIST_FE, -1, None],
-        'Thumb Adduct In': [False, MplId.THUMB_CMC_AB_AD, +1, None],
-        'Thumb Abduct Out': [False, MplId.THUMB_CMC_AB_AD, -1, None],
-        'Hand Open': [True, None, -1, None],
-        # 'Spherical Grasp': [True, None, +1, 'Spherical Grasp'],
-        # 'Tip Grasp': [True, None, +1, 'Tip Grasp'],
-    }
-
-    # rather than listing out all grasps, just list the arm motions and assume others are grasps
-
-    if class_name in class_lookup:
-        class_info['IsGrasp'], class_info['JointId'], class_info['Direction'], class_info['GraspId'] = class_lookup[
-            class_name]
-    else:
-        # Assume this is a grasp in the ROC table
-        # logging.warning('Unmatched class name {}'.format(class_name))
-        class_info['IsGrasp'] = True
-        class_info['JointId'] = None
-        class_info['Direction'] = +1
-        class_info['GraspId'] = class_name
-
-    return class_info
+    action = class_action(class_name)
+    return {'IsGrasp': action.is_grasp, 'JointId': action.joint_id, 'Direction': action.direction,
+            'GraspId': action.grasp_id}
 
 
 class Plant(object):
@@ -104,9 +216,14 @@ class Plant(object):
     def __init__(self, dt, roc_filename):
 
         # store current position and velocity commands
+        # these are updated in place, so copy values into them rather than replacing them
         self.joint_position = np.zeros(MplId.NUM_JOINTS)
         self.joint_velocity = np.zeros(MplId.NUM_JOINTS)
 
+        # work arrays for update()
+        self.__joint_step = np.zeros(MplId.NUM_JOINTS)
+        self.__roc_angles = np.zeros(MplId.NUM_JOINTS)
+
         # Load limits from xml config file
         self.lower_limit = np.zeros(MplId.NUM_JOINTS)
         self.upper_limit = np.zeros(MplId.NUM_JOINTS)
@@ -127,6 +244,10 @@ class Plant(object):
         self.roc_filename = roc_filename
         self.roc_table = None
 
+        # class actions indexed by class id, and the class names they were compiled for
+        self.class_actions = None
+        self.class_actions_names = None
+
         self.load_roc()
         self.load_config_parameters()
 
@@ -134,8 +255,13 @@ class Plant(object):
         self.myo_position_1 = user_config.get_user_config_var('myo_position_1', 'AE')
         self.myo_position_2 = user_config.get_user_config_var('myo_position_2', 'AE')
         self.arm_side = user_config.get_user_config_var('MotionTrack.arm_side', 'right')
-        self.ref_frame_upper = np.eye(4)  # offset
-        self.ref_frame_lower = np.eye(4)
+        self.ref_frame_upper = None  # reference orientation, set on the first motion tracking update
+        self.ref_frame_lower = None
+
+    def reset_motion_tracking(self):
+        # use the next orientation as the new reference
+        self.ref_frame_upper = None
+        self.ref_frame_lower = None
 
     def load_config_parameters(self):
         # Load parameters from xml config file
@@ -149,6 +275,18 @@ class Plant(object):
         # can be run once plant is already initiated (reload)
         logging.info('Loading ROC table {}'.format(self.roc_filename))
         self.roc_table = roc.read_roc_table(self.roc_filename)
+        self.class_actions_names = None
+
+    def get_class_actions(self, motion_names):
+        """
+        Return the action table (ClassAction indexed by class id) for the class names
+
+        The table is compiled once and only rebuilt if the class names or the ROC table change
+        """
+        if motion_names is not self.class_actions_names:
+            self.class_actions = compile_class_actions(motion_names, self.roc_table)
+            self.class_actions_names = motion_names
+        return self.class_actions
 
     def new_step(self):
         # set all velocities to 0 to prepare for a new time step
@@ -192,17 +330,17 @@ class Plant(object):
             # Both armbands are above elbow.  Since the shoulder is a 3DOF joint, we need to establish a
             # reference position and then solve the angles independently
 
-            # Create 4x4 matrix from 3x3 rotation matrix
-            F = np.insert(np.insert(rot_mat[0], 3, 0, axis=1), 3, [0, 0, 0, 1], axis=0)
+            F = rot_mat[0]
 
             # set offset first time through
-            if np.array_equal(self.ref_frame_upper, np.eye(4)):
+            if self.ref_frame_upper is None:
                 self.ref_frame_upper = F
 
             # compute shoulder angles
             # RSA Note: This needs to be matrix multiply.  Matrix dot operator gives a nonsensical result
             # WRONG: newXYZ = (mat2euler(np.dot(np.linalg.pinv(self.Fref), F)))
-            shoulder_angles = mat2euler(np.matmul(np.linalg.pinv(self.ref_frame_upper), F), axes='sxyz')
+            # The inverse of a rotation matrix is its transpose
+            shoulder_angles = mat2euler(relative_rotation(self.ref_frame_upper, F), axes='sxyz')
             # print((180.0 / math.pi * shoulder_angles[0], 180.0 / math.pi * shoulder_angles[1],
             #        180.0 / math.pi * shoulder_angles[2]))
 
@@ -228,26 +366,25 @@ class Plant(object):
             logging.warning('Unknown Arm Tracking State')
             return
 
-        # Create 4x4 matrix from 3x3 rotation matrix
-        F_upper = np.insert(np.insert(rot_mat[id_upper_arm_sensor], 3, 0, axis=1), 3, [0, 0, 0, 1], axis=0)
-        F_lower = np.insert(np.insert(rot_mat[id_lower_arm_sensor], 3, 0, axis=1), 3, [0, 0, 0, 1], axis=0)
+        F_upper = rot_mat[id_upper_arm_sensor]
+        F_lower = rot_mat[id_lower_arm_sensor]
 
         # set offset first time through
-        if np.array_equal(self.ref_frame_upper, np.eye(4)):
+        if self.ref_frame_upper is None:
             self.ref_frame_upper = F_upper
-        if np.array_equal(self.ref_frame_lower, np.eye(4)):
+        if self.ref_frame_lower is None:
             self.ref_frame_lower = F_lower
 
         # these are the sensor rotation matrices relative to their starting point
-        F_start_upper = np.matmul(np.linalg.pinv(self.ref_frame_upper), F_upper)
-        F_start_lower = np.matmul(np.linalg.pinv(self.ref_frame_lower), F_lower)
+        F_start_upper = relative_rotation(self.ref_frame_upper, F_upper)
+        F_start_lower = relative_rotation(self.ref_frame_lower, F_lower)
 
         # compute shoulder angles
         shoulder_angles = mat2euler(F_start_upper)
         # print((180.0/math.pi*shoulder_angles[0], 180.0/math.pi*shoulder_angles[1], 180.0/math.pi*shoulder_angles[2]))
 
         # compute euler angles relative to the two sensors
-        relative_angles = mat2euler(np.matmul(np.linalg.pinv(F_start_upper), F_start_lower))
+        relative_angles = mat2euler(relative_rotation(F_start_upper, F_start_lower))
         # print((180.0/math.pi*relative_angles[0], 180.0/math.pi*relative_angles[1], 180.0/math.pi*relative_angles[2]))
 
         if self.arm_side == 'right':
@@ -268,28 +405,125 @@ class Plant(object):
 
     def update(self):
         # perform time integration based on elapsed time, dt
+        # State is updated in place so that nothing is allocated per update
 
-        # integrate roc values
-        self.roc_position += self.roc_velocity * self.dt
-        self.grasp_position += self.grasp_velocity * self.dt
-        # Apply limits
-        self.roc_position = np.clip(self.roc_position, 0, 1)
-        self.grasp_position = np.clip(self.grasp_position, 0, 1)
+        # integrate roc values and apply limits
+        self.roc_position = min(max(self.roc_position + self.roc_velocity * self.dt, 0.0), 1.0)
+        self.grasp_position = min(max(self.grasp_position + self.grasp_velocity * self.dt, 0.0), 1.0)
 
         # integrate joint positions from velocity commands
-        self.joint_position += self.joint_velocity * self.dt
+        np.multiply(self.joint_velocity, self.dt, out=self.__joint_step)
+        self.joint_position += self.__joint_step
 
         # set positions based on roc commands
         # hand positions will always be roc
-        if self.roc_id in self.roc_table:
-            roc_angles = roc.get_roc_values(self.roc_table[self.roc_id], self.roc_position)
-            self.joint_position[self.roc_table[self.roc_id].joints] = roc_angles
-        if self.grasp_id in self.roc_table:
-            roc_angles = roc.get_roc_values(self.roc_table[self.grasp_id], self.grasp_position)
-            self.joint_position[self.roc_table[self.grasp_id].joints] = roc_angles
+        roc_elem = self.roc_table.get(self.roc_id)
+        if roc_elem is not None:
+            self.joint_position[roc_elem.joints] = roc.get_roc_values(
+                roc_elem, self.roc_position, out=self.__roc_angles[:len(roc_elem.joints)])
+        roc_elem = self.roc_table.get(self.grasp_id)
+        if roc_elem is not None:
+            self.joint_position[roc_elem.joints] = roc.get_roc_values(
+                roc_elem, self.grasp_position, out=self.__roc_angles[:len(roc_elem.joints)])
 
         # Apply limits
-        self.joint_position = np.clip(self.joint_position, self.lower_limit, self.upper_limit)
+        np.clip(self.joint_position, self.lower_limit, self.upper_limit, out=self.joint_position)
+
+    def simulate(self, joint_velocity, grasp_velocity=None, grasp_id=None, roc_velocity=None, roc_id=None):
+        """
+        Integrate a sequence of velocity commands and return the joint trajectory [T by NUM_JOINTS]
+
+        Row t is the joint position after the t-th update, the same as setting the commands of row t and calling
+        update(), starting from the current state.  The plant state is not changed, so this can be used for offline
+        replay or to compare gains, limits, and roc tables.
+
+        :param joint_velocity: [T by NUM_JOINTS] joint velocity commands
+        :param grasp_velocity: [T] grasp roc velocity commands (default 0)
+        :param grasp_id: grasp roc name, or [T] names per update (default current grasp_id)
+        :param roc_velocity: [T] arm roc velocity commands (default 0)
+        :param roc_id: arm roc name, or [T] names per update (default current roc_id)
+        """
+        joint_velocity = np.asarray(joint_velocity, dtype=float)
+        num_steps = joint_velocity.shape[0]
+
+        # set joints from roc commands.  The grasp roc is applied last, as in update()
+        reset = np.zeros(joint_velocity.shape, dtype=bool)
+        reset_values = np.zeros(joint_velocity.shape)
+        for position, velocity, roc_names, default_name in (
+                (self.roc_position, roc_velocity, roc_id, self.roc_id),
+                (self.grasp_position, grasp_velocity, grasp_id, self.grasp_id)):
+            if velocity is None:
+                positions = np.full(num_steps, position)
+            else:
+                positions = integrate_clipped(position, np.asarray(velocity, dtype=float) * self.dt, 0.0, 1.0)
+            if roc_names is None:
+                roc_names = default_name
+            if isinstance(roc_names, str):
+                roc_names = np.full(num_steps, roc_names, dtype=object)
+            roc_names = np.asarray(roc_names, dtype=object)
+
+            for name in set(roc_names):
+                roc_elem = self.roc_table.get(name)
+                if roc_elem is None:
+                    continue
+                rows = np.flatnonzero(roc_names == name)
+                cells = np.ix_(rows, roc_elem.joints)
+                reset_values[cells] = roc.get_roc_values(roc_elem, positions[rows])
+                reset[cells] = True
+
+        np.clip(reset_values, self.lower_limit, self.upper_limit, out=reset_values)
+        return integrate_clipped(self.joint_position, joint_velocity * self.dt, self.lower_limit, self.upper_limit,
+                                 reset, reset_values)
+
+    def decision_commands(self, decisions, motion_names, gain=1.0, hand_gain=1.0, auto_open=False):
+        """
+        Convert a sequence of class decisions to velocity commands for simulate()
+
+        Commands are set as in the control loop (Scenario.update): arm classes command joint velocity, grasp
+        classes command grasp velocity and select the grasp while the hand is still mostly open (< 0.2)
+
+        :param decisions: [T] class ids into motion_names
+        :param motion_names: class names
+        :param gain: arm joint velocity
+        :param hand_gain: grasp velocity
+        :param auto_open: open the hand on 'No Movement'
+        :return: (joint_velocity [T by NUM_JOINTS], grasp_velocity [T], grasp_id [T])
+        """
+        decisions = np.asarray(decisions, dtype=np.intp)
+        num_steps = decisions.size
+        actions = self.get_class_actions(motion_names)
+
+        # class tables indexed by class id
+        is_grasp = np.array([a.is_grasp for a in actions], dtype=bool)
+        joint_id = np.array([-1 if a.joint_id is None else int(a.joint_id) for a in actions], dtype=np.intp)
+        direction = np.array([a.direction for a in actions], dtype=float)
+        has_grasp_id = np.array([a.grasp_id is not None for a in actions], dtype=bool)
+        grasp_names = np.array([a.grasp_id for a in actions], dtype=object)
+
+        arm = np.flatnonzero(~is_grasp[decisions] & (joint_id[decisions] >= 0))
+        joint_velocity = np.zeros((num_steps, MplId.NUM_JOINTS))
+        joint_velocity[arm, joint_id[decisions[arm]]] = direction[decisions[arm]] * gain
+
+        grasp_velocity = np.where(is_grasp[decisions], direction[decisions] * hand_gain, 0.0)
+        if auto_open and 'No Movement' in motion_names:
+            grasp_velocity[decisions == motion_names.index('No Movement')] = -hand_gain
+
+        # the grasp can change only while the grasp position (before the update) is < 0.2
+        grasp_position = integrate_clipped(self.grasp_position, grasp_velocity * self.dt, 0.0, 1.0)
+        position_before = np.r_[self.grasp_position, grasp_position[:-1]]
+        change = is_grasp[decisions] & has_grasp_id[decisions] & (position_before < 0.2)
+        last_change = np.maximum.accumulate(np.where(change, np.arange(num_steps), -1))
+        grasp_id = np.where(last_change >= 0, grasp_names[decisions[last_change]], self.grasp_id)
+
+        return joint_velocity, grasp_velocity, grasp_id
+
+    def simulate_decisions(self, decisions, motion_names, gain=1.0, hand_gain=1.0, auto_open=False):
+        """
+        Return the joint trajectory [T by NUM_JOINTS] for a sequence of class decisions.  See decision_commands()
+        """
+        joint_velocity, grasp_velocity, grasp_id = self.decision_commands(decisions, motion_names, gain,
+                                                                          hand_gain, auto_open)
+        return self.simulate(joint_velocity, grasp_velocity, grasp_id)
 
 
 def main():
@@ -0,0 +1,63 @@
+"""
+Joint space go-to trajectories
+
+A trajectory is the whole [num_steps by num_joints] path from a start to an end position, computed at once from a
+time scaling profile s (0 to 1 over the motion):
+
+    path = start + s[:, newaxis] * (end - start)
+
+Profiles:
+    linear - constant velocity, the same as interpolating each joint separately
+    minimum_jerk - smooth start and stop (s = 10t^3 - 15t^4 + 6t^5)
+    velocity_limited - constant velocity with the number of steps chosen so that no joint moves faster than
+        max_velocity (rad/s)
+
+Usage:
+    path = goto_trajectory(start_angles, end_angles, profile='minimum_jerk', num_steps=200)
+    for angles in path:
+        sink.send_joint_angles(angles)
+
+"""
+
+import math
+import numpy as np
+
+PROFILES = ('linear', 'minimum_jerk', 'velocity_limited')
+
+
+def linear_profile(num_steps):
+    """ Time scaling from 0 to 1 at constant velocity """
+    return np.linspace(0.0, 1.0, num_steps)
+
+
+def minimum_jerk_profile(num_steps):
+    """ Time scaling from 0 to 1 with zero velocity and acceleration at both ends """
+    t = np.linspace(0.0, 1.0, num_steps)
+    return t * t * t * (10.0 + t * (-15.0 + t * 6.0))
+
+
+def goto_trajectory(start, end, profile='linear', num_steps=200, max_velocity=1.0, dt=0.02):
+    """
+    Return the path [num_steps by num_joints] from start to end.  The first row is start and the last is end
+
+    :param start: starting joint angles
+    :param end: target joint angles
+    :param profile: 'linear', 'minimum_jerk', or 'velocity_limited'
+    :param num_steps: number of steps for linear and minimum_jerk profiles
+    :param max_velocity: maximum joint speed (rad/s) for the velocity_limited profile
+    :param dt: time between steps (s) for the velocity_limited profile
+    """
+    start = np.asarray(start, dtype=float)
+    delta = np.asarray(end, dtype=float) - start
+
+    if profile == 'minimum_jerk':
+        s = minimum_jerk_profile(num_steps)
+    elif profile == 'velocity_limited':
+        distance = float(np.abs(delta).max()) if delta.size else 0.0
+        s = linear_profile(max(int(math.ceil(distance / (max_velocity * dt))), 1) + 1)
+    elif profile == 'linear':
+        s = linear_profile(num_steps)
+    else:
+        raise ValueError('Unknown trajectory profile {}.  Options are {}'.format(profile, ', '.join(PROFILES)))
+
+    return start + s[:, np.newaxis] * delta
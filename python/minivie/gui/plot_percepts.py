@@ -18,6 +18,7 @@ if os.path.split(os.getcwd())[1] == 'gui':
     sys.path.insert(0, os.path.abspath('..'))
 from mpl import open_nfu
 from mpl import JointEnum as MplId
+from gui.signal_stream import SampleRing
 
 
 num_samples = 50
@@ -25,10 +26,16 @@ num_samples = 50
 
 class DataBuffer(object):
     def __init__(self):
-        self.data_buffer = np.zeros((num_samples, 27))
+        self.ring = SampleRing(num_samples, 27)
+        self.window = np.zeros((num_samples, 27))
+        self.x = np.arange(num_samples)
+
     def add_data(self, d):
-        self.data_buffer = np.roll(self.data_buffer, 1, axis=0)
-        self.data_buffer[:1][:] = d
+        self.ring.append(np.reshape(d, (1, -1)))
+
+    def get_data(self):
+        # Return buffer in time order, oldest first
+        return self.ring.get_window(out=self.window)
 
 
 # Setup Data Source
@@ -81,12 +88,9 @@ def onpick(event):
 def animate(i):
     p = m.get_percepts()
     buff.add_data(p['jointPercepts']['torque'])
-    d = buff.data_buffer * 1
+    d = buff.get_data()
     for iChannel in range(0, 27):
-        offset = (1 * (iChannel + 1) )
-        offset = 0
-        d[:, iChannel] = d[::-1, iChannel] + offset
-        lines[iChannel].set_data(range(0, num_samples), d[:, iChannel])
+        lines[iChannel].set_data(buff.x, d[:, iChannel])
 
 
 plt.ylim((-7, 7))
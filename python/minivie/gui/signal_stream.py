@@ -0,0 +1,222 @@
+"""
+Plotting backend for streaming signals, independent of any gui toolkit
+
+SampleRing - fixed size ring buffer fed from a SignalInput using its sample counter, so each sample is copied once
+DecimatedView - preallocated x-axis and min/max decimation of the ring window for plotting long windows
+SignalStreamer - headless mode that sends decimated frames to the web app over the websocket training interface
+
+The Qt SignalViewer and the matplotlib test plots use SampleRing / DecimatedView, while SignalStreamer allows
+signals to be viewed from the web app on an embedded system without Qt.
+
+Usage (headless, from the minivie folder):
+    python -m gui.signal_stream
+
+    then browse to the web app Myo page.  Frames are sent as 'signal_frame' messages:
+        {"x": [...], "y": [[channel 1 values], [channel 2 values], ...]}
+
+"""
+
+import json
+import asyncio
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SampleRing(object):
+    """
+    Fixed size ring buffer of samples [capacity by num_channels]
+
+    Samples are appended oldest first.  update_from_source() copies only the samples that a SignalInput has
+    received since the previous call, based on the source sample counter.
+    """
+
+    def __init__(self, capacity, num_channels=None):
+        self.capacity = capacity
+        self.num_channels = num_channels
+        self.data = None if num_channels is None else np.zeros((capacity, num_channels))
+        self.index = 0  # next row to be written
+        self.total = 0  # total samples appended
+        self.last_count = None  # source sample count at the previous update
+
+    def append(self, block):
+        """ Append a block of samples [nSamples by nChannels], oldest first """
+        num_new = block.shape[0]
+        if self.data is None:
+            self.num_channels = block.shape[1]
+            self.data = np.zeros((self.capacity, self.num_channels))
+        if num_new >= self.capacity:
+            block = block[-self.capacity:]
+            num_new = self.capacity
+
+        end = self.index + num_new
+        if end <= self.capacity:
+            self.data[self.index:end] = block
+        else:
+            split = self.capacity - self.index
+            self.data[self.index:] = block[:split]
+            self.data[:num_new - split] = block[split:]
+        self.index = end % self.capacity
+        self.total += num_new
+
+    def update_from_source(self, source):
+        """ Append the samples a SignalInput has received since the last call.  Returns the number of new samples """
+        count = source.get_sample_count()
+        num_new = count if self.last_count is None else count - self.last_count
+        self.last_count = count
+        if num_new <= 0:
+            return 0
+
+        # source buffer is newest on top
+        data = source.get_data()
+        num_new = min(num_new, data.shape[0])
+        self.append(data[num_new - 1::-1])
+        return num_new
+
+    def get_window(self, out=None):
+        """ Return the full ring [capacity by nChannels] in time order, oldest first """
+        if out is None:
+            out = np.empty_like(self.data)
+        split = self.capacity - self.index
+        out[:split] = self.data[self.index:]
+        out[split:] = self.data[:self.index]
+        return out
+
+
+def decimate_minmax(window, num_bins, out=None):
+    """
+    Reduce a window [nSamples by nChannels] to [2*num_bins by nChannels] keeping the minimum and maximum of each bin
+
+    Unlike simple subsampling, peaks are preserved.  Any samples beyond a whole number of bins are dropped from the
+    start (oldest end) of the window
+    """
+    num_samples, num_channels = window.shape
+    per_bin = num_samples // num_bins
+    bins = window[num_samples - per_bin * num_bins:].reshape(num_bins, per_bin, num_channels)
+    if out is None:
+        out = np.empty((2 * num_bins, num_channels))
+    np.min(bins, axis=1, out=out[0::2])
+    np.max(bins, axis=1, out=out[1::2])
+    return out
+
+
+class DecimatedView(object):
+    """
+    Preallocated plot data for a SampleRing
+
+    x is fixed for the life of the view.  If the window is longer than max_points, y holds the min/max envelope
+    """
+
+    def __init__(self, window_size, num_channels, max_points=500):
+        self.window = np.zeros((window_size, num_channels))
+
+        if window_size > max_points:
+            self.num_bins = max_points // 2
+            per_bin = window_size // self.num_bins
+            start = window_size - per_bin * self.num_bins
+            # each bin is plotted as two points (min, max) at the bin start
+            self.x = np.repeat(np.arange(start, window_size, per_bin), 2)
+            self.y = np.zeros((2 * self.num_bins, num_channels))
+        else:
+            self.num_bins = None
+            self.x = np.arange(window_size)
+            self.y = self.window
+
+    def update(self, ring):
+        """ Refresh y from the ring and return (x, y) """
+        ring.get_window(out=self.window)
+        if self.num_bins is not None:
+            decimate_minmax(self.window, self.num_bins, out=self.y)
+        return self.x, self.y
+
+
+class SignalStreamer(object):
+    """
+    Headless signal display.  Sends decimated frames of each source to the web app at a fixed rate
+
+    :param sources: list of SignalInput objects
+    :param interface: training interface with send_message(msg_id, msg), e.g. TrainingManagerWebsocket
+    """
+
+    def __init__(self, sources, interface, window_size=1000, max_points=200, rate=10.0, msg_id='signal_frame'):
+        self.sources = sources
+        self.interface = interface
+        self.window_size = window_size
+        self.max_points = max_points
+        self.rate = rate
+        self.msg_id = msg_id
+
+        self.rings = [SampleRing(window_size) for _ in sources]
+        self.views = [None] * len(sources)
+
+    def get_frame(self):
+        """ Update rings from the sources and return the decimated frame as a dictionary """
+        x = None
+        y = []
+        for i, (src, ring) in enumerate(zip(self.sources, self.rings)):
+            ring.update_from_source(src)
+            if ring.data is None:
+                continue
+            if self.views[i] is None:
+                self.views[i] = DecimatedView(self.window_size, ring.num_channels, self.max_points)
+            x, values = self.views[i].update(ring)
+            y.append(values)
+
+        if x is None:
+            return None
+        y = np.round(np.hstack(y).T, 3)
+        return {'x': x.tolist(), 'y': y.tolist()}
+
+    async def run(self):
+        while True:
+            try:
+                frame = self.get_frame()
+                if frame is not None:
+                    self.interface.send_message(self.msg_id, json.dumps(frame))
+            except Exception:
+                logger.exception('Error streaming signal frame')
+            await asyncio.sleep(1.0 / self.rate)
+
+
+def main():
+    """ Run the headless signal stream using the Myo client and web app settings from the user config """
+    import os
+    import sys
+    if os.path.split(os.getcwd())[1] == 'gui':
+        sys.path.insert(0, os.path.abspath('..'))
+        os.chdir('..')
+
+    from utilities import user_config
+    from utilities.user_config import get_user_config_var
+    from inputs import myo
+    from pattern_rec.training import TrainingManagerWebsocket
+
+    user_config.read_user_config_file()
+    logging.basicConfig(level=logging.INFO)
+
+    batch_receive = bool(get_user_config_var('MyoUdpClient.batch_receive', 0))
+    sources = [myo.MyoUdp(source=get_user_config_var('MyoUdpClient.local_address_1', '//0.0.0.0:15001'),
+                          batch_receive=batch_receive)]
+    if get_user_config_var('MyoUdpClient.num_devices', 1) == 2:
+        sources.append(myo.MyoUdp(source=get_user_config_var('MyoUdpClient.local_address_2', '//0.0.0.0:15002'),
+                                  batch_receive=batch_receive))
+    for src in sources:
+        src.connect()
+
+    interface = TrainingManagerWebsocket()
+    interface.setup(get_user_config_var('MobileApp.port', 9090))
+
+    streamer = SignalStreamer(sources, interface)
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(streamer.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for src in sources:
+            src.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@
 import sys
 from pyqtgraph.Qt import QtGui, QtCore
 import pyqtgraph as pg
+from gui.signal_stream import SampleRing, DecimatedView
 # Switch to using white background and black foreground
 pg.setConfigOption('background', 'w')
 pg.setConfigOption('foreground', 'k')
@@ -28,6 +29,12 @@ class SignalViewer(QtCore.QObject):
         self._show_filtered_data = True
         self._mode_select = 'Time Domain'
 
+        # Plot data, fed from the signal source sample counter.  Long windows are min/max decimated
+        self._window_size = 1000
+        self._max_points = 500
+        self._ring = SampleRing(self._window_size)
+        self._view = None
+
         # Timer
         self._timer = None
 
@@ -67,6 +74,9 @@ class SignalViewer(QtCore.QObject):
         self._timer = QtCore.QTimer(self)
         self.connect(self._timer, QtCore.SIGNAL("timeout()"), self._update)
 
+        # Connect the update signal once.  (Connecting on each update accumulates duplicate connections)
+        self._qt_main_widget.custom_signal.connect(self._update_time_domain)
+
         # TODO: Make _update_figure() method which syncs properties with UI objects
         #self._update_figure()
 
@@ -82,21 +92,23 @@ class SignalViewer(QtCore.QObject):
         # Called by timer object to update GUI
         if self._mode_select == 'Time Domain':
             # Need to update based on signal emit, once gui has started
-            self._qt_main_widget.custom_signal.connect(self._update_time_domain)
             self._qt_main_widget.custom_signal.emit()
 
     def _update_time_domain(self):
 
         # Get Data
         # TODO: Add getFilteredData method to signal source
-        channel_data = self._signal_source.get_data()
+        self._ring.update_from_source(self._signal_source)
+        if self._ring.data is None:
+            return
+        if self._view is None:
+            self._view = DecimatedView(self._window_size, self._ring.num_channels, self._max_points)
+        x, y = self._view.update(self._ring)
 
         # Plot data
         for i_channel in range(16):
-            if self._selected_channels[i_channel]:  # update curves if selected
-                signal = channel_data[:, i_channel]
-                sample_num = [x+1 for x in range(len(signal))]
-                self._qt_main_widget.curves[i_channel].setData(sample_num, signal)
+            if self._selected_channels[i_channel] and i_channel < y.shape[1]:  # update curves if selected
+                self._qt_main_widget.curves[i_channel].setData(x, y[:, i_channel])
             else:  # otherwise make invisible
                 self._qt_main_widget.curves[i_channel].setData([0], [0])
 
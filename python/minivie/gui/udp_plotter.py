@@ -16,7 +16,6 @@ import numpy as np
 import logging
 import socket
 import threading
-import struct
 import time
 
 # Ensure that the minivie specific modules can be found on path allowing execution from the 'inputs' folder
@@ -25,6 +24,8 @@ if os.path.split(os.getcwd())[1] == 'gui':
     import sys
     sys.path.insert(0, os.path.abspath('..'))
 import utilities
+from gui.signal_stream import SampleRing
+from utilities.stream_sockets import open_receive_socket
 
 
 logger = logging.getLogger(__name__)
@@ -44,11 +45,13 @@ class UdpReceiver():
         self.num_channels = 8
         self.num_samples = num_samples
 
-        # Default data buffer [nSamples by nChannels]
+        # Data ring buffer [nSamples by nChannels]
         # Treat as private.  use get_data to access since it is thread-safe
-        self.__data = np.zeros((num_samples, 8))
+        self.__ring = SampleRing(num_samples, 8)
 
-        # UDP Port setup
+        # UDP Port setup.  Use a multicast group or unix socket address from a stream broker (see
+        # inputs/stream_broker.py) to plot alongside the VIE
+        self.source = source
         self.addr = utilities.get_address(source)
 
         # Internal values
@@ -66,8 +69,7 @@ class UdpReceiver():
             Connect to the udp server and receive UDP Packets
         """
         logger.info("Setting up Udp socket {}".format(self.addr))
-        self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # Internet, UDP
-        self.__sock.bind(self.addr)
+        self.__sock = open_receive_socket(self.source)
         self.__sock.settimeout(3.0)
 
         # Create thread-safe lock so that user based reading of values and thread-based
@@ -110,10 +112,8 @@ class UdpReceiver():
                 # -------------------------------------
 
                 with self.__lock:
-                    output = struct.unpack('8f', data)
-                    # Populate EMG Data Buffer (newest on top)
-                    self.__data = np.roll(self.__data, 1, axis=0)
-                    self.__data[:1, :] = output[0:8]  # insert in first buffer entry
+                    # Populate data buffer
+                    self.__ring.append(np.frombuffer(data, np.float32).reshape(1, 8))
 
                     # compute data rate
                     if self.__packet_count == 0:
@@ -133,9 +133,9 @@ class UdpReceiver():
                 logger.warning('Udp: Unexpected packet size. len=({})'.format(len(data)))
 
     def get_data(self):
-        """ Return data buffer [nSamples][nChannels] """
+        """ Return data buffer [nSamples][nChannels], oldest first """
         with self.__lock:
-            return self.__data
+            return self.__ring.get_window()
 
     def get_data_rate_emg(self):
         # Return the emg data rate
@@ -169,10 +169,8 @@ fig.canvas.set_window_title('EMG Preview')
 
 
 def animate(i):
-    d = m.get_data() * 1 - 1.2
-
-    for iChannel in range(0, 8):
-        d[:, iChannel] = d[::-1, iChannel] + (1 * (iChannel + 1) )
+    # offset each channel for display
+    d = m.get_data() - 1.2 + np.arange(1, 9)
 
     ax1.clear()
     ax1.plot(d)
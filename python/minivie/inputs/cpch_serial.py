@@ -388,6 +388,7 @@ class CpchSerial(CpcHeadstage, SignalInput):
             self.__time_stream_reference = stream_loop_start_time - self.__stream_sleep_time  # Need to account for sleep time prior to start_time measured
 
         self.__valid_message_count += num_valid_samples
+        self.notify_samples(num_valid_samples)
         self.__valid_byte_count += num_valid_bytes
         self.__byte_count += num_bytes
         self.__byte_available_count += num_available
@@ -1,13 +1,101 @@
-import nidaqmx
+"""
+EMG input from a National Instruments DAQ
+
+Acquisition runs continuously from a single long lived task with a hardware timed sample clock.  Each read fills
+a preallocated [nChannels by nSamples] array, and the block is committed to the data buffer with one slice
+assignment.
+
+The hardware access is provided by a backend object so that the input can be run without a DAQ attached:
+
+    NidaqBackend - nidaqmx task (default)
+    SimulatedDaq - paced random samples for testing without hardware
+
+Usage:
+    src = DaqEMGDevice('Dev1/ai0:7')  # hardware
+    src = DaqEMGDevice('Dev1/ai0:7', backend=SimulatedDaq(sample_rate=1000))  # no hardware
+    src.connect()
+    data = src.get_data()  # [nSamples by nChannels], newest on top
+
+"""
 import numpy as np
 import threading
 import logging
 import time
 from inputs.signal_input import SignalInput
 
+logger = logging.getLogger(__name__)
+
+
+class NidaqBackend(object):
+    """
+    Continuous analog input from a single nidaqmx task
+
+    The task is created once on start() with a hardware timed sample clock and an onboard buffer, so that no
+    samples are lost between reads.
+    """
+    def __init__(self, device_channels, sample_rate=1000.0, buffer_seconds=1.0):
+        self.device_channels = device_channels
+        self.sample_rate = sample_rate
+        self.buffer_seconds = buffer_seconds
+        self.timeout = 1.0
+        self.task = None
+        self.reader = None
+
+    def start(self, num_channels):
+        import nidaqmx
+        from nidaqmx.constants import AcquisitionType
+        from nidaqmx.stream_readers import AnalogMultiChannelReader
+
+        self.task = nidaqmx.Task()
+        self.task.ai_channels.add_ai_voltage_chan(self.device_channels)
+        self.task.timing.cfg_samp_clk_timing(self.sample_rate, sample_mode=AcquisitionType.CONTINUOUS,
+                                             samps_per_chan=int(self.sample_rate * self.buffer_seconds))
+        self.reader = AnalogMultiChannelReader(self.task.in_stream)
+        self.task.start()
+
+    def read(self, out):
+        """ Block until out [nChannels by nSamples] has been filled.  Returns the number of samples read """
+        return self.reader.read_many_sample(out, number_of_samples_per_channel=out.shape[1], timeout=self.timeout)
+
+    def stop(self):
+        if self.task is not None:
+            self.task.stop()
+            self.task.close()
+            self.task = None
+
+
+class SimulatedDaq(object):
+    """
+    Stand-in for NidaqBackend that generates noise at the configured sample rate
+
+    Reads are paced against a running deadline so the long term rate matches a hardware clock.
+    """
+    def __init__(self, sample_rate=1000.0, amplitude=0.05, seed=None):
+        self.sample_rate = sample_rate
+        self.amplitude = amplitude
+        self.rng = np.random.default_rng(seed)
+        self.deadline = None
+
+    def start(self, num_channels):
+        self.deadline = time.perf_counter()
+
+    def read(self, out):
+        num_read = out.shape[1]
+        self.deadline += num_read / self.sample_rate
+        delay = self.deadline - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        self.rng.standard_normal(out=out)
+        out *= self.amplitude
+        return num_read
+
+    def stop(self):
+        pass
+
+
 class DaqEMGDevice(SignalInput):
 
-    def __init__(self, id, num_samples=50):
+    def __init__(self, id, num_samples=50, num_channels=8, samples_per_read=5, sample_rate=1000.0, backend=None):
 
         # Initialize superclass
         super(DaqEMGDevice, self).__init__()
@@ -16,15 +104,28 @@ class DaqEMGDevice(SignalInput):
         self.log_handlers = None
 
         # 8 channel max for myo armband
-        self.num_channels = 8
+        self.num_channels = num_channels
         self.num_samples = num_samples
+        self.samples_per_read = samples_per_read
 
         #device id
         self.id = id
 
-        # Default data buffer [nSamples by nChannels]
+        # Acquisition backend
+        if backend is None:
+            backend = NidaqBackend(id, sample_rate=sample_rate)
+        self.backend = backend
+
+        # Data buffer with room below the current window.  The window of num_samples (newest on top) starts at
+        # __start.  New blocks are written just above the window, and the window is moved back to the end of the
+        # buffer only when the reserve is used up
         # Treat as private.  use getData to access since it is thread-safe
-        self.__dataEMG = np.zeros((num_samples, 8))
+        self.__reserve = max(num_samples, samples_per_read) * 4
+        self.__buffer = np.zeros((self.__reserve + num_samples, num_channels))
+        self.__start = self.__reserve
+
+        # Preallocated read block [nChannels by nSamples] as required by the nidaqmx stream reader
+        self.__read_buffer = np.zeros((num_channels, samples_per_read))
 
         # Internal values
         self.__battery_level = -1  # initial value is unknown
@@ -35,6 +136,7 @@ class DaqEMGDevice(SignalInput):
         # Initialize connection parameters
         self.__lock = None
         self.__thread = None
+        self.__running = False
 
     def connect(self):
 
@@ -47,48 +149,71 @@ class DaqEMGDevice(SignalInput):
         # writing of values do not conflict
         self.__lock = threading.Lock()
 
+        self.backend.start(self.num_channels)
+        self.__running = True
+
         # Create a thread for processing new incoming data
         self.__thread = threading.Thread(target=self.read_packet)
         self.__thread.name = 'DaqEMGDeviceRcv'
         self.__thread.start()
 
     def read_packet(self):
-        while True:
-            with nidaqmx.Task() as task:
-                task.ai_channels.add_ai_voltage_chan(self.id)
-                data = task.read(number_of_samples_per_channel=5)
-                self.output = data
+        while self.__running:
+            try:
+                num_read = self.backend.read(self.__read_buffer)
+            except Exception as e:
+                logger.warning('DaqEMGDevice read failed: {}'.format(e))
+                time.sleep(0.1)
+                continue
 
             if self.log_handlers is not None:
-                self.log_handlers(self.output)
+                self.log_handlers(self.__read_buffer[:, :num_read])
+
+            # [nSamples by nChannels] view, oldest sample first
+            self.commit(self.__read_buffer[:, :num_read].T)
 
-            with self.__lock:
+    def commit(self, block):
+        """ Add a block of samples [nSamples by nChannels] (oldest first) to the data buffer """
+        num_new = block.shape[0]
+        if num_new == 0:
+            return
 
+        with self.__lock:
+            if num_new >= self.num_samples:
+                # Replace entire window
+                self.__start = self.__reserve
+                self.__buffer[self.__start:] = block[:-self.num_samples - 1:-1]
+            else:
+                if self.__start < num_new:
+                    # Out of reserve.  Move the samples that remain in the window to the end of the buffer
+                    keep = self.num_samples - num_new
+                    self.__buffer[-keep:] = self.__buffer[self.__start:self.__start + keep]
+                    self.__start = self.__buffer.shape[0] - keep
                 # Populate EMG Data Buffer (newest on top)
-                self.__dataEMG = np.roll(self.__dataEMG, len(self.output[0][:]), axis=0)
-                for i in range(len(self.output[0][:])):
-                    for s in range(len(self.output)):
-                        self.__dataEMG[i:i+1, s:s+1] = self.output[s][i:i+1]# insert into buffer entry
+                self.__start -= num_new
+                self.__buffer[self.__start:self.__start + num_new] = block[::-1]
+
+            # compute data rate
+            if self.__count_emg == 0:
+                # mark time
+                self.__time_emg = time.time()
 
-                # compute data rate
-                if self.__count_emg == 0:
-                    # mark time
-                    self.__time_emg = time.time()
+            self.__count_emg += num_new
 
-                self.__count_emg += 5  # 5 data points per packet
+            t_now = time.time()
+            t_elapsed = t_now - self.__time_emg
 
-                t_now = time.time()
-                t_elapsed = t_now - self.__time_emg
+            if t_elapsed > 3.0:
+                # compute rate (every second)
+                self.__rate_emg = self.__count_emg / t_elapsed
+                self.__count_emg = 0  # reset counter
 
-                if t_elapsed > 3.0:
-                    # compute rate (every second)
-                    self.__rate_emg = self.__count_emg / t_elapsed
-                    self.__count_emg = 0  # reset counter
+        self.notify_samples(num_new)
 
     def get_data(self):
         """ Return data buffer [nSamples][nChannels] """
         with self.__lock:
-            return self.__dataEMG
+            return self.__buffer[self.__start:self.__start + self.num_samples].copy()
 
     def get_angles(self):
         """ Return Euler angles computed from Myo quaternion """
@@ -131,8 +256,9 @@ class DaqEMGDevice(SignalInput):
 
     def close(self):
         """ Cleanup"""
-        logger.info("\n\nClosing DaqEMGDevice@ {}".format(self.addr))
-
+        logger.info("\n\nClosing DaqEMGDevice@ {}".format(self.id))
 
+        self.__running = False
         if self.__thread is not None:
-            self.__thread.join()
\ No newline at end of file
+            self.__thread.join()
+        self.backend.stop()
@@ -196,6 +196,7 @@ class DCellSerial(SignalInput):
                 with self.__lock:
                     self.__dataStrain = np.roll(self.__dataStrain, 1, axis=0)
                     self.__dataStrain[0] = data  # insert in first buffer entry
+                self.notify_samples(1)
                 self._log_data(data)
 
             # Update sleep time
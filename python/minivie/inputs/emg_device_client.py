@@ -151,8 +151,10 @@ class EmgSocket(SignalInput):
                             break
 
                         data = json.loads(msg)
-                        for sample in data['stream_batch']['raw_emg_batch']['samples']:
+                        samples = data['stream_batch']['raw_emg_batch']['samples']
+                        for sample in samples:
                             self.data_buffer.append(sample['raw_emg'])  # add data to internal buffer
+                        self.notify_samples(len(samples))
 
                         self.num_packets += 1  # count packets received
 
@@ -97,6 +97,11 @@ from inputs import myo
 myo.MyoUdp(source='//127.0.0.1:15001')
 myo.get_data()   # returns a numpy data buffer of size [nSamples][nChannels] of latest samples
 
+For bursty streams, batch_receive=True drains all pending datagrams on each wakeup and commits them
+to the buffer at once.  Datagrams per wakeup and latency are available from get_batch_metrics()
+
+myo.MyoUdp(source='//127.0.0.1:15001', batch_receive=True)
+
 
 
 
@@ -125,6 +130,7 @@ import os
 import platform
 import threading
 import socket
+import select
 import struct
 import numpy as np
 import subprocess
@@ -134,7 +140,7 @@ import binascii
 
 
 from transforms3d.euler import quat2euler
-from transforms3d.quaternions import quat2mat
+from utilities.orientation import OrientationCache
 
 # The following is only supported under linux (transmit mode)
 if platform.system() == 'Linux':
@@ -152,18 +158,16 @@ if os.path.split(os.getcwd())[1] == 'inputs':
     sys.path.insert(0, os.path.abspath('..'))
 import inputs
 from inputs.signal_input import SignalInput
+from inputs import myo_codec
 import utilities
+from utilities.shared_memory import ShmRing, get_shm_name
+from utilities.stream_sockets import open_receive_socket
 
 
 logger = logging.getLogger(__name__)
 
 __version__ = "2.0.0"
 
-# Scaling constants for MYO IMU Data
-MYOHW_ORIENTATION_SCALE = 16384.0
-MYOHW_ACCELEROMETER_SCALE = 2048.0
-MYOHW_GYROSCOPE_SCALE = 16.0
-
 
 def emulate_myo_udp_exe(destination='//127.0.0.1:10001'):
     """
@@ -192,25 +196,17 @@ def emulate_myo_udp_exe(destination='//127.0.0.1:10001'):
 
     """
 
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # UDP
+    from inputs.traffic_generator import TrafficGenerator, VirtualMyo
 
     print('Running MyoUdp.exe Emulator to ' + destination)
+    gen = TrafficGenerator([VirtualMyo(destination, packet_format='exe')])
+    gen.start()
     try:
-        while True:
-            # generate random bytes matching the size of MyoUdp.exe streaming
-            # Future: generate orientation data in valid range
-
-            # dtyp of randint is invalid in numpt 1.8, python 2.7:
-            # data = np.random.randint(255, size=48, dtype='i1')
-            # TypeError: randint() got an unexpected keyword argument 'dtype'
-
-            data = np.random.randint(255, size=48).astype('int8')
-            sock.sendto(data.tostring(), utilities.get_address(destination))
-            time.sleep(0.005)  # 200Hz
-    except KeyError:
+        gen.join()
+    except KeyboardInterrupt:
         pass
     print('Closing MyoUdp.exe Emulator')
-    sock.close()
+    gen.stop()
 
 
 def emulate_myo_unix(destination='//127.0.0.1:15001'):
@@ -232,56 +228,17 @@ def emulate_myo_unix(destination='//127.0.0.1:15001'):
 
     """
 
-    # Multicast Demo
-    # ANY = "0.0.0.0"
-    # SENDERPORT = 32000
-    # MCAST_ADDR = "239.255.1.1"
-    # MCAST_PORT = 1600
-    #
-    # sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
-    #                      socket.IPPROTO_UDP)
-    # sock.bind((ANY, SENDERPORT))
-    # sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 255)
-    # sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    #
-    # address = (MCAST_ADDR, MCAST_PORT)
-
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # UDP
-    address = utilities.get_address(destination)
-    counter = 0
-    print('Running MyoUdp.exe Emulator to ' + destination)
-    try:
-        while True:
-            counter += 1
-
-            # generate random bytes matching the size of MyoUdp.exe streaming
-            # Future: generate orientation data in valid range
-            vals = np.random.randint(255, size=16).astype('uint8')
-            sock.sendto(vals.tostring(), address)
-            vals = np.random.randint(255, size=16).astype('uint8')
-            sock.sendto(vals.tostring(), address)
-
-            # simulate a battery level
-            if counter > 500: # delay frequency of battery levels
-                # send battery levels
-                sock.sendto(bytes([98]), address)
-                counter = 0
-
-            # create synthetic orientation data
-            # rpy = np.random.rand(90, size=3)
-            # rpy = [30.0, 45.0, 15.0]
-            # q = [1.0, 0.0, 0.0, 0.0] * MYOHW_ORIENTATION_SCALE
-
-            # np.array(q, dtype=int16).tostring
-            vals = np.random.randint(255, size=20).astype('uint8')
-            sock.sendto(vals.tostring(), address)
+    from inputs.traffic_generator import TrafficGenerator, VirtualMyo
 
-            time.sleep(0.02)  # 200Hz
-
-    except KeyError:
+    print('Running Myo Emulator to ' + destination)
+    gen = TrafficGenerator([VirtualMyo(destination, packet_format='unix')])
+    gen.start()
+    try:
+        gen.join()
+    except KeyboardInterrupt:
         pass
     print('Closing Myo Emulator')
-    sock.close()
+    gen.stop()
 
 
 class MyoUdp(SignalInput):
@@ -295,7 +252,7 @@ class MyoUdp(SignalInput):
 
     """
 
-    def __init__(self, source='//127.0.0.1:10001', num_samples=50):
+    def __init__(self, source='//127.0.0.1:10001', num_samples=50, batch_receive=False):
 
         # Initialize superclass
         super(MyoUdp, self).__init__()
@@ -309,6 +266,7 @@ class MyoUdp(SignalInput):
 
         # Default kinematic values
         self.__quat = (1.0, 0.0, 0.0, 0.0)
+        self.__orientation = OrientationCache()
         self.__accel = (0.0, 0.0, 0.0)
         self.__gyro = (0.0, 0.0, 0.0)
 
@@ -316,8 +274,10 @@ class MyoUdp(SignalInput):
         # Treat as private.  use get_data to access since it is thread-safe
         self.__dataEMG = np.zeros((num_samples, 8))
 
-        # UDP Port setup
+        # UDP Port setup (or shared memory ring for shm://name addresses)
+        self.source = source
         self.addr = utilities.get_address(source)
+        self.shm_name = get_shm_name(source)
 
         # Internal values
         self.__battery_level = -1  # initial value is unknown
@@ -325,8 +285,13 @@ class MyoUdp(SignalInput):
         self.__time_emg = 0.0
         self.__rate_emg = 0.0
 
+        # Batch receive mode drains all pending datagrams per wakeup and commits them in one locked section
+        self.batch_receive = batch_receive
+        self.batch_stats = utilities.BatchStats()
+
         # Initialize connection parameters
         self.__sock = None
+        self.__ring = None
         self.__lock = None
         self.__thread = None
 
@@ -335,45 +300,38 @@ class MyoUdp(SignalInput):
             Connect to the udp server and receive Myo Packets
 
         """
+        if self.shm_name is not None:
+            # Local streaming server using shared memory transport
+            logger.info("Setting up MyoUdp shared memory ring {}".format(self.shm_name))
+            self.__ring = ShmRing(self.shm_name)
+            self.__ring.open()
+            self.__lock = threading.Lock()
+            self.__thread = threading.Thread(target=self.read_shm)
+            self.__thread.name = 'MyoShmRcv'
+            self.__thread.start()
+            return
+
         logger.info("Setting up MyoUdp socket {}".format(self.addr))
 
-        #
-        # Example of multicast variant below
-        #
-        # # Socket part
-        # ANY = "0.0.0.0"
-        # MCAST_ADDR = "239.255.1.1"
-        # MCAST_PORT = 1600
-        # # create a UDP socket
-        # sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-        # # allow multiple sockets to use the same PORT number
-        # sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        # # Bind to the port that we know will receive multicast data
-        # sock.bind((ANY, MCAST_PORT))
-        # # tell the kernel that we are a multicast socket
-        # sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 255)
-        # # Tell the kernel that we want to add ourselves to a multicast group
-        # # The address for the multicast group is the third param
-        # sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
-        #                 socket.inet_aton(MCAST_ADDR) + socket.inet_aton(ANY))
-        # self.__sock = sock
-
-        self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # Internet, UDP
-        # self.__sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.__sock.bind(self.addr)
-        self.__sock.settimeout(3.0)
+        # Udp unicast, multicast group (e.g. //239.255.1.1:15101 from a stream broker), or unix domain socket
+        self.__sock = open_receive_socket(self.source)
 
         # Create thread-safe lock so that user based reading of values and thread-based
         # writing of values do not conflict
         self.__lock = threading.Lock()
 
         # Create a thread for processing new incoming data
-        self.__thread = threading.Thread(target=self.read_packet)
+        if self.batch_receive:
+            self.__sock.setblocking(False)
+            self.__thread = threading.Thread(target=self.read_batch)
+        else:
+            self.__sock.settimeout(3.0)
+            self.__thread = threading.Thread(target=self.read_packet)
         self.__thread.name = 'MyoUdpRcv'
         self.__thread.start()
 
     def read_packet(self):
-        """ Convert incoming bytes to emg, quaternion, accel, and ang rate """
+        """ Receive packets from the udp socket """
 
         # Loop forever to receive data
         while True:
@@ -400,102 +358,130 @@ class MyoUdp(SignalInput):
                 logger.warning(msg)
                 return
 
-            if len(data) == 48:  # NOTE: This is the packet size for MyoUdp.exe
-                # -------------------------------
-                # Handles data from MyoUdp.exe
-                # -------------------------------
-                with self.__lock:
-                    # unpack formatted data bytes
-                    # Note: these have been scaled in MyoUdp from the raw hardware values
-                    output = struct.unpack("8b4f3f3f", data)
+            self.parse_packet(data)
 
-                    if self.log_handlers is not None:
-                        self.log_handlers(output[0:8])
+    def read_batch(self):
+        """ Receive udp packets, draining all pending datagrams on each wakeup """
+
+        stride = 64  # largest myo packet is 48 bytes
+        max_batch = 64
+        batch_buffer = bytearray(stride * max_batch)
+        batch_lengths = np.zeros(max_batch, dtype=int)
+        block = np.frombuffer(batch_buffer, dtype=np.uint8).reshape(max_batch, stride)
+
+        while True:
+            try:
+                # blocks until timeout or socket readable
+                readable, _, _ = select.select([self.__sock], [], [], 3.0)
+                t_wake = time.perf_counter()
+                count = utilities.recv_batch(self.__sock, batch_buffer, batch_lengths, stride) if readable else 0
+            except (OSError, ValueError):
+                # occurs on socket close
+                return
+
+            if not readable:
+                # the data stream has stopped.  don't break the thread, just continue to wait
+                msg = "MyoUdp timed out during select() on IP={} Port={}".format(self.addr[0], self.addr[1])
+                logger.warning(msg)
+                # data rate goes to zero
+                self.__count_emg = 0
+                self.__rate_emg = 0.0
+                continue
+
+            if count == 0:
+                continue
+
+            self.parse_batch(block[:count], batch_lengths[:count])
+            self.batch_stats.update(count, t_wake)
+
+    def parse_batch(self, block, lengths):
+        """
+        Decode a batch of packets and commit to the data buffer in a single locked section
+
+        :param block: uint8 array [nPackets][stride] with one packet per row
+        :param lengths: array of packet lengths for each row
+        """
+        self.update(myo_codec.decode_batch(block, lengths))
+
+    def update(self, packets):
+        """ Commit decoded packets (see inputs.myo_codec) to the data buffer in a single locked section """
+
+        num_new = 0
+        battery = None
+        with self.__lock:
+            for packet in packets:
+                if packet.emg is not None:
+                    if self.log_handlers is not None and packet.name == 'exe':
+                        for row in packet.emg:
+                            self.log_handlers(tuple(row.tolist()))
 
                     # Populate EMG Data Buffer (newest on top)
-                    self.__dataEMG = np.roll(self.__dataEMG, 1, axis=0)
-                    self.__dataEMG[:1, :] = output[:8]  # insert in first buffer entry
-
-                    # IMU Data Update
-                    self.__quat = output[8:12]
-                    self.__accel = output[12:15]
-                    self.__gyro = output[15:18]
-
-                    # compute data rate
-                    if self.__count_emg == 0:
-                        # mark time
-                        self.__time_emg = time.time()
-                    self.__count_emg += 1  # 2 data points per packet
-
-                    t_now = time.time()
-                    t_elapsed = t_now - self.__time_emg
-
-                    if t_elapsed > 3.0:
-                        # compute rate (every second)
-                        self.__rate_emg = self.__count_emg / t_elapsed
-                        self.__count_emg = 0  #reset counter
-
-            elif len(data) == 16:  # EMG data only
-                # -------------------------------------
-                # Handles data from unix direct stream
-                # -------------------------------------
-
-                #    Myo UNIX  Data packet information:
-                #    Data packet size either 16 or 20 bytes.
-                #        <case> 16
-                #            # EMG Samples (8 channels 2 samples per packet)
-                #            d = double(typecast(bytes,'int8'))
-                #            emgData = reshape(d,8,2)
-                #        <case> 20
-                #            # IMU sample
-                #            MYOHW_ORIENTATION_SCALE = 16384.0
-                #            MYOHW_ACCELEROMETER_SCALE = 2048.0
-                #            MYOHW_GYROSCOPE_SCALE = 16.0
-                #            dataInt16 = double(typecast(bytes,'int16'))
-                #            orientation = dataInt16(1:4) ./ MYOHW_ORIENTATION_SCALE
-                #            accelerometer = dataInt16(5:7) ./ MYOHW_ACCELEROMETER_SCALE
-                #            gyroscope = dataInt16(8:10) ./ MYOHW_GYROSCOPE_SCALE
-                with self.__lock:
-                    output = struct.unpack('16b', data)
-                    # Populate EMG Data Buffer (newest on top)
-                    self.__dataEMG = np.roll(self.__dataEMG, 1, axis=0)
-                    self.__dataEMG[:1, :] = output[0:8]  # insert in first buffer entry
-                    self.__dataEMG = np.roll(self.__dataEMG, 1, axis=0)
-                    self.__dataEMG[:1, :] = output[8:16]  # insert in first buffer entry
-
-                    # compute data rate
-                    if self.__count_emg == 0:
-                        # mark time
-                        self.__time_emg = time.time()
-                    self.__count_emg += 2  # 2 data points per packet
-
-                    t_now = time.time()
-                    t_elapsed = t_now - self.__time_emg
-
-                    if t_elapsed > 3.0:
-                        # compute rate (every second)
-                        self.__rate_emg = self.__count_emg / t_elapsed
-                        self.__count_emg = 0  #reset counter
-
-            elif len(data) == 20:  # IMU data only
-                with self.__lock:
-                    # create array of 10 int16
-                    output = struct.unpack('10h', data)
-                    unscaled = np.array(output, dtype=np.int16)
-
-                    self.__quat = np.array(unscaled[0:4], np.float) / MYOHW_ORIENTATION_SCALE
-                    self.__accel = np.array(unscaled[4:7], np.float) / MYOHW_ACCELEROMETER_SCALE
-                    self.__gyro = np.array(unscaled[7:10], np.float) / MYOHW_GYROSCOPE_SCALE
-
-            elif len(data) == 1:  # BATT Value
-                with self.__lock:
-                    self.__battery_level = ord(data)
-                msg = 'Socket {} Battery Level: {}'.format(self.addr, self.__battery_level)
-                logger.info(msg)
+                    self.__dataEMG = myo_codec.push_emg(self.__dataEMG, packet.emg)
+                    num_new += packet.emg.shape[0]
 
-            else:
-                # incoming data is not of length = 8, 20, 40, or 48
-                logger.warning('MyoUdp: Unexpected packet size. len=({})'.format(len(data)))
+                # IMU Data Update (latest sample)
+                if packet.quat is not None:
+                    self.__quat = packet.quat[-1]
+                    self.__accel = packet.accel[-1]
+                    self.__gyro = packet.gyro[-1]
+
+                if packet.battery is not None:
+                    battery = self.__battery_level = int(packet.battery[-1])
+
+            if num_new > 0:
+                # compute data rate
+                if self.__count_emg == 0:
+                    # mark time
+                    self.__time_emg = time.time()
+                self.__count_emg += num_new
+
+                t_now = time.time()
+                t_elapsed = t_now - self.__time_emg
+
+                if t_elapsed > 3.0:
+                    # compute rate (every second)
+                    self.__rate_emg = self.__count_emg / t_elapsed
+                    self.__count_emg = 0  # reset counter
+
+        if num_new > 0:
+            self.notify_samples(num_new)
+
+        if battery is not None:
+            logger.info('Socket {} Battery Level: {}'.format(self.addr, battery))
+
+    def get_batch_metrics(self):
+        """ Return batch receive metrics (datagrams per wakeup and wakeup to commit latency) """
+        return self.batch_stats.get_metrics()
+
+    def read_shm(self):
+        """ Receive packets from a local shared memory ring, draining all pending packets per wakeup """
+
+        ring = self.__ring
+        while True:
+            try:
+                # blocks until timeout or new packets written to ring
+                is_woken = ring.wait(3.0)
+                packets = ring.read_all() if is_woken else []
+            except (OSError, ValueError, TypeError):
+                # occurs when the ring is closed on exit
+                return
+
+            if not is_woken:
+                # the data stream has stopped.  don't break the thread, just continue to wait
+                msg = "MyoUdp timed out waiting for shared memory ring {}".format(self.shm_name)
+                logger.warning(msg)
+                # data rate goes to zero
+                self.__count_emg = 0
+                self.__rate_emg = 0.0
+                continue
+
+            self.update(myo_codec.decode_packets(packets))
+
+    def parse_packet(self, data):
+        """ Convert incoming bytes to emg, quaternion, accel, and ang rate """
+        packet = myo_codec.decode(data)
+        if packet is not None:
+            self.update((packet,))
 
     def get_data(self):
         """ Return data buffer [nSamples][nChannels] """
@@ -511,13 +497,8 @@ class MyoUdp(SignalInput):
     def get_rotationMatrix(self):
         """ Return rotation matrix computed from Myo quaternion"""
         with self.__lock:
-            rot_mat = quat2mat(self.__quat)
-            try:
-                [U, s, V] = np.linalg.svd(rot_mat)
-                return np.dot(U, V)
-            except:
-                return np.eye(3)
-
+            # only recomputed when a new imu sample has replaced the quaternion
+            return self.__orientation.get_rotation(self.__quat)
 
     def get_imu(self):
         """ Return IMU data as a dictionary 
@@ -553,6 +534,8 @@ class MyoUdp(SignalInput):
         logger.info("\n\nClosing MyoUdp Socket @ {}".format(self.addr))
         if self.__sock is not None:
             self.__sock.close()
+        if self.__ring is not None:
+            self.__ring.close()
         if self.__thread is not None:
             self.__thread.join()
 
@@ -121,25 +121,22 @@ contributor: W. Haris
 """
 
 from __future__ import with_statement  # 2.5 only
-import struct
 import numpy as np
 import logging
 import time
 from transforms3d.euler import quat2euler
-from transforms3d.quaternions import quat2mat
 from inputs.signal_input import SignalInput
+from inputs import myo_codec
+from utilities.orientation import OrientationCache
 import utilities
+from utilities.shared_memory import ShmRing, get_shm_name
+from utilities.stream_sockets import open_receive_socket
 import asyncio
 
 logger = logging.getLogger(__name__)
 
 __version__ = "3.0.0"
 
-# Scaling constants for MYO IMU Data
-MYOHW_ORIENTATION_SCALE = 16384.0
-MYOHW_ACCELEROMETER_SCALE = 2048.0
-MYOHW_GYROSCOPE_SCALE = 16.0
-
 
 class UdpProtocol(asyncio.DatagramProtocol):
     """ Extend the UDP Protocol for unity data communication
@@ -151,79 +148,9 @@ class UdpProtocol(asyncio.DatagramProtocol):
         self.parent.time_emg = time.time()
 
     def datagram_received(self, data, addr):
-
-        if len(data) == 48:  # NOTE: This is the packet size for MyoUdp.exe
-            # -------------------------------
-            # Handles data from MyoUdp.exe
-            # -------------------------------
-            # unpack formatted data bytes
-            # Note: these have been scaled in MyoUdp from the raw hardware values
-            output = struct.unpack("8b4f3f3f", data)
-
-            if self.parent.log_handlers is not None:
-                self.parent.log_handlers(output[0:8])
-
-            # Populate EMG Data Buffer (newest on top)
-            self.parent.dataEMG = np.roll(self.parent.dataEMG, 1, axis=0)
-            self.parent.dataEMG[:1, :] = output[:8]  # insert in first buffer entry
-
-            # IMU Data Update
-            self.parent.quat = output[8:12]
-            self.parent.accel = output[12:15]
-            self.parent.gyro = output[15:18]
-
-            # count samples toward data rate
-            self.parent.count_emg += 1  # 2 data points per packet
-
-        elif len(data) == 16:  # EMG data only
-            # -------------------------------------
-            # Handles data from unix direct stream
-            # -------------------------------------
-
-            #    Myo UNIX  Data packet information:
-            #    Data packet size either 16 or 20 bytes.
-            #        <case> 16
-            #            # EMG Samples (8 channels 2 samples per packet)
-            #            d = double(typecast(bytes,'int8'))
-            #            emgData = reshape(d,8,2)
-            #        <case> 20
-            #            # IMU sample
-            #            MYOHW_ORIENTATION_SCALE = 16384.0
-            #            MYOHW_ACCELEROMETER_SCALE = 2048.0
-            #            MYOHW_GYROSCOPE_SCALE = 16.0
-            #            dataInt16 = double(typecast(bytes,'int16'))
-            #            orientation = dataInt16(1:4) ./ MYOHW_ORIENTATION_SCALE
-            #            accelerometer = dataInt16(5:7) ./ MYOHW_ACCELEROMETER_SCALE
-            #            gyroscope = dataInt16(8:10) ./ MYOHW_GYROSCOPE_SCALE
-
-            output = struct.unpack('16b', data)
-            # Populate EMG Data Buffer (newest on top)
-            self.parent.dataEMG = np.roll(self.parent.dataEMG, 1, axis=0)
-            self.parent.dataEMG[:1, :] = output[0:8]  # insert in first buffer entry
-            self.parent.dataEMG = np.roll(self.parent.dataEMG, 1, axis=0)
-            self.parent.dataEMG[:1, :] = output[8:16]  # insert in first buffer entry
-
-            # count samples toward data data rate
-            self.parent.count_emg += 2  # 2 data points per packet
-
-        elif len(data) == 20:  # IMU data only
-
-            # create array of 10 int16
-            output = struct.unpack('10h', data)
-            unscaled = np.array(output, dtype=np.int16)
-
-            self.parent.quat = np.array(unscaled[0:4], np.float) / MYOHW_ORIENTATION_SCALE
-            self.parent.accel = np.array(unscaled[4:7], np.float) / MYOHW_ACCELEROMETER_SCALE
-            self.parent.gyro = np.array(unscaled[7:10], np.float) / MYOHW_GYROSCOPE_SCALE
-
-        elif len(data) == 1:  # Battery Value
-            self.parent.battery_level = ord(data)
-            msg = 'Socket {} Battery Level: {}'.format(self.parent.addr, self.parent.battery_level)
-            logger.info(msg)
-
-        else:
-            # incoming data is not of length = 8, 20, 40, or 48
-            logger.warning('MyoUdp: Unexpected packet size. len=({})'.format(len(data)))
+        packet = myo_codec.decode(data)
+        if packet is not None:
+            self.parent.update((packet,))
 
 
 class MyoUdp(SignalInput):
@@ -251,6 +178,7 @@ class MyoUdp(SignalInput):
 
         # Default kinematic values
         self.quat = (1.0, 0.0, 0.0, 0.0)
+        self.orientation = OrientationCache()
         self.accel = (0.0, 0.0, 0.0)
         self.gyro = (0.0, 0.0, 0.0)
 
@@ -258,8 +186,10 @@ class MyoUdp(SignalInput):
         # Treat as private.  use get_data to access since it is thread-safe
         self.dataEMG = np.zeros((num_samples, 8))
 
-        # UDP Port setup
+        # UDP Port setup (or shared memory ring for shm://name addresses)
         self.addr = utilities.get_address(source)
+        self.shm_name = get_shm_name(source)
+        self.ring = None
 
         # Internal values
         self.battery_level = -1  # initial value is unknown
@@ -280,14 +210,57 @@ class MyoUdp(SignalInput):
             Connect to the udp server and receive Myo Packets
 
         """
-        logger.info("Setting up MyoUdp socket {}".format(self.addr))
         self.loop = asyncio.get_event_loop()
 
+        if self.shm_name is not None:
+            # Local streaming server using shared memory transport.  The event loop watches the ring wakeup pipe
+            # and all pending packets are handed to the protocol in one callback
+            logger.info("Setting up MyoUdp shared memory ring {}".format(self.shm_name))
+            self.ring = ShmRing(self.shm_name)
+            self.ring.open()
+            self.protocol = UdpProtocol(parent=self)
+            self.loop.add_reader(self.ring.fileno(), self.read_shm)
+            return
+
+        # Udp unicast, multicast group (e.g. //239.255.1.1:15101 from a stream broker), or unix domain socket
+        logger.info("Setting up MyoUdp socket {}".format(self.local_address))
         listen = self.loop.create_datagram_endpoint(
-            lambda: UdpProtocol(parent=self), local_addr=self.addr)
+            lambda: UdpProtocol(parent=self), sock=open_receive_socket(self.local_address))
         self.transport, self.protocol = self.loop.run_until_complete(listen)
         pass
 
+    def read_shm(self):
+        """ Event loop callback to drain the shared memory ring """
+        self.update(myo_codec.decode_packets(self.ring.read_all()))
+
+    def update(self, packets):
+        """ Commit decoded packets (see inputs.myo_codec) to the data buffer """
+        num_new = 0
+        for packet in packets:
+            if packet.emg is not None:
+                if self.log_handlers is not None and packet.name == 'exe':
+                    for row in packet.emg:
+                        self.log_handlers(tuple(row.tolist()))
+
+                # Populate EMG Data Buffer (newest on top)
+                self.dataEMG = myo_codec.push_emg(self.dataEMG, packet.emg)
+                num_new += packet.emg.shape[0]
+
+            # IMU Data Update (latest sample)
+            if packet.quat is not None:
+                self.quat = packet.quat[-1]
+                self.accel = packet.accel[-1]
+                self.gyro = packet.gyro[-1]
+
+            if packet.battery is not None:
+                self.battery_level = int(packet.battery[-1])
+                logger.info('Socket {} Battery Level: {}'.format(self.addr, self.battery_level))
+
+        if num_new > 0:
+            # count samples toward data rate
+            self.count_emg += num_new
+            self.notify_samples(num_new)
+
     def get_data(self):
         """ Return data buffer [nSamples][nChannels] """
         return self.dataEMG
@@ -299,12 +272,8 @@ class MyoUdp(SignalInput):
 
     def get_rotationMatrix(self):
         """ Return rotation matrix computed from Myo quaternion"""
-        rot_mat = quat2mat(self.quat)
-        try:
-            [U, s, V] = np.linalg.svd(rot_mat)
-            return np.dot(U, V)
-        except:
-            return np.eye(3)
+        # only recomputed when a new imu sample has replaced the quaternion
+        return self.orientation.get_rotation(self.quat)
 
     def get_imu(self):
         """ Return IMU data as a dictionary
@@ -348,3 +317,7 @@ class MyoUdp(SignalInput):
     def close(self):
         """ Cleanup socket """
         logger.info("\n\nClosing MyoUdp Socket @ {}".format(self.addr))
+        if self.ring is not None:
+            self.loop.remove_reader(self.ring.fileno())
+            self.ring.close()
+            self.ring = None
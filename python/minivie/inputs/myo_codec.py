@@ -0,0 +1,162 @@
+"""
+Decoding of Myo armband data packets
+
+Packets from a myo_server or MyoUdp.exe are identified by their length:
+    48 bytes - MyoUdp.exe: 8 int8 emg channels, then float32 quaternion (4), accelerometer (3), gyroscope (3).
+               The IMU values have already been scaled by MyoUdp.exe
+    16 bytes - emg: 2 samples of 8 int8 channels
+    20 bytes - imu: int16 quaternion (4), accelerometer (3), gyroscope (3) in hardware units
+    1 byte   - battery level (0-100)
+
+Each packet type has a numpy dtype that is built once, and PACKET_TYPES maps packet length to its type, so decoding a
+packet is one dictionary lookup and one np.frombuffer.  A batch of packets is grouped by length and each group is
+decoded as a single structured array, so the cost of a batch does not grow with a per packet python loop.
+
+Decoded packets are Packet tuples of arrays with one row per sample (oldest first), or None for fields the packet
+type does not carry.  Values are little endian as sent by the armband and MyoUdp.exe
+
+Usage:
+    packet = decode(data)
+    if packet is not None and packet.emg is not None:
+        buffer = push_emg(buffer, packet.emg)
+
+    for packet in decode_batch(block, lengths):
+        ...
+
+"""
+
+import logging
+from abc import ABC, abstractmethod
+from collections import namedtuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Scaling constants for MYO IMU Data
+MYOHW_ORIENTATION_SCALE = 16384.0
+MYOHW_ACCELEROMETER_SCALE = 2048.0
+MYOHW_GYROSCOPE_SCALE = 16.0
+
+# Multiplier for each int16 value of an imu packet.  The scales are powers of 2 so this is exact
+IMU_SCALE = 1.0 / np.array([MYOHW_ORIENTATION_SCALE] * 4 + [MYOHW_ACCELEROMETER_SCALE] * 3 +
+                           [MYOHW_GYROSCOPE_SCALE] * 3)
+
+Packet = namedtuple('Packet', ['name', 'emg', 'quat', 'accel', 'gyro', 'battery'])
+
+
+class PacketType(ABC):
+    """ Layout of one packet type.  Subclasses convert a structured array of packets into a Packet """
+
+    name = ''
+    dtype = None
+
+    @property
+    def size(self):
+        return self.dtype.itemsize
+
+    @abstractmethod
+    def decode_records(self, records):
+        """ Convert a structured array of packets [nPackets] into a Packet """
+        pass
+
+    def decode(self, data):
+        """ Decode one packet """
+        return self.decode_records(np.frombuffer(data, self.dtype))
+
+    def decode_many(self, packets):
+        """ Decode a list of packets of this type """
+        return self.decode_records(np.frombuffer(b''.join(packets), self.dtype))
+
+    def decode_rows(self, rows):
+        """ Decode a uint8 array [nPackets][stride] with one packet of this type per row """
+        return self.decode_records(np.ascontiguousarray(rows[:, :self.size]).view(self.dtype)[:, 0])
+
+
+class ExePacket(PacketType):
+    name = 'exe'
+    dtype = np.dtype([('emg', 'i1', 8), ('quat', '<f4', 4), ('accel', '<f4', 3), ('gyro', '<f4', 3)])
+
+    def decode_records(self, records):
+        return Packet(self.name, records['emg'], records['quat'].astype(float), records['accel'].astype(float),
+                      records['gyro'].astype(float), None)
+
+
+class EmgPacket(PacketType):
+    name = 'emg'
+    dtype = np.dtype([('emg', 'i1', (2, 8))])
+
+    def decode_records(self, records):
+        return Packet(self.name, records['emg'].reshape(-1, 8), None, None, None, None)
+
+
+class ImuPacket(PacketType):
+    name = 'imu'
+    dtype = np.dtype([('quat', '<i2', 4), ('accel', '<i2', 3), ('gyro', '<i2', 3)])
+
+    def decode_records(self, records):
+        scaled = records.view('<i2').reshape(-1, 10) * IMU_SCALE
+        return Packet(self.name, None, scaled[:, 0:4], scaled[:, 4:7], scaled[:, 7:10], None)
+
+
+class BatteryPacket(PacketType):
+    name = 'battery'
+    dtype = np.dtype([('battery', 'u1')])
+
+    def decode_records(self, records):
+        return Packet(self.name, None, None, None, None, records['battery'])
+
+
+PACKET_TYPES = {t.size: t for t in (ExePacket(), EmgPacket(), ImuPacket(), BatteryPacket())}
+
+
+def decode(data):
+    """ Decode one packet.  Returns None if the packet length is not a known packet type """
+    packet_type = PACKET_TYPES.get(len(data))
+    if packet_type is None:
+        logger.warning('MyoUdp: Unexpected packet size. len=({})'.format(len(data)))
+        return None
+    return packet_type.decode(data)
+
+
+def decode_packets(packets):
+    """ Decode a list of packets (bytes) into one Packet per packet type, in order of first arrival """
+    groups = {}
+    for data in packets:
+        groups.setdefault(len(data), []).append(data)
+
+    decoded = []
+    for length, group in groups.items():
+        packet_type = PACKET_TYPES.get(length)
+        if packet_type is None:
+            logger.warning('MyoUdp: Unexpected packet size. len=({})'.format(length))
+            continue
+        decoded.append(packet_type.decode_many(group))
+    return decoded
+
+
+def decode_batch(block, lengths):
+    """
+    Decode a batch of received packets into one Packet per packet type, in order of first arrival
+
+    :param block: uint8 array [nPackets][stride] with one packet per row (see utilities.recv_batch)
+    :param lengths: array of packet lengths for each row
+    """
+    sizes, first = np.unique(lengths, return_index=True)
+
+    decoded = []
+    for length in sizes[np.argsort(first)]:
+        packet_type = PACKET_TYPES.get(int(length))
+        if packet_type is None:
+            logger.warning('MyoUdp: Unexpected packet size. len=({})'.format(length))
+            continue
+        decoded.append(packet_type.decode_rows(block[lengths == length]))
+    return decoded
+
+
+def push_emg(buffer, emg):
+    """ Return a new emg buffer [nSamples][nChannels] (newest on top) with emg samples (oldest first) added """
+    num_new = emg.shape[0]
+    num_samples = buffer.shape[0]
+    if num_new >= num_samples:
+        return emg[:-num_samples - 1:-1].astype(float)
+    return np.concatenate((emg[::-1], buffer[:-num_new]))
@@ -50,6 +50,15 @@ Start service and check status
 
     Aug 16 03:54:51 raspberrypi systemd[1]: Started Myo Streamer.
 
+Local shared memory streaming:
+
+When the server and the VIE run on the same board, the localhost udp link can be replaced by a shared memory ring
+(see utilities/shared_memory.py).  Set both the server remote address and the client local address to the same
+shm:// name in the user config file:
+
+    <add key="MyoUdpServer.remote_address_1"    value="shm://myo1"/>
+    <add key="MyoUdpClient.local_address_1"     value="shm://myo1"/>
+
 
 
 
@@ -71,6 +80,7 @@ if os.path.split(os.getcwd())[1] == 'inputs':
     sys.path.insert(0, os.path.abspath('..'))
 from utilities import user_config as uc
 from utilities import get_address
+from utilities.shared_memory import ShmRing, get_shm_name
 
 __version__ = "1.1.0"
 
@@ -81,7 +91,8 @@ class MyoUdpServer(object):
                  local_port=('localhost', 16001),
                  remote_port=('localhost', 15001),
                  data_logger=None,
-                 name='Myo'):
+                 name='Myo',
+                 shm_name=None):
         import threading
         import subprocess
 
@@ -90,13 +101,16 @@ class MyoUdpServer(object):
         self.mac_address = mac_address.upper()  # note this needs to be upper when finding handle to peripheral
         self.local_port = local_port
         self.remote_port = remote_port
+        # When a shared memory ring name is given, packets are written to the ring rather than sent via udp
+        self.shm_name = shm_name
+        self.destination = self.remote_port[1] if shm_name is None else shm_name
 
         # Setup file and console logging
         self.logger = data_logger
         self.logger.setLevel(logging.DEBUG)
         self.logger.propagate = 0
         fh = logging.FileHandler(
-            'EMG_MAC_{}_PORT_{}.log'.format(self.mac_address.replace(':', ''), self.remote_port[1]))
+            'EMG_MAC_{}_PORT_{}.log'.format(self.mac_address.replace(':', ''), self.destination))
         fh.setLevel(logging.DEBUG)
         ch = logging.StreamHandler()
         ch.setLevel(logging.WARNING)
@@ -108,7 +122,11 @@ class MyoUdpServer(object):
         # Create data object handles
         self.peripheral = None
         self.sock = None
-        send_udp = lambda data: self.sock.sendto(data, self.remote_port)
+        self.ring = None
+        if shm_name is None:
+            send_udp = lambda data: self.sock.sendto(data, self.remote_port)
+        else:
+            send_udp = lambda data: self.ring.write(data)
         self.delegate = MyoDelegate(send_udp, self.logger)
         self.thread = threading.Thread(target=self.run)
         self.thread.name = name
@@ -233,6 +251,11 @@ class MyoUdpServer(object):
         self.sock.setblocking(False)
         self.sock.bind(self.local_port)
 
+        # create local shared memory output
+        if self.shm_name is not None:
+            self.ring = ShmRing(self.shm_name)
+            self.ring.create()
+
         # Assign event handler
         self.peripheral.withDelegate(self.delegate)
 
@@ -255,8 +278,8 @@ class MyoUdpServer(object):
             if t_elapsed > status_msg_rate:
                 rate_myo = self.delegate.counter['emg'] / t_elapsed
                 rate_imu = self.delegate.counter['imu'] / t_elapsed
-                status = "MAC: %s Port: %d EMG: %4.1f Hz IMU: %4.1f Hz BattEvts: %d" % (
-                    self.mac_address, self.remote_port[1], rate_myo, rate_imu, self.delegate.counter['battery'])
+                status = "MAC: %s Port: %s EMG: %4.1f Hz IMU: %4.1f Hz BattEvts: %d" % (
+                    self.mac_address, self.destination, rate_myo, rate_imu, self.delegate.counter['battery'])
                 self.logger.info(status)
 
                 # reset timer and rate counters
@@ -299,6 +322,8 @@ class MyoUdpServer(object):
 
     def close(self):
         self.sock.close()
+        if self.ring is not None:
+            self.ring.close()
 
 
 class MyoDelegate(btle.DefaultDelegate):
@@ -348,23 +373,28 @@ class MyoDelegate(btle.DefaultDelegate):
 def setup_threads():
 
     # get parameters from xml files and create Servers
+    # Note remote addresses can be udp (//127.0.0.1:15001) or local shared memory (shm://myo1)
+    remote_address_1 = uc.get_user_config_var('MyoUdpServer.remote_address_1', '//127.0.0.1:15001')
     s1 = MyoUdpServer(iface=uc.get_user_config_var('MyoUdpServer.iface_1', 0),
                       mac_address=uc.get_user_config_var('MyoUdpServer.mac_address_1', 'xx:xx:xx:xx:xx'),
                       local_port=get_address(uc.get_user_config_var('MyoUdpServer.local_address_1', '//127.0.0.1:16001')),
-                      remote_port=get_address(uc.get_user_config_var('MyoUdpServer.remote_address_1', '//127.0.0.1:15001')),
+                      remote_port=get_address(remote_address_1),
                       data_logger=logging.getLogger('Myo1'),
-                      name='Myo1')
+                      name='Myo1',
+                      shm_name=get_shm_name(remote_address_1))
 
     if uc.get_user_config_var('MyoUdpServer.num_devices', 2) < 2:
         s2 = None
         return s1, s2
 
+    remote_address_2 = uc.get_user_config_var('MyoUdpServer.remote_address_2', '//127.0.0.1:15002')
     s2 = MyoUdpServer(iface=uc.get_user_config_var('MyoUdpServer.iface_2', 0),
                       mac_address=uc.get_user_config_var('MyoUdpServer.mac_address_2', 'xx:xx:xx:xx:xx'),
                       local_port=get_address(uc.get_user_config_var('MyoUdpServer.local_address_2', '//127.0.0.1:16002')),
-                      remote_port=get_address(uc.get_user_config_var('MyoUdpServer.remote_address_2', '//127.0.0.1:15002')),
+                      remote_port=get_address(remote_address_2),
                       data_logger=logging.getLogger('Myo2'),
-                      name='Myo2')
+                      name='Myo2',
+                      shm_name=get_shm_name(remote_address_2))
 
     return s1, s2
 
@@ -5,6 +5,39 @@ import time
 from abc import ABCMeta, abstractmethod
 
 
+def channel_shift_scores(reference, observed, num_channels):
+    """
+    Score every circular channel shift of observed features against reference features
+
+    Features are ordered [ch1f1, ch1f2, ... ch2f1, ch2f2, ... chNfM] as produced by FeatureExtract.  Shift k moves
+    the features of channel c to channel c + k (the same direction as the rotation applied to the raw signals).
+    All shifts are scored at once by indexing a circulant matrix of channel indices.  Each feature type is scaled
+    by its mean magnitude in the reference so that every feature contributes, not just the largest valued ones.
+
+    :param reference: feature vector [num_channels * num_features] (e.g. training class mean)
+    :param observed: feature vector [num_channels * num_features] (e.g. mean during normalization)
+    :param num_channels: number of channels in the vectors
+    :return: array [num_channels] of scores (mean absolute difference).  Lowest is the best match
+    """
+    reference = np.asarray(reference, dtype=float).reshape(num_channels, -1)
+    observed = np.asarray(observed, dtype=float).reshape(num_channels, -1)
+
+    scale = np.mean(np.abs(reference), axis=0)
+    scale[scale == 0] = 1.0
+
+    # circulant[k, c] is the observed channel that lands on channel c after a shift of k
+    channels = np.arange(num_channels)
+    circulant = (channels[None, :] - channels[:, None]) % num_channels
+    shifted = observed[circulant]  # [shift, channel, feature]
+
+    return np.mean(np.abs(shifted - reference) / scale, axis=(1, 2))
+
+
+def best_channel_shift(reference, observed, num_channels):
+    """ Return the circular channel shift of observed that best matches reference (see channel_shift_scores) """
+    return int(np.argmin(channel_shift_scores(reference, observed, num_channels)))
+
+
 class NormalizationInterface(object):
     __metaclass__ = ABCMeta
 
@@ -165,20 +198,12 @@ class MyoNormalization(NormalizationInterface):
 
         while time_elapsed < timeout:
 
-            features = []
             # get the features
             features_data = self.vie.output['features']
 
             if features_data is not None:
-                num_features = (len(features_data) / self.vie.TrainingData.num_channels)
-
-                for i, signal in enumerate(self.vie.SignalSource):
-                    front_index = int(i * (8 * num_features))
-                    back_index = int((i * (8 * num_features)) + (8 * num_features))
-                    features.append(features_data[front_index:back_index])
-
-                    # update data for output
-                    self.add_data(class_name, features)
+                # update data for output
+                self.add_data(class_name, features_data)
 
             # print status
             time_remaining = str(int(timeout - time_elapsed))
@@ -206,68 +231,37 @@ class MyoNormalization(NormalizationInterface):
         self.data[-1]['targetClass'].append(class_name)
         self.data[-1]['featureData'].append(features)
 
+    def get_channel_counts(self):
+        # Number of channels of each signal source, in feature vector order
+        return [signal.num_channels for signal in self.vie.SignalSource]
+
     def compute_normalization(self):
         # Method to compute normalization from collected features
         self.send_status('Computing Myo Position Normalization')
 
-        # load training data
-        training_data = self.vie.TrainingData.data
-        training_motion = self.vie.TrainingData.name
-
-        num_features = 0
-
-        training_features = []
-        # create array of training data for each myo
-        for myo, signal in enumerate(self.vie.SignalSource):
-            myo_features = []
-            for i, data in enumerate(training_data):
-                if training_motion[i] == self.normalized_motion:
-                    # get the features data from training data
-                    num_features = (len(data) / self.vie.TrainingData.num_channels)
-                    front_index = int(myo * (8 * num_features))
-                    back_index = int((myo * (8 * num_features)) + (8 * num_features))
-                    myo_features.append(data[front_index:back_index])
-            training_features.append(myo_features)
-
-        # average training data
-        averaged_training_features = []
-        for myo, data in enumerate(training_features):
-            averaged_training_features_one_myo = []
-            for i, sample in enumerate(data):
-                if len(averaged_training_features_one_myo) < 1:
-                    averaged_training_features_one_myo = sample
-                else:
-                    averaged_training_features_one_myo = (
-                        (np.array(averaged_training_features_one_myo) + np.array(sample)) / (i + 1)).tolist()
-            averaged_training_features.append(averaged_training_features_one_myo)
-
-        # average normalization feature data
-        averaged_normalization_features = []
-        for i, data in enumerate(self.data[-1]['featureData']):
-            for myo, sample in enumerate(data):
-                if len(averaged_normalization_features) < (myo + 1):
-                    averaged_normalization_features.append(sample)
-                else:
-                    averaged_normalization_features[myo] = (
-                        (np.array(averaged_normalization_features[myo]) + np.array(sample)) / (i + 1)).tolist()
+        # class mean of training data and of the features collected during normalization
+        training_data = np.asarray(self.vie.TrainingData.data, dtype=float)
+        is_motion = np.asarray(self.vie.TrainingData.name) == self.normalized_motion
+        if training_data.ndim != 2 or not is_motion.any() or not self.data[-1]['featureData']:
+            self.send_status('No Normalization Data ... Exiting Myo Normalization')
+            self.reset()
+            return
+        averaged_training_features = training_data[is_motion].mean(axis=0)
+        averaged_normalization_features = np.asarray(self.data[-1]['featureData'], dtype=float).mean(axis=0)
+
+        # features per channel
+        channel_counts = self.get_channel_counts()
+        num_features = averaged_training_features.size // sum(channel_counts)
 
+        # find the best rotation of each source over its own block of features
         self.normalized_orientation = []
-        for myo, normalization_data in enumerate(averaged_normalization_features):
-            best_diff = None
-            best_orientation = 0
-            for orientation in range(8):
-                # change orientation
-                rolled_normalization_data = np.roll(normalization_data, int(orientation*num_features))
-                myo_taining_features = averaged_training_features[myo]
-                # find differences between rolled average and training average of first feature
-                difference = sum(abs((np.array(myo_taining_features[:8]) - np.array(rolled_normalization_data[:8]))))
-                if best_diff is None:
-                    best_diff = difference
-                    best_orientation = orientation
-                elif difference < best_diff:
-                    best_diff = difference
-                    best_orientation = orientation
-            self.normalized_orientation.append(best_orientation)
+        start = 0
+        for num_channels in channel_counts:
+            stop = start + num_channels * num_features
+            self.normalized_orientation.append(best_channel_shift(averaged_training_features[start:stop],
+                                                                  averaged_normalization_features[start:stop],
+                                                                  num_channels))
+            start = stop
 
         self.send_status('Myo Position Normalization Computed: ' + str(self.normalized_orientation))
 
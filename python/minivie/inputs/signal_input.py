@@ -7,17 +7,34 @@ Will define minimum methods that must be overloaded
 for each child to maintain proper functionality with
 minivie.
 
+Inputs also maintain a running count of samples received.  Receiver code calls notify_samples() as each
+block of data is committed to the buffer, and asyncio consumers can await wait_for_samples(n) rather than
+polling get_data() on a fixed timer.  The arrival time of the latest block is stored with the count so that
+streams from several inputs can be aligned (see inputs.signal_merge).
+
 @author: Connor Pyles
 """
 
+import time
+import asyncio
 from abc import ABCMeta, abstractmethod
 
 
 class SignalInput(object):
     __metaclass__ = ABCMeta
 
+    # Class level defaults so that inputs whose __init__ does not reach SignalInput.__init__ still work
+    sample_count = 0
+    sample_stamp = (0, 0.0)
+    _sample_waiters = ()
+
     def __init__(self):
-        pass
+        # monotonically increasing count of samples received since creation
+        self.sample_count = 0
+        # (sample_count, time.perf_counter()) when the latest block was received
+        self.sample_stamp = (0, 0.0)
+        # list of [target_count, future] pending on wait_for_samples
+        self._sample_waiters = []
 
     # All methods with this decorator must be overloaded
     @abstractmethod
@@ -31,3 +48,71 @@ class SignalInput(object):
     @abstractmethod
     def close(self):
         pass
+
+    def get_sample_count(self):
+        """ Return the total number of samples received.  Unchanged count means no new data """
+        return self.sample_count
+
+    def get_sample_stamp(self):
+        """ Return (sample count, arrival time) of the latest block.  Time is from time.perf_counter() """
+        return self.sample_stamp
+
+    def notify_samples(self, num_new=1):
+        """
+        Advance the sample counter and wake any coroutines waiting on wait_for_samples()
+
+        Safe to call from a receiver thread or from the event loop thread
+        """
+        self.sample_count += num_new
+        # single tuple assignment so readers on other threads see a matching count and time
+        self.sample_stamp = (self.sample_count, time.perf_counter())
+        if not self._sample_waiters:
+            return
+
+        for waiter in list(self._sample_waiters):
+            target, future = waiter
+            if self.sample_count < target:
+                continue
+            try:
+                self._sample_waiters.remove(waiter)
+            except ValueError:
+                # already removed by another caller
+                continue
+            loop = future.get_loop()
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is loop:
+                _set_waiter_result(future, self.sample_count)
+            elif not loop.is_closed():
+                loop.call_soon_threadsafe(_set_waiter_result, future, self.sample_count)
+
+    async def wait_for_samples(self, n=1):
+        """
+        Wait until at least n new samples have been received.  Returns the updated sample count
+
+        Use with asyncio.wait_for() to bound the wait if the source may stall
+        """
+        target = self.sample_count + n
+        if not isinstance(self._sample_waiters, list):
+            self._sample_waiters = []
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = [target, future]
+        self._sample_waiters.append(waiter)
+        # samples may have arrived between reading the count and registering the waiter
+        if self.sample_count >= target:
+            _set_waiter_result(future, self.sample_count)
+        try:
+            return await future
+        finally:
+            try:
+                self._sample_waiters.remove(waiter)
+            except ValueError:
+                pass
+
+
+def _set_waiter_result(future, count):
+    if not future.done():
+        future.set_result(count)
@@ -0,0 +1,185 @@
+"""
+Merge stage for multiple signal inputs (e.g. two Myo armbands)
+
+Each input buffers its own samples and the buffers are read independently, so without alignment the windows from
+two armbands can be offset by several packets.  SignalMerge places every input on a common clock and resamples
+each one onto the same output sample times, producing one contiguous [nSamples by nTotalChannels] frame so that
+features are computed once over the combined matrix.
+
+    SampleClock - estimates the capture time of each sample of a stream from the (count, arrival time) stamps
+        recorded by SignalInput.notify_samples()
+    SignalMerge - aligns the inputs and fills a preallocated frame.  Alignment error and gap counts are reported
+
+Channel order of the merged frame is the order of the sources, so features match those from concatenating the
+per source feature vectors.
+
+Usage:
+    merge = SignalMerge([myo1, myo2], num_samples=50)
+    data = merge.get_data()  # [50 by 16], newest on top, common time base
+    print(merge.get_status_msg())
+
+"""
+
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SampleClock(object):
+    """
+    Map sample counts of one stream to capture times
+
+    The time of sample 0 (offset) is estimated from each arrival.  Transport delay only ever makes data late, so an
+    earlier estimate is taken immediately while later estimates are tracked slowly to follow clock drift.  An
+    arrival that is later than the clock by more than gap_threshold samples means samples were lost (or badly
+    delayed); the clock is reset to the new timeline and the gap is counted.
+    """
+
+    def __init__(self, rate=200.0, gap_threshold=4.0, alpha=0.02):
+        self.rate = rate
+        self.period = 1.0 / rate
+        self.gap_threshold = gap_threshold
+        self.alpha = alpha
+
+        self.offset = None  # capture time of sample count 0
+        self.last_count = None
+        self.num_gaps = 0
+        self.samples_missing = 0
+
+    def update(self, count, arrival_time):
+        """ Update the clock from a (sample count, arrival time) stamp.  Repeated stamps are ignored """
+        if count == 0 or count == self.last_count:
+            return
+        self.last_count = count
+
+        estimate = arrival_time - count * self.period
+        if self.offset is None or estimate < self.offset:
+            self.offset = estimate
+            return
+
+        late = (estimate - self.offset) * self.rate
+        if late > self.gap_threshold:
+            self.num_gaps += 1
+            self.samples_missing += int(round(late))
+            self.offset = estimate
+        else:
+            self.offset += self.alpha * (estimate - self.offset)
+
+    def time_of(self, count):
+        """ Capture time of a sample count """
+        return self.offset + count * self.period
+
+
+class SignalMerge(object):
+    """
+    Align several SignalInput objects and merge them into a single frame [num_samples by total channels]
+
+    Output rows are spaced at 1/rate seconds with row 0 at the newest time covered by every source.  Each source
+    is linearly interpolated onto those times.  Output rows that fall outside a source buffer hold the nearest
+    sample and are counted in num_held, so source buffers should be longer than num_samples by at least the
+    expected skew between sources.
+
+    :param sources: list of SignalInput objects
+    :param num_samples: number of rows in the merged frame
+    :param rate: output sample rate (Hz).  Also the source rate for sources without a sample_rate attribute
+    """
+
+    def __init__(self, sources, num_samples=50, rate=200.0, gap_threshold=4.0):
+        self.sources = sources
+        self.num_samples = num_samples
+        self.rate = rate
+
+        self.num_channels = sum(s.num_channels for s in sources)
+        self.channel_slices = []
+        start = 0
+        for s in sources:
+            self.channel_slices.append(slice(start, start + s.num_channels))
+            start += s.num_channels
+
+        self.clocks = [SampleClock(getattr(s, 'sample_rate', rate), gap_threshold) for s in sources]
+
+        # Preallocated output frame and per source work arrays
+        self.frame = np.zeros((num_samples, self.num_channels))
+        self.__rows = np.arange(num_samples, dtype=float)
+        self.__position = np.zeros(num_samples)
+        self.__index = np.zeros(num_samples, dtype=np.intp)
+        self.__index_next = np.zeros(num_samples, dtype=np.intp)
+        self.__weight = np.zeros((num_samples, 1))
+        self.__block = [np.zeros((num_samples, s.num_channels)) for s in sources]
+
+        # Alignment metrics
+        self.alignment_error = 0.0  # seconds between the newest samples of the sources on the last merge
+        self.max_alignment_error = 0.0
+        self.num_held = 0  # output samples that could not be interpolated from a source buffer
+        self.num_merged = 0  # number of frames merged
+
+    def get_data(self):
+        """
+        Return the merged frame [num_samples by total channels], newest on top
+
+        The frame is preallocated and overwritten on the next call
+        """
+        stamps = [s.get_sample_stamp() for s in self.sources]
+        for clock, (count, arrival_time) in zip(self.clocks, stamps):
+            clock.update(count, arrival_time)
+
+        if any(c.offset is None for c in self.clocks):
+            # No timing yet for at least one source.  Merge the raw windows
+            for s, sl in zip(self.sources, self.channel_slices):
+                self.frame[:, sl] = s.get_data()[:self.num_samples]
+            return self.frame
+
+        newest = [c.time_of(count) for c, (count, _) in zip(self.clocks, stamps)]
+        time_ref = min(newest)
+        self.alignment_error = max(newest) - time_ref
+        self.max_alignment_error = max(self.max_alignment_error, self.alignment_error)
+
+        pos = self.__position
+        idx = self.__index
+        idx_next = self.__index_next
+        w = self.__weight[:, 0]
+
+        for i, (s, sl, clock) in enumerate(zip(self.sources, self.channel_slices, self.clocks)):
+            data = s.get_data()
+            last = data.shape[0] - 1
+
+            # fractional row in the source buffer (row 0 newest) of each output sample time
+            np.multiply(self.__rows, clock.rate / self.rate, out=pos)
+            pos += (newest[i] - time_ref) * clock.rate
+            self.num_held += int(np.count_nonzero(pos > last))
+            np.clip(pos, 0, last, out=pos)
+
+            np.floor(pos, out=w)
+            idx[:] = w
+            np.subtract(pos, w, out=w)
+            np.add(idx, 1, out=idx_next)
+            np.minimum(idx_next, last, out=idx_next)
+
+            # linear interpolation between neighboring rows
+            block = self.__block[i]
+            out = self.frame[:, sl]
+            np.take(data, idx_next, axis=0, out=block)
+            np.take(data, idx, axis=0, out=out)
+            block -= out
+            block *= self.__weight
+            out += block
+
+        self.num_merged += 1
+        return self.frame
+
+    def get_status(self):
+        """ Return alignment and gap metrics as a dictionary """
+        return {
+            'alignment_error': self.alignment_error,
+            'max_alignment_error': self.max_alignment_error,
+            'num_gaps': [c.num_gaps for c in self.clocks],
+            'samples_missing': [c.samples_missing for c in self.clocks],
+            'num_held': self.num_held,
+            'num_merged': self.num_merged,
+        }
+
+    def get_status_msg(self):
+        # E.g. Sync: 2.5ms Gaps: 0/1
+        return 'Sync: {:.1f}ms Gaps: {}'.format(self.alignment_error * 1000,
+                                                '/'.join(str(c.num_gaps) for c in self.clocks))
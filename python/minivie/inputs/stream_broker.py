@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Local stream broker for armband data
+
+A myo_server sends each armband stream to one udp address.  The broker receives that stream once and forwards every
+packet to any number of subscribers, so the VIE, a plotter, and a recorder can all use the same armband at once.
+
+Subscriber addresses (see utilities/stream_sockets.py):
+    //239.255.1.1:15101 - udp multicast group.  Any number of local receivers can join without changing the broker
+    //127.0.0.1:15201 - udp unicast
+    unix:///tmp/myo1_plot.sock - unix domain datagram socket
+
+Add ?decimation=N to an address to forward only every Nth packet of each packet size (e.g. to a plotter).  EMG and IMU
+packets are counted separately so both are thinned evenly.
+
+Packets are never queued for a subscriber.  A subscriber that is not keeping up (send buffer full) has packets
+dropped so that it always receives the newest data, and a subscriber that is not running (connection refused or
+missing socket file) is skipped for retry_interval seconds before trying again.  Neither slows the other subscribers.
+
+Usage:
+    Point the myo_server remote address at the broker source, then set the client local addresses (e.g.
+    MyoUdpClient.local_address_1) to a subscriber address.  From the minivie folder:
+
+    python -m inputs.stream_broker -x user_config.xml
+
+    <add key="StreamBroker.num_streams"     value="1"/>
+    <add key="StreamBroker.source_1"        value="//0.0.0.0:15001"/>
+    <add key="StreamBroker.subscribers_1"   value="//239.255.1.1:15101, unix:///tmp/myo1_plot.sock?decimation=4"/>
+
+"""
+
+import os
+import asyncio
+import logging
+import time
+from urllib.parse import urlparse, parse_qs
+
+# Ensure that the project modules can be found on path allowing execution from the 'inputs' folder
+if os.path.split(os.getcwd())[1] == 'inputs':
+    import sys
+    sys.path.insert(0, os.path.abspath('..'))
+from utilities import user_config as uc
+from utilities.stream_sockets import open_receive_socket, open_send_socket, get_destination
+
+logger = logging.getLogger(__name__)
+
+
+def get_decimation(url):
+    """ Return the decimation of a subscriber address, e.g. unix:///tmp/plot.sock?decimation=4 is 4 """
+    value = parse_qs(urlparse(url).query).get('decimation', ['1'])[0]
+    return max(int(value), 1)
+
+
+class Subscriber(object):
+    """ One destination of a stream with its own decimation and drop counters """
+
+    def __init__(self, address, decimation=None, retry_interval=1.0):
+        self.address = address
+        self.destination = get_destination(address)
+        self.decimation = get_decimation(address) if decimation is None else decimation
+        self.retry_interval = retry_interval
+        self.sock = open_send_socket(address)
+
+        self.counters = {}  # packet length: packets seen
+        self.sent = 0
+        self.dropped = 0
+        self.retry_time = 0.0
+
+    def send(self, data):
+        # Forward every decimation-th packet of each size.  Returns without waiting if the packet can't be sent
+        count = self.counters.get(len(data), 0)
+        self.counters[len(data)] = count + 1
+        if count % self.decimation:
+            return
+
+        if self.retry_time:
+            if time.monotonic() < self.retry_time:
+                self.dropped += 1
+                return
+            self.retry_time = 0.0
+
+        try:
+            self.sock.sendto(data, self.destination)
+            self.sent += 1
+        except BlockingIOError:
+            # Subscriber is not keeping up.  Drop rather than queue so it gets the newest data when it catches up
+            self.dropped += 1
+        except (ConnectionRefusedError, FileNotFoundError):
+            # Nothing is receiving at this address.  Skip it for a while
+            logger.info('No receiver at {}.  Retry in {} s'.format(self.address, self.retry_interval))
+            self.dropped += 1
+            self.retry_time = time.monotonic() + self.retry_interval
+        except OSError as e:
+            logger.warning('Send to {} failed: {}'.format(self.address, e))
+            self.dropped += 1
+
+    def get_status_msg(self):
+        return '{} sent:{} dropped:{}'.format(self.address, self.sent, self.dropped)
+
+    def close(self):
+        self.sock.close()
+
+
+class BrokerProtocol(asyncio.DatagramProtocol):
+    """ Pass each packet received from the source to the broker """
+    def __init__(self, parent):
+        self.parent = parent
+
+    def datagram_received(self, data, addr):
+        self.parent.publish(data)
+
+
+class StreamBroker(object):
+    """ Receive one stream and forward each packet to every subscriber """
+
+    def __init__(self, source='//0.0.0.0:15001', subscribers=()):
+        self.source = source
+        self.subscribers = []
+        for address in subscribers:
+            self.subscribe(address)
+
+        self.loop = None
+        self.transport = None
+        self.protocol = None
+        self.count = 0
+
+    def subscribe(self, address, decimation=None):
+        """ Add a subscriber address and return the Subscriber """
+        subscriber = Subscriber(address, decimation)
+        self.subscribers.append(subscriber)
+        logger.info('Stream {} subscriber {} decimation {}'.format(self.source, address, subscriber.decimation))
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.remove(subscriber)
+        subscriber.close()
+
+    def connect(self):
+        """ Bind the source address and start forwarding """
+        logger.info('Setting up stream broker source {}'.format(self.source))
+        self.loop = asyncio.get_event_loop()
+        listen = self.loop.create_datagram_endpoint(
+            lambda: BrokerProtocol(parent=self), sock=open_receive_socket(self.source))
+        self.transport, self.protocol = self.loop.run_until_complete(listen)
+
+    def publish(self, data):
+        self.count += 1
+        for subscriber in self.subscribers:
+            subscriber.send(data)
+
+    def get_status_msg(self):
+        return 'Source: {} Received: {} '.format(self.source, self.count) + \
+               ' '.join([s.get_status_msg() for s in self.subscribers])
+
+    def close(self):
+        logger.info('Closing stream broker source {}'.format(self.source))
+        if self.transport is not None:
+            self.transport.close()
+        for subscriber in self.subscribers:
+            subscriber.close()
+
+
+def setup_brokers():
+    # get parameters from xml files and create one broker per stream
+    brokers = []
+    for i in range(1, uc.get_user_config_var('StreamBroker.num_streams', 1) + 1):
+        source = uc.get_user_config_var('StreamBroker.source_{}'.format(i), '//0.0.0.0:1500{}'.format(i))
+        subscribers = uc.get_user_config_var('StreamBroker.subscribers_{}'.format(i), '')
+        brokers.append(StreamBroker(source, [s.strip() for s in subscribers.split(',') if s.strip()]))
+    return brokers
+
+
+async def log_status(brokers, rate=5.0):
+    while True:
+        await asyncio.sleep(rate)
+        for broker in brokers:
+            logger.info(broker.get_status_msg())
+
+
+def main():
+    """Parse command line arguments into argparse model.
+
+    Command-line arguments:
+    -h or --help -- output help text describing command-line arguments.
+
+    """
+    import argparse
+
+    # Parameters:
+    parser = argparse.ArgumentParser(description='stream_broker: forward armband streams to multiple subscribers.')
+    parser.add_argument('-x', '--XML', help=r'XML Parameter File (e.g. user_config.xml)',
+                        default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.XML is not None:
+        uc.read_user_config_file(file=args.XML)
+
+    brokers = setup_brokers()
+    for broker in brokers:
+        broker.connect()
+
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(log_status(brokers))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for broker in brokers:
+            broker.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Deterministic EMG / IMU traffic generator for testing and load testing without armband hardware
+
+Any number of virtual Myo armbands stream packets in the same formats as the armband server (inputs/myo.py -tx):
+
+    'unix' format: 16 byte EMG packets (2 samples of 8 int8 channels) at 100 packets/s (200Hz EMG),
+                   20 byte IMU packets (10 int16: quaternion, accelerometer, gyroscope) at 50Hz,
+                   1 byte battery level every 10 seconds
+    'exe' format:  48 byte MyoUdp.exe packets (8 int8 EMG, 10 float IMU) at 200Hz
+
+Payloads are generated from a seeded model so that every run is reproducible:
+
+    EMG - zero mean noise shaped by a per channel envelope.  Each motion class has its own pattern of channel
+          activity (a bump around a class specific electrode) and the envelope moves smoothly between classes
+    IMU - a slowly wandering rotation integrated from a random walk of angular rate, so quaternions are always
+          unit length, and accelerometer / gyroscope values are consistent with the motion
+
+A ClassSchedule switches the commanded class over time so that classifier accuracy and pipeline throughput can be
+measured against a known ground truth.  All devices are paced from a single deadline so the long term rate is
+exact; if the sender falls behind, the packets that are due are sent together on the next tick.
+
+Usage:
+    # 2 armbands on ports 15001 and 15002, cycling through 3 classes for 2 seconds each
+    python -m inputs.traffic_generator --NUM_DEVICES 2 --ADDRESS //127.0.0.1:15001 --SCHEDULE 0:2,7:2,17:2
+
+    # from python
+    gen = TrafficGenerator([VirtualMyo('//127.0.0.1:15001', seed=1)], ClassSchedule([(0, 2.0), (7, 2.0)]))
+    gen.start()
+    ...
+    gen.stop()
+
+"""
+
+import os
+import time
+import socket
+import struct
+import logging
+import threading
+import numpy as np
+
+# Ensure that the minivie specific modules can be found on path allowing execution from the 'inputs' folder
+if os.path.split(os.getcwd())[1] == 'inputs':
+    import sys
+    sys.path.insert(0, os.path.abspath('..'))
+import utilities
+from utilities.shared_memory import ShmRing, get_shm_name
+
+logger = logging.getLogger(__name__)
+
+# Scaling constants for MYO IMU Data (see inputs.myo)
+MYOHW_ORIENTATION_SCALE = 16384.0
+MYOHW_ACCELEROMETER_SCALE = 2048.0
+MYOHW_GYROSCOPE_SCALE = 16.0
+
+EMG_RATE = 200.0  # Hz
+IMU_RATE = 50.0  # Hz
+BATTERY_PERIOD = 10.0  # seconds
+
+_EXE_PACKET = struct.Struct('8b4f3f3f')
+
+
+class EmgModel(object):
+    """
+    Class dependent EMG envelope model for one armband
+
+    Each class id has a fixed pattern of channel amplitudes derived from the seed and class id, so a class looks
+    the same from run to run.  Class 0 (e.g. 'No Movement') is baseline activity only
+    """
+
+    def __init__(self, num_channels=8, seed=0, baseline=3.0, gain=45.0, time_constant=0.08):
+        self.num_channels = num_channels
+        self.seed = seed
+        self.baseline = baseline
+        self.gain = gain
+        self.alpha = 1.0 - np.exp(-1.0 / (EMG_RATE * time_constant))  # envelope smoothing per sample
+        self.rng = np.random.default_rng(seed)
+        self.patterns = {}
+        self.envelope = np.full(num_channels, baseline)
+
+    def get_pattern(self, class_id):
+        """ Return the channel amplitudes [num_channels] of a class """
+        if class_id not in self.patterns:
+            if class_id == 0:
+                pattern = np.full(self.num_channels, self.baseline)
+            else:
+                rng = np.random.default_rng((self.seed, class_id))
+                center = rng.uniform(0, self.num_channels)
+                width = rng.uniform(0.8, 2.0)
+                strength = rng.uniform(0.5, 1.0)
+                # circular distance from the class center electrode
+                distance = np.abs((np.arange(self.num_channels) - center + self.num_channels / 2)
+                                  % self.num_channels - self.num_channels / 2)
+                pattern = self.baseline + self.gain * strength * np.exp(-0.5 * (distance / width) ** 2)
+            self.patterns[class_id] = pattern
+        return self.patterns[class_id]
+
+    def generate(self, class_id, num_samples, out=None):
+        """ Generate num_samples [num_samples by num_channels] of int8 EMG for a class """
+        if out is None:
+            out = np.empty((num_samples, self.num_channels), dtype=np.int8)
+        target = self.get_pattern(class_id)
+        samples = self.rng.standard_normal((num_samples, self.num_channels))
+        for i in range(num_samples):
+            self.envelope += self.alpha * (target - self.envelope)
+            samples[i] *= self.envelope
+        np.clip(np.rint(samples), -128, 127, out=samples)
+        out[:] = samples
+        return out
+
+
+class ImuModel(object):
+    """ Smoothly wandering orientation with matching accelerometer and gyroscope values """
+
+    def __init__(self, seed=0, max_rate=1.0, wander=0.5):
+        self.rng = np.random.default_rng((seed, 1))
+        self.max_rate = max_rate  # rad/s
+        self.wander = wander  # rad/s^2 (random walk of angular rate)
+        self.quat = np.array([1.0, 0.0, 0.0, 0.0])
+        self.omega = np.zeros(3)  # angular rate, rad/s (sensor frame)
+
+    def step(self, dt):
+        """ Advance by dt seconds and return (quat, accel in g, gyro in deg/s) """
+        self.omega += self.rng.normal(0.0, self.wander * np.sqrt(dt), 3)
+        np.clip(self.omega, -self.max_rate, self.max_rate, out=self.omega)
+
+        # integrate rotation: q = q * dq
+        angle = np.linalg.norm(self.omega) * dt
+        if angle > 0:
+            axis = self.omega / np.linalg.norm(self.omega)
+            w0, x0, y0, z0 = self.quat
+            w1 = np.cos(angle / 2)
+            x1, y1, z1 = axis * np.sin(angle / 2)
+            self.quat = np.array([w0 * w1 - x0 * x1 - y0 * y1 - z0 * z1,
+                                  w0 * x1 + x0 * w1 + y0 * z1 - z0 * y1,
+                                  w0 * y1 - x0 * z1 + y0 * w1 + z0 * x1,
+                                  w0 * z1 + x0 * y1 - y0 * x1 + z0 * w1])
+            self.quat /= np.linalg.norm(self.quat)
+
+        # gravity (world z) expressed in the sensor frame: R' * [0 0 1]
+        w, x, y, z = self.quat
+        accel = np.array([2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)])
+        return self.quat, accel, np.rad2deg(self.omega)
+
+
+class VirtualMyo(object):
+    """
+    One virtual armband.  Produces the packets due at each tick and sends them to its address
+
+    :param destination: udp (//host:port) or shared memory (shm://name) address
+    :param packet_format: 'unix' (armband server) or 'exe' (MyoUdp.exe)
+    """
+
+    def __init__(self, destination='//127.0.0.1:15001', seed=0, packet_format='unix', battery=98):
+        self.destination = destination
+        self.packet_format = packet_format
+        self.battery = battery
+        self.emg = EmgModel(seed=seed)
+        self.imu = ImuModel(seed=seed)
+
+        self.shm_name = get_shm_name(destination)
+        self.address = None if self.shm_name is not None else utilities.get_address(destination)
+        self.sock = None
+        self.ring = None
+
+        self.emg_count = 0  # EMG samples generated
+        self.imu_count = 0
+        self.packets_sent = 0
+        self.__emg_block = np.zeros((2, 8), dtype=np.int8)
+        self.__imu_block = np.zeros(10, dtype=np.int16)
+
+    def connect(self):
+        if self.shm_name is not None:
+            self.ring = ShmRing(self.shm_name)
+            self.ring.create()
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def close(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def packets_until(self, t, class_id):
+        """ Return the list of packets due up to stream time t (seconds since start) """
+        packets = []
+        if self.packet_format == 'exe':
+            while self.emg_count < t * EMG_RATE:
+                emg = self.emg.generate(class_id, 1, out=self.__emg_block[:1])[0]
+                quat, accel, gyro = self.imu.step(1.0 / EMG_RATE)
+                packets.append(_EXE_PACKET.pack(*emg.tolist(), *quat, *accel, *gyro))
+                self.emg_count += 1
+            return packets
+
+        while self.emg_count < t * EMG_RATE:
+            packets.append(self.emg.generate(class_id, 2, out=self.__emg_block).tobytes())
+            self.emg_count += 2
+        while self.imu_count < t * IMU_RATE:
+            quat, accel, gyro = self.imu.step(1.0 / IMU_RATE)
+            imu = self.__imu_block
+            imu[0:4] = np.rint(quat * MYOHW_ORIENTATION_SCALE)
+            imu[4:7] = np.rint(np.clip(accel * MYOHW_ACCELEROMETER_SCALE, -32768, 32767))
+            imu[7:10] = np.rint(np.clip(gyro * MYOHW_GYROSCOPE_SCALE, -32768, 32767))
+            packets.append(imu.tobytes())
+            if self.imu_count % int(IMU_RATE * BATTERY_PERIOD) == 0:
+                packets.append(bytes([self.battery]))
+            self.imu_count += 1
+        return packets
+
+    def send(self, packets):
+        for data in packets:
+            if self.ring is not None:
+                self.ring.write(data)
+            else:
+                self.sock.sendto(data, self.address)
+        self.packets_sent += len(packets)
+
+
+class ClassSchedule(object):
+    """
+    Sequence of (class_id, duration in seconds) that repeats.  class_at(t) gives the ground truth class at time t
+    """
+
+    def __init__(self, steps=((0, 1.0),)):
+        self.class_ids = [int(c) for c, _ in steps]
+        self.ends = np.cumsum([float(d) for _, d in steps])
+        self.period = self.ends[-1]
+
+    def class_at(self, t):
+        index = int(np.searchsorted(self.ends, t % self.period, side='right'))
+        return self.class_ids[min(index, len(self.class_ids) - 1)]
+
+    @classmethod
+    def parse(cls, text):
+        """ Create from text 'id:seconds,id:seconds,...' (e.g. '0:2,7:2') """
+        return cls([step.split(':') for step in text.split(',')])
+
+
+class TrafficGenerator(object):
+    """
+    Send traffic from a list of VirtualMyo devices in a background thread
+
+    Ticks are scheduled on a fixed deadline (tick_rate Hz).  At each tick every device sends all packets that are
+    due, so a late tick is caught up in one batch rather than drifting the stream rate.
+    """
+
+    def __init__(self, devices, schedule=None, tick_rate=100.0):
+        self.devices = devices
+        self.schedule = schedule if schedule is not None else ClassSchedule()
+        self.tick_rate = tick_rate
+
+        self.thread = None
+        self.running = False
+        self.time_start = None
+        self.num_ticks = 0
+        self.num_late = 0  # ticks that started more than one tick period late
+        self.max_lateness = 0.0
+
+    def start(self, duration=None):
+        for d in self.devices:
+            d.connect()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, args=(duration,), name='TrafficGenerator', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        for d in self.devices:
+            d.close()
+
+    def join(self):
+        if self.thread is not None:
+            self.thread.join()
+
+    def current_class(self):
+        """ Ground truth class at the current time """
+        if self.time_start is None:
+            return self.schedule.class_at(0.0)
+        return self.schedule.class_at(time.perf_counter() - self.time_start)
+
+    def run(self, duration=None):
+        period = 1.0 / self.tick_rate
+        self.time_start = time.perf_counter()
+        deadline = self.time_start
+        while self.running:
+            deadline += period
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif -delay > period:
+                self.num_late += 1
+                self.max_lateness = max(self.max_lateness, -delay)
+
+            t = min(deadline - self.time_start, duration) if duration is not None else deadline - self.time_start
+            class_id = self.schedule.class_at(t)
+            for d in self.devices:
+                d.send(d.packets_until(t, class_id))
+            self.num_ticks += 1
+
+            if duration is not None and t >= duration:
+                break
+        self.running = False
+
+    def get_stats(self):
+        return {
+            'packets_sent': [d.packets_sent for d in self.devices],
+            'emg_samples': [d.emg_count for d in self.devices],
+            'num_ticks': self.num_ticks,
+            'num_late': self.num_late,
+            'max_lateness': self.max_lateness,
+        }
+
+
+def create_devices(num_devices=1, destination='//127.0.0.1:15001', seed=0, packet_format='unix'):
+    """ Create virtual armbands on consecutive ports (or shm names with a numeric suffix) from the first address """
+    devices = []
+    shm_name = get_shm_name(destination)
+    for i in range(num_devices):
+        if shm_name is not None:
+            address = destination if i == 0 else 'shm://{}_{}'.format(shm_name, i + 1)
+        else:
+            host, port = utilities.get_address(destination)
+            address = '//{}:{}'.format(host, port + i)
+        devices.append(VirtualMyo(address, seed=seed + i, packet_format=packet_format))
+    return devices
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Virtual Myo armband traffic generator')
+    parser.add_argument('-n', '--NUM_DEVICES', help='Number of virtual armbands', default=1, type=int)
+    parser.add_argument('-a', '--ADDRESS', help=r'Address of first armband (e.g. //127.0.0.1:15001 or shm://myo1)',
+                        default='//127.0.0.1:15001')
+    parser.add_argument('-f', '--FORMAT', help='Packet format: unix or exe', default='unix')
+    parser.add_argument('-s', '--SEED', help='Random seed', default=0, type=int)
+    parser.add_argument('-c', '--SCHEDULE', help='Class schedule id:seconds,... (e.g. 0:2,7:2)', default='0:1')
+    parser.add_argument('-d', '--DURATION', help='Seconds to run (default until CTRL+C)', default=None, type=float)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    gen = TrafficGenerator(create_devices(args.NUM_DEVICES, args.ADDRESS, args.SEED, args.FORMAT),
+                           ClassSchedule.parse(args.SCHEDULE))
+    logger.info('Running {} virtual armband(s) to {}'.format(args.NUM_DEVICES, args.ADDRESS))
+    gen.start(args.DURATION)
+    try:
+        gen.join()
+    except KeyboardInterrupt:
+        pass
+    gen.stop()
+    logger.info(gen.get_stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -11,9 +11,11 @@ minivie.
 """
 
 import time
+import asyncio
 import logging
 from mpl import JointEnum as Mpl
 import controls
+from controls import trajectory
 import utilities.user_config as uc
 import numpy as np
 
@@ -46,36 +48,55 @@ class DataSink(object):
             print('Waiting 20 ms for valid percepts...')
             logging.info('Waiting 20 ms for valid percepts...')
 
+    def get_goto_trajectory(self, new_position):
+        """
+        Return the path [num_steps by num_joints] from the last known limb position to new_position, or None if the
+        limb position is unknown.  The profile is set by the DataSink.goto_* user config parameters
+        """
+        if self.position['last_percept'] is None:
+            logging.warning('Limb Position is unknown. Go-to command disabled')
+            return None
+
+        return trajectory.goto_trajectory(self.position['last_percept'], new_position,
+                                          profile=uc.get_user_config_var('DataSink.goto_profile', 'linear'),
+                                          num_steps=uc.get_user_config_var('DataSink.goto_steps', 200),
+                                          max_velocity=uc.get_user_config_var('DataSink.goto_max_velocity', 0.5),
+                                          dt=controls.timestep)
+
     def goto_smooth(self, new_position):
         # Smoothly move to a new position
+        # Note this blocks the calling thread until the move is complete.  From the event loop use goto_smooth_async
 
-        # first get current position
-        if self.position['last_percept'] is None:
-            logging.warning('Limb Position is unknown. Go-to command disabled')
+        path = self.get_goto_trajectory(new_position)
+        if path is None:
             return
 
-        # create map between current position and target position
-        start_angles = self.position['last_percept']
-        end_angles = new_position
-
-        for percent in np.linspace(0, 100, 200):
-
-            intermediate_command = [0.0] * len(start_angles)
-            for idx, start_angle in enumerate(start_angles):
-                # linear interpolate
-                end_angle = end_angles[idx]
-                x0 = 0
-                y0 = start_angle
-                x1 = 100
-                y1 = end_angle
-                x = percent
-                y = (y0 * (x1 - x) + y1 * (x - x0)) / (x1 - x0)
-                intermediate_command[idx] = y
-            self.send_joint_angles(intermediate_command)
-            time.sleep(controls.timestep)
+        deadline = time.perf_counter()
+        for angles in path:
+            self.send_joint_angles(angles)
+            deadline += controls.timestep
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
         logging.info('Limb Go-to Complete')
 
-        pass
+    async def goto_smooth_async(self, new_position):
+        """
+        Smoothly move to a new position, sending one step per timestep without blocking the event loop
+
+        Steps are sent on a fixed schedule from the start time.  Cancel the task to stop the motion where it is
+        """
+
+        path = self.get_goto_trajectory(new_position)
+        if path is None:
+            return
+
+        deadline = time.perf_counter()
+        for angles in path:
+            self.send_joint_angles(angles)
+            deadline += controls.timestep
+            await asyncio.sleep(max(deadline - time.perf_counter(), 0.0))
+        logging.info('Limb Go-to Complete')
 
     # All methods with this decorator must be overloaded
     @abstractmethod
@@ -269,74 +269,129 @@ def encode_param_update_msg(name, value):
     return msg
 
 
+# Structured message layouts (little endian).  Messages are decoded with np.frombuffer using these dtypes so that
+# no per-byte python objects are created
+HEARTBEAT_DTYPE = np.dtype([
+    ('SW_STATE', '<u4'),
+    ('numMsgs', '<u4'),
+    ('nfuStreaming', '<u8'),
+    ('lcStreaming', '<u8'),
+    ('cpchStreaming', '<u8'),
+    ('busVoltageCounts', '<u2'),
+])
+
+# CPCH: 6 byte global header, then 20 samples of [4 byte header, 32 int16 channels]
+CPCH_HEADER_SIZE = 6
+CPCH_NUM_SAMPLES = 20
+CPCH_NUM_CHANNELS = 32
+CPCH_SAMPLE_DTYPE = np.dtype([('header', 'u1', (4,)), ('channels', '<i2', (CPCH_NUM_CHANNELS,))])
+
+# Percepts
+PERCEPT_DTYPE = np.dtype([('Position', '<i2'), ('Velocity', '<i2'), ('Torque', '<i2'), ('Temperature', 'u1')])
+UNACTUATED_PERCEPT_DTYPE = np.dtype([('Position', '<i2')])
+# FTSN sensors are either new style (14 force bytes) or old style (3 int16 forces), each followed by 3 acceleration
+# bytes.  Decoded FTSN output holds the fields of both styles, with forceConfig indicating which are valid
+FTSN_DTYPE = np.dtype([('id', 'u1'), ('forceConfig', 'u1'), ('force', 'u1', (14,)),
+                       ('force_pressure', '<i2'), ('force_shear', '<i2'), ('force_axial', '<i2'),
+                       ('acceleration_x', 'u1'), ('acceleration_y', 'u1'), ('acceleration_z', 'u1')])
+CONTACT_PERCEPT_DTYPE = np.dtype([(name, 'u1') for name in (
+    'index_contact_sensor', 'middle_contact_sensor', 'ring_contact_sensor', 'little_contact_sensor',
+    'index_abad_contact_sensor_1', 'index_abad_contact_sensor_2',
+    'little_abad_contact_sensor_1', 'little_abad_contact_sensor_2')])
+
+# List of software states
+NFU_STATES = (
+    'SW_STATE_INIT',
+    'SW_STATE_PRG',
+    'SW_STATE_FS',
+    'SW_STATE_NOS_CONTROL_STIMULATION',
+    'SW_STATE_NOS_IDLE',
+    'SW_STATE_NOS_SLEEP',
+    'SW_STATE_NOS_CONFIGURATION',
+    'SW_STATE_NOS_HOMING',
+    'SW_STATE_NOS_DATA_ACQUISITION',
+    'SW_STATE_NOS_DIAGNOSTICS',
+    'SW_STATE_NUM_STATES',
+)
+
+
+def _as_uint8(b):
+    # View bytes or a uint8 array as a flat uint8 array without copying
+    if isinstance(b, np.ndarray):
+        return np.ascontiguousarray(b, np.uint8).reshape(-1)
+    return np.frombuffer(b, np.uint8)
+
+
+# FTSN byte layouts are variable length depending on the enable and style flags.  The byte indices for each flag
+# combination are computed once and reused
+_ftsn_layouts = {}
+
+
+def _get_ftsn_layout(ftsn_enable, ftsn_config, data_index):
+    key = (ftsn_enable.tobytes(), ftsn_config.tobytes(), data_index)
+    layout = _ftsn_layouts.get(key)
+    if layout is not None:
+        return layout
+
+    ids = np.flatnonzero(ftsn_enable)
+    new_rows, new_force_idx, old_rows, old_force_idx, accel_idx = [], [], [], [], []
+    for row, i in enumerate(ids):
+        if ftsn_config[i]:  # new style
+            new_rows.append(row)
+            new_force_idx.append(np.arange(14) + data_index)
+            data_index += 14
+        else:  # old style
+            old_rows.append(row)
+            old_force_idx.append(np.arange(6) + data_index)
+            data_index += 6
+        accel_idx.append(np.arange(3) + data_index)
+        data_index += 3
+
+    layout = {
+        'id': ids,
+        'forceConfig': ftsn_config[ids],
+        'new_rows': np.array(new_rows, int),
+        'new_force_idx': np.array(new_force_idx, int).reshape(-1, 14),
+        'old_rows': np.array(old_rows, int),
+        'old_force_idx': np.array(old_force_idx, int).reshape(-1, 6),
+        'accel_idx': np.array(accel_idx, int).reshape(-1, 3),
+        'end': data_index,
+    }
+    _ftsn_layouts[key] = layout
+    return layout
+
+
 def decode_heartbeat_msg(msg_bytes):
     # Log: Translated to Python by COP on 12OCT2016
+    # Decode with structured dtype
 
-    # Check if b is input as bytes, if so, convert to uint8
-    if isinstance(msg_bytes, (bytes, bytearray)):
-        msg_bytes = struct.unpack('B' * len(msg_bytes), msg_bytes)
-        msg_bytes = np.array(msg_bytes, np.uint8)
-
-    # List of software states
-    nfu_states = [
-        'SW_STATE_INIT',
-        'SW_STATE_PRG',
-        'SW_STATE_FS',
-        'SW_STATE_NOS_CONTROL_STIMULATION',
-        'SW_STATE_NOS_IDLE',
-        'SW_STATE_NOS_SLEEP',
-        'SW_STATE_NOS_CONFIGURATION',
-        'SW_STATE_NOS_HOMING',
-        'SW_STATE_NOS_DATA_ACQUISITION',
-        'SW_STATE_NOS_DIAGNOSTICS',
-        'SW_STATE_NUM_STATES',
-    ]
+    h = np.frombuffer(_as_uint8(msg_bytes), HEARTBEAT_DTYPE, count=1)[0]
 
     msg = {
-        'SW_STATE': msg_bytes[0:4].view(np.uint32)[0],
-        'strState': '',
-        'numMsgs': msg_bytes[4:8].view(np.uint32)[0],
-        'nfuStreaming': msg_bytes[8:16].view(np.uint64)[0],
-        'lcStreaming': msg_bytes[16:24].view(np.uint64)[0],
-        'cpchStreaming': msg_bytes[24:32].view(np.uint64)[0],
-        'busVoltageCounts': msg_bytes[32:34].view(np.uint16)[0],
-        'busVoltage': 0.0,
+        'SW_STATE': h['SW_STATE'],
+        'strState': NFU_STATES[h['SW_STATE']],
+        'numMsgs': h['numMsgs'],
+        'nfuStreaming': h['nfuStreaming'],
+        'lcStreaming': h['lcStreaming'],
+        'cpchStreaming': h['cpchStreaming'],
+        'busVoltageCounts': h['busVoltageCounts'],
+        'busVoltage': float(h['busVoltageCounts']) / 148.95,
     }
-    msg['strState'] = nfu_states[msg['SW_STATE']]
-    msg['busVoltage'] = msg['busVoltageCounts'].astype(float) / 148.95
 
     return msg
 
 
 def decode_cpch_msg(b):
     # Log: Translated to Python by COP on 12OCT2016
+    # Decode with structured dtype
 
-    # Check if b is input as bytes, if so, convert to uint8
-    if isinstance(b, (bytes, bytearray)):
-        b = struct.unpack('B' * len(b), b)
-        b = np.array(b, np.uint8)
-
-    # Determine expected packet size
-    num_packet_header_bytes = 6
-    num_samples_per_packet = 20
-    num_sample_header_bytes = 4
-    num_channels_per_packet = 32
-    num_bytes_per_channel = 2
-    num_bytes_per_sample = num_channels_per_packet * num_bytes_per_channel + num_sample_header_bytes
-    cpch_packet_size = num_packet_header_bytes + num_bytes_per_sample * num_samples_per_packet
-
-    # First 6 bytes of message are global header
-    data = b[num_packet_header_bytes:cpch_packet_size].reshape(
-        num_bytes_per_sample, num_samples_per_packet, order='F')
-
-    # First 5 bytes per sample are header
-    data_bytes = data[num_sample_header_bytes:, :]
+    samples = np.frombuffer(_as_uint8(b), CPCH_SAMPLE_DTYPE, count=CPCH_NUM_SAMPLES, offset=CPCH_HEADER_SIZE)
 
-    # Reshape into vector and then convert to int16
-    s = data_bytes.reshape(1, data_bytes.size, order='F')[0, :].view(np.int16).reshape(
-        num_channels_per_packet, num_samples_per_packet, order='F')
+    # [nChannels by nSamples]
+    s = samples['channels'].T.copy()
 
-    sequence_number = data[2, :].astype('int16')
+    # Last channel is replaced by the sample sequence number from the sample header
+    sequence_number = samples['header'][:, 2].astype('int16')
     s[-1, :] = sequence_number
 
     signal_dict = {'s': s, 'sequence_number': sequence_number}
@@ -344,141 +399,68 @@ def decode_cpch_msg(b):
 
 
 def decode_percept_msg(b):
+    """
+    Decode percept bytes into structured arrays
+
+    Each percept group is a numpy structured array, so values are accessed as e.g. tlm['Percept']['Position']
+    (all joints) or tlm['Percept'][i]['Position'].  Groups that are not enabled are empty arrays
+    """
     # Log: Translated to Python by COP on 12OCT2016
+    # Decode with structured dtypes, return arrays rather than lists of dicts
 
-    tlm = {}
-    # Enable Flags
-    percept_enable_actuated_percepts = 1
-    percept_enable_unactuated_percepts = 2
-    # percept_enable_index_ftsn = 3
-    # percept_enable_middle_ftsn = 4
-    # percept_enable_ring_ftsn = 5
-    # percept_enable_little_ftsn = 6
-    # percept_enable_thumb_ftsn = 7
-    percept_enable_contact = 8
-    percept_enable_num_ids = 8
-
-    # Actuated
-    # perceptid_index_ab_ad = 1
-    # perceptid_index_mcp = 2
-    # perceptid_middle_mcp = 3
-    # perceptid_ring_mcp = 4
-    # perceptid_little_ab_ad = 5
-    # perceptid_little_mcp = 6
-    # perceptid_thumb_cmc_ad_ab = 7
-    # perceptid_thumb_cmc_fe = 8
-    # perceptid_thumb_mcp = 9
-    # perceptid_thumb_dip = 10
-    percept_num_ids = 10
+    # Enable Flags (bit index)
+    percept_enable_actuated_percepts = 0
+    percept_enable_unactuated_percepts = 1
+    percept_enable_ftsn = 2  # index, middle, ring, little, thumb are bits 2-6
+    percept_enable_contact = 7
 
-    # UnActuated
-    # perceptid_index_pip = 1
-    # perceptid_index_dip = 2
-    # perceptid_middle_pip = 3
-    # perceptid_middle_dip = 4
-    # perceptid_ring_pip = 5
-    # perceptid_ring_dip = 6
-    # perceptid_little_pip = 7
-    # perceptid_little_dip = 8
+    percept_num_ids = 10
     unactuated_percept_num_ids = 8
-
-    # FTSN
-    # perceptid_index_ftsn = 1
-    # perceptid_middle_ftsn = 2
-    # perceptid_ring_ftsn = 3
-    # perceptid_little_ftsn = 4
-    # perceptid_thumb_ftsn = 5
     ftsn_percept_num_ids = 5
 
-    # Check if b is input as bytes, if so, convert to uint8
-    if isinstance(b, (bytes, bytearray)):
-        b = struct.unpack('B' * len(b), b)
-        b = np.array(b, np.uint8)
-
+    b = _as_uint8(b)
     data = b[4:]
-    # data_bytes = b[0:4].view(np.uint32)
-
-    percepts_config = np.fliplr([np.unpackbits(data[0])[8 - percept_enable_num_ids:]])[0]
-    ftsn_config = np.fliplr([np.unpackbits(data[1])[8 - ftsn_percept_num_ids:]])[0]
-
-    # index_size = data[0]
-
-    data_index = int(2)
-
-    tlm['Percept'] = []
-    if percepts_config[percept_enable_actuated_percepts - 1]:
-        for i in np.linspace(0, percept_num_ids - 1, percept_num_ids):
-            i = int(i)
-            d = {}
-            pos_start_idx = data_index + i * 7
-            d['Position'] = data[pos_start_idx: pos_start_idx + 2].view(np.int16)[0]
-            vel_start_idx = data_index + 2 + i * 7
-            d['Velocity'] = data[vel_start_idx: vel_start_idx + 2].view(np.int16)[0]
-            torq_start_idx = data_index + 4 + i * 7
-            d['Torque'] = data[torq_start_idx: torq_start_idx + 2].view(np.int16)[0]
-            d['Temperature'] = data[data_index + 6 + i * 7]
-            tlm['Percept'].append(d)
-
-        data_index += 70
-
-    tlm['UnactuatedPercept'] = []
-    if percepts_config[percept_enable_unactuated_percepts - 1]:
-        for i in np.linspace(0, unactuated_percept_num_ids - 1, unactuated_percept_num_ids):
-            i = int(i)
-            d = {}
-            pos_start_idx = data_index + i * 2
-            d['Position'] = data[pos_start_idx: pos_start_idx + 2].view(np.int16)[0]
-            tlm['UnactuatedPercept'].append(d)
-
-        data_index += 16
-
-    tlm['FtsnPercept'] = []
-    for i in np.linspace(0, ftsn_percept_num_ids - 1, ftsn_percept_num_ids):
-        i = int(i)
-        if percepts_config[i + 1]:
-            d = {'forceConfig': ftsn_config[i]}
-
-            if ftsn_config[i]:  # new style
-                force = []
-                for _ in np.linspace(0, 13, 14):
-                    force.append(data[data_index])
-                    data_index += 1
-                d['force'] = force
-
-                d['acceleration_x'] = data[data_index]
-                data_index += 1
-                d['acceleration_y'] = data[data_index]
-                data_index += 1
-                d['acceleration_z'] = data[data_index]
-                data_index += 1
-
-            else:  # old style
-                d['force_pressure'] = data[data_index: data_index + 2].view(np.int16)[0]
-                data_index += 2
-                d['force_shear'] = data[data_index: data_index + 2].view(np.int16)[0]
-                data_index += 2
-                d['force_axial'] = data[data_index: data_index + 2].view(np.int16)[0]
-                data_index += 2
-
-                d['acceleration_x'] = data[data_index]
-                data_index += 1
-                d['acceleration_y'] = data[data_index]
-                data_index += 1
-                d['acceleration_z'] = data[data_index]
-                data_index += 1
-
-            tlm['FtsnPercept'].append(d)
-
-    if percepts_config[percept_enable_contact - 1]:
-        contact_data = data[data_index:data_index + 12]
-
-        tlm['ContactSensorPercept'] = []
-        d = {'index_contact_sensor': contact_data[0], 'middle_contact_sensor': contact_data[1],
-             'ring_contact_sensor': contact_data[2], 'little_contact_sensor': contact_data[3],
-             'index_abad_contact_sensor_1': contact_data[4], 'index_abad_contact_sensor_2': contact_data[5],
-             'little_abad_contact_sensor_1': contact_data[6], 'little_abad_contact_sensor_2': contact_data[7]}
-
-        tlm['ContactSensorPercept'].append(d)
+
+    percepts_config = (int(data[0]) >> np.arange(8)) & 1
+    ftsn_config = (int(data[1]) >> np.arange(ftsn_percept_num_ids)) & 1
+
+    data_index = 2
+    tlm = {}
+
+    if percepts_config[percept_enable_actuated_percepts]:
+        tlm['Percept'] = np.frombuffer(data, PERCEPT_DTYPE, count=percept_num_ids, offset=data_index)
+        data_index += percept_num_ids * PERCEPT_DTYPE.itemsize
+    else:
+        tlm['Percept'] = np.zeros(0, PERCEPT_DTYPE)
+
+    if percepts_config[percept_enable_unactuated_percepts]:
+        tlm['UnactuatedPercept'] = np.frombuffer(data, UNACTUATED_PERCEPT_DTYPE,
+                                                 count=unactuated_percept_num_ids, offset=data_index)
+        data_index += unactuated_percept_num_ids * UNACTUATED_PERCEPT_DTYPE.itemsize
+    else:
+        tlm['UnactuatedPercept'] = np.zeros(0, UNACTUATED_PERCEPT_DTYPE)
+
+    ftsn_enable = percepts_config[percept_enable_ftsn:percept_enable_ftsn + ftsn_percept_num_ids]
+    layout = _get_ftsn_layout(ftsn_enable, ftsn_config, data_index)
+    ftsn = np.zeros(len(layout['id']), FTSN_DTYPE)
+    ftsn['id'] = layout['id']
+    ftsn['forceConfig'] = layout['forceConfig']
+    if len(layout['new_rows']):
+        ftsn['force'][layout['new_rows']] = data[layout['new_force_idx']]
+    if len(layout['old_rows']):
+        force = data[layout['old_force_idx']].view('<i2')
+        ftsn['force_pressure'][layout['old_rows']] = force[:, 0]
+        ftsn['force_shear'][layout['old_rows']] = force[:, 1]
+        ftsn['force_axial'][layout['old_rows']] = force[:, 2]
+    acceleration = data[layout['accel_idx']]
+    ftsn['acceleration_x'] = acceleration[:, 0]
+    ftsn['acceleration_y'] = acceleration[:, 1]
+    ftsn['acceleration_z'] = acceleration[:, 2]
+    data_index = layout['end']
+    tlm['FtsnPercept'] = ftsn
+
+    if percepts_config[percept_enable_contact]:
+        tlm['ContactSensorPercept'] = np.frombuffer(data, CONTACT_PERCEPT_DTYPE, count=1, offset=data_index)
 
     if len(b) > 518:
         lmc = b[-308:].reshape(44, 7, order='F')
@@ -493,12 +475,7 @@ def decode_percept_msg(b):
 def decode_lmc_msg(b):
     # Log: Translated to Python by COP on 12OCT2016
 
-    # Check if b is input as bytes, if so, convert to uint8
-    if isinstance(b, (bytes, bytearray)):
-        b = struct.unpack('B' * len(b), b)
-        b = np.array(b, np.uint8)
-
-    tlm = {'LMC': b[-308:].reshape(44, 7, order='F')}
+    tlm = {'LMC': _as_uint8(b)[-308:].reshape(44, 7, order='F')}
 
     return tlm
 
@@ -13,7 +13,7 @@
 #
 
 
-from collections import deque
+from functools import lru_cache
 from os import name as os_name
 import threading
 import socket
@@ -26,6 +26,7 @@ import controls
 from mpl.data_sink import DataSink
 from mpl import JointEnum as MplId, extract_percepts
 from utilities.user_config import read_user_config_file, get_user_config_var
+from utilities.streaming_stats import RunningStats, StatMonitor
 
 
 class NfuUdp(DataSink):
@@ -64,8 +65,15 @@ class NfuUdp(DataSink):
         }
         self.mpl_status = self.mpl_status_default
 
-        # battery samples will contain N most recent samples for averaging
-        self.battery_samples = deque([], maxlen=15)
+        # Bus voltage statistics over the N most recent heartbeats.  A low average triggers limb shutdown
+        self.battery_monitor = StatMonitor(RunningStats(window=15))
+        self.low_battery = self.battery_monitor.add_threshold('low_battery', self.on_low_battery, stat='mean')
+
+        # Joint temperature and torque statistics over the most recent percepts.  Limits are set from user config
+        self.temperature_monitor = StatMonitor(RunningStats(window=50, shape=MplId.NUM_JOINTS))
+        self.high_temperature = self.temperature_monitor.add_threshold('temperature', self.on_percept_warning)
+        self.torque_monitor = StatMonitor(RunningStats(window=50, shape=MplId.NUM_JOINTS))
+        self.high_torque = self.torque_monitor.add_threshold('torque', self.on_percept_warning)
 
         self.reset_impedance = False
         self.magic_impedance = [40.0] * controls.NUM_UPPER_ARM_JOINTS + [15.6288] * controls.NUM_HAND_JOINTS
@@ -115,6 +123,10 @@ class NfuUdp(DataSink):
                 self.stiffness_low[i] = get_user_config_var(MplId(i).name + '_STIFFNESS_LOW', 4.0)
 
         self.shutdown_voltage = get_user_config_var('MPL.shutdown_voltage', 19.0)
+        self.low_battery.lower = self.shutdown_voltage
+        # Joint percept warning levels.  0 disables the warning
+        self.high_temperature.upper = get_user_config_var('MPL.temperature_warning', 70.0) or None
+        self.high_torque.upper = get_user_config_var('MPL.torque_warning', 0.0) or None
         # self.enable_impedance = get_user_config_var('MPL.enable_impedance', 0)
 
         self.mpl_connection_check = get_user_config_var('MPL.connection_check', 1)
@@ -195,12 +207,60 @@ class NfuUdp(DataSink):
         # stop the receive thread
         self.thread.join()
 
+    def stop_monitors(self):
+        for monitor in (self.battery_monitor, self.temperature_monitor, self.torque_monitor):
+            monitor.close()
+
+    def update_status(self, status):
+        # Log a heartbeat status and update the bus voltage statistics
+        msg = 'Heartbeat: NFU:{} LC:{} Bus:{:.2f}V CMDDOM:{:.1f}ms ACTUATEMPL:{:.1f}ms'.format(
+            status['nfu_state'], status['lc_software_state'], status['bus_voltage'],
+            status['nfu_ms_per_CMDDOM'], status['nfu_ms_per_ACTUATEMPL'])
+        logging.info(msg)
+        if self.verbosity['echoHeartbeat']:
+            print(msg)
+
+        # Note that 0.0 is a voltage reported as a valid heartbeat when hand disconnected, so it is not averaged
+        if status['bus_voltage'] != 0.0:
+            self.battery_monitor.update(status['bus_voltage'])
+            stats = self.battery_monitor.stats
+            logging.info('Moving Average Bus Voltage: {:.3f} Trend: {:.4f} V/sample'.format(stats.mean, stats.trend))
+
+    def update_percept_stats(self, temperature, torque):
+        # Update joint temperature and torque statistics.  Threshold events are handled on the monitor threads
+        self.temperature_monitor.update(temperature)
+        self.torque_monitor.update(np.abs(torque))
+
+    def on_low_battery(self, event):
+        # Called on the battery monitor thread when the average bus voltage crosses the shutdown voltage
+        if not event.active:
+            return
+
+        # Execute limb Shutdown procedure
+        # Send a log message; set LC to soft reset; poweroff NFU
+        from utilities.sys_cmd import shutdown
+        msg = 'MPL bus voltage is {:.2f} and below critical value {}.  Shutting down system!'.format(
+            float(event.value), event.lower)
+        print(msg)
+        logging.critical(msg)
+        self.set_limb_soft_reset()
+        shutdown()
+
+    def on_percept_warning(self, event):
+        # Called on a percept monitor thread when the average of a joint percept crosses its warning level
+        if event.active:
+            joints = [MplId(i).name for i in np.flatnonzero(event.value > event.upper)]
+            logging.warning('MPL joint {} above {}: {}'.format(event.name, event.upper, ', '.join(joints)))
+        else:
+            logging.info('MPL joint {} below {}'.format(event.name, event.upper))
+
     def close(self):
         """ Cleanup socket """
         if self.sock is not None:
             logging.info("Closing NfuUdp Socket IP={} Port={}".format(self.udp['Hostname'], self.udp['TelemPort']))
             self.sock.close()
         self.stop()
+        self.stop_monitors()
 
     def message_handler(self):
         # Loop forever to receive data via UDP
@@ -250,26 +310,7 @@ class NfuUdp(DataSink):
                 # pass message bytes
                 msg = decode_heartbeat_msg_v2(data[3:])
                 self.mpl_status = msg
-
-                logging.info(msg)
-                if self.verbosity['echoHeartbeat']:
-                    print(msg)
-
-                self.battery_samples.append(msg['bus_voltage'])
-
-                # Check Limb Shutdown Condition
-                # Note that 0.0 is a voltage reported as a valid heartbeat when hand disconnected
-                v_battery = sum(self.battery_samples)/len(self.battery_samples)
-                logging.info('Moving Average Bus Voltage: ' + str(v_battery))
-                if v_battery != 0.0 and v_battery < self.shutdown_voltage:
-                    # Execute limb Shutdown procedure
-                    # Send a log message; set LC to soft reset; poweroff NFU
-                    from utilities.sys_cmd import shutdown
-                    msg = 'MPL bus voltage is {} and below critical value {}.  Shutting down system!'
-                    print(msg)
-                    logging.critical(msg)
-                    self.set_limb_soft_reset()
-                    shutdown()
+                self.update_status(msg)
 
             elif msg_id == mpl.NfuUdpMsgId.UDPMSGID_PERCEPTDATA:
                 # Percept message comes in as follows: <class:bytes> len=879
@@ -283,6 +324,8 @@ class NfuUdp(DataSink):
                 self.percepts = percepts
 
                 self.position['last_percept'] = np.array(percepts['jointPercepts']['position'])
+                self.update_percept_stats(percepts['jointPercepts']['temperature'],
+                                          percepts['jointPercepts']['torque'])
 
                 values = np.array(percepts['jointPercepts']['torque'])  # DART Time: 50-70 us
                 msg = 'Torque: ' + ','.join(['%.1f' % elem for elem in values])  # DART Time: 220 us
@@ -403,6 +446,24 @@ class NfuUdp(DataSink):
         return self.percepts
 
 
+@lru_cache(maxsize=None)
+def nfu_state_name(state_id):
+    """ Name of an NFU boot state id """
+    try:
+        return mpl.BOOTSTATE(state_id).name
+    except ValueError:
+        return 'NFUSTATE_ENUM_ERROR={}'.format(state_id)
+
+
+@lru_cache(maxsize=None)
+def lc_state_name(state_id):
+    """ Name of a limb controller software state id """
+    try:
+        return mpl.LcSwState(state_id).name
+    except ValueError:
+        return 'LCSTATE_ENUM_ERROR={}'.format(state_id)
+
+
 def decode_heartbeat_msg_v2(msg_bytes):
 
     # Check if b is input as bytes, if so, convert to uint8
@@ -426,23 +487,10 @@ def decode_heartbeat_msg_v2(msg_bytes):
     # // messages per second
     # // flag - doubled messages per handle
 
-    # Lookup NFU state id from the enumeration
-    nfu_state_id = msg_bytes[0].view(np.uint8)
-    try:
-        nfu_state_str = str(mpl.BOOTSTATE(nfu_state_id)).split('.')[1]
-    except ValueError:
-        nfu_state_str = 'NFUSTATE_ENUM_ERROR={}'.format(nfu_state_id)
-
-    # Lookup LC state id from the enumeration
-    lc_state_id = msg_bytes[1].view(np.uint8)
-    try:
-        lc_state_str = str(mpl.LcSwState(lc_state_id)).split('.')[1]
-    except ValueError:
-        lc_state_str = 'LCSTATE_ENUM_ERROR={}'.format(nfu_state_id)
-
+    # Lookup NFU and LC state ids from the enumerations
     msg = {
-        'nfu_state': nfu_state_str,
-        'lc_software_state': lc_state_str,
+        'nfu_state': nfu_state_name(int(msg_bytes[0])),
+        'lc_software_state': lc_state_name(int(msg_bytes[1])),
         'lmc_software_state': msg_bytes[2:9],
         'bus_voltage': msg_bytes[9:13].view(np.float32)[0],
         'nfu_ms_per_CMDDOM': msg_bytes[13:17].view(np.float32)[0],
@@ -0,0 +1,281 @@
+"""
+Asyncio interface for the JHU/APL openNFU
+
+Messages from the NFU are received by an asyncio DatagramProtocol on the main event loop, rather than by a receive
+thread with a blocking recvfrom().  Configuration, limb commands, and status messages are the same as
+mpl.open_nfu.NfuUdp
+
+Percepts:
+    Joint percepts are decoded in place into a preallocated [4 by NUM_JOINTS] array (position, velocity, torque,
+    temperature).  get_percepts() returns the same dictionary of views on every call, and percept_version is
+    incremented each time new percepts are published, so a reader can tell if anything changed since it last looked.
+    Since all messages are handled on the event loop, a reader on the loop never sees a partially written update.
+
+    Segment percepts (contact and FTSN sensors) are not used by the control loop, so they are only decoded from the
+    last percept message when get_segment_percepts() is called
+
+Heartbeat:
+    The heartbeat updates mpl_status in place.  Battery, temperature, and torque monitoring are the same as
+    mpl.open_nfu.NfuUdp, with threshold actions (e.g. low battery shutdown) on the monitor threads rather than the
+    event loop.  Commands sent from other threads are passed to the event loop since transports are not thread safe
+
+Usage:
+    nfu = NfuUdp(hostname="127.0.0.1", udp_telem_port=9028, udp_command_port=9027)
+    nfu.connect()
+    loop.run_until_complete(nfu.wait_for_connection())
+
+"""
+
+import asyncio
+import logging
+import threading
+import time
+import numpy as np
+import mpl
+import controls
+from mpl import JointEnum as MplId, extract_percepts, open_nfu
+
+# openNFU heartbeat v2 (published at 1Hz).  See decode_heartbeat_msg_v2 in open_nfu.  Floats are little endian
+HEARTBEAT_V2_DTYPE = np.dtype([('length', '<u2'), ('msg_id', 'u1'),
+                               ('nfu_state', 'u1'), ('lc_software_state', 'u1'), ('lmc_software_state', 'u1', (7,)),
+                               ('bus_voltage', '<f4'), ('nfu_ms_per_CMDDOM', '<f4'), ('nfu_ms_per_ACTUATEMPL', '<f4')])
+
+# Percept message header: uint16 length, uint8 msg_id, uint8 LimbPerceptsType, uint8 JointPerceptsType.  When the limb
+# percepts type is NONE and the joint percepts type is ALL_DOM_POS_VEL_TORQUE, the header is followed by the big
+# endian float32 position, velocity, torque, and temperature of each joint.  See mpl.extract_percepts
+LIMB_PERCEPTS_NONE = 0
+JOINT_PERCEPTS_ALL_DOM_POS_VEL_TORQUE = 1
+JOINT_PERCEPTS_OFFSET = 5
+JOINT_PERCEPTS_COUNT = 4 * MplId.NUM_JOINTS
+
+
+class NfuProtocol(asyncio.DatagramProtocol):
+    """ Extend the UDP Protocol to pass NFU messages to the parent NfuUdp """
+    def __init__(self, parent):
+        self.parent = parent
+
+    def datagram_received(self, data, addr):
+        self.parent.message_handler(data)
+
+    def error_received(self, exc):
+        logging.warning('NfuUdp socket error: {}'.format(exc))
+
+
+class NfuUdp(open_nfu.NfuUdp):
+    """
+    openNFU connection running on the asyncio event loop
+
+    Hostname is the IP of the NFU
+    UdpTelemPort is where percepts and heartbeats from NFU are received locally
+    UdpCommandPort is where limb commands are sent
+
+    """
+
+    def __init__(self, hostname="127.0.0.1", udp_telem_port=9028, udp_command_port=9027):
+
+        # Initialize superclass
+        super(NfuUdp, self).__init__(hostname, udp_telem_port, udp_command_port)
+
+        # messages are handled on the event loop; no receive thread
+        self.thread = None
+        self.loop = None
+        self.transport = None
+        self.protocol = None
+        self.loop_thread_id = None
+
+        # connection is lost if no message arrives within timeout seconds
+        self.timeout = 3.0
+        self.time_last_message = 0.0
+        self.watchdog = None
+
+        # Joint percepts decoded in place.  Rows are position, velocity, torque, temperature
+        self.joint_percepts = np.zeros((4, MplId.NUM_JOINTS))
+        self.percept_version = 0
+        self.last_percept_msg = None
+        self.joint_percept_dict = {
+            'jointPercepts': {
+                'position': self.joint_percepts[0],
+                'velocity': self.joint_percepts[1],
+                'torque': self.joint_percepts[2],
+                'temperature': self.joint_percepts[3],
+            }
+        }
+
+        # mpl_status is updated in place by heartbeat messages
+        self.mpl_status = dict(self.mpl_status_default)
+        self.mpl_status['lmc_software_state'] = np.zeros(7, dtype=np.uint8)
+
+    def connect(self):
+        """ Connect UDP socket and register callback for data received """
+
+        # log socket creation
+        logging.info('Setting up UDP comms on port {}. Default destination is {}:{}:'.format(
+            self.udp['TelemPort'], self.udp['Hostname'], self.udp['CommandPort']))
+
+        self.loop = asyncio.get_event_loop()
+        self.loop_thread_id = threading.get_ident()
+        # bind to any IP address at the 'Telemetry' port (the port on which percepts are received)
+        listen = self.loop.create_datagram_endpoint(
+            lambda: NfuProtocol(parent=self), local_addr=('0.0.0.0', self.udp['TelemPort']))
+        self.transport, self.protocol = self.loop.run_until_complete(listen)
+
+        self.watchdog = self.loop.call_later(self.timeout, self.check_connection)
+
+    async def wait_for_connection(self):
+        # After connecting, this function can be used to wait until valid percepts are received
+        # before continuing program execution.  E.g. ensure valid joint percepts are received to ensure smooth start
+
+        print('Checking for valid percepts...')
+
+        while self.position['last_percept'] is None:
+            await asyncio.sleep(controls.timestep)
+            print('Waiting 20 ms for valid percepts...')
+            logging.info('Waiting 20 ms for valid percepts...')
+
+    def check_connection(self):
+        # Called periodically on the event loop.  Mark the connection lost if the data stream has stopped
+        if self.active_connection and time.monotonic() - self.time_last_message > self.timeout:
+            logging.warning('NfuUdp received no data for {} s on IP={} Port={}'.format(
+                self.timeout, self.udp['Hostname'], self.udp['TelemPort']))
+            logging.info('MPL Connection is Lost')
+            self.active_connection = False
+            self.reset_status()
+        self.watchdog = self.loop.call_later(self.timeout / 2, self.check_connection)
+
+    def reset_status(self):
+        lmc_software_state = self.mpl_status['lmc_software_state']
+        self.mpl_status.update(self.mpl_status_default)
+        lmc_software_state[:] = 0
+        self.mpl_status['lmc_software_state'] = lmc_software_state
+
+    def stop(self):
+        # stop the connection watchdog
+        if self.watchdog is not None:
+            self.watchdog.cancel()
+            self.watchdog = None
+
+    def close(self):
+        """ Cleanup socket """
+        self.stop()
+        self.stop_monitors()
+        if self.transport is not None:
+            logging.info("Closing NfuUdp Socket IP={} Port={}".format(self.udp['Hostname'], self.udp['TelemPort']))
+            self.transport.close()
+            self.transport = None
+
+    def message_handler(self, data):
+        # Handle one message from the NFU.  Called by NfuProtocol on the event loop
+
+        self.time_last_message = time.monotonic()
+        if not self.active_connection:
+            logging.info('MPL Connection is Active: Data received')
+            self.active_connection = True
+
+        # Get the message ID
+        if len(data) < 3:
+            logging.warning('Message received was too small. Minimum message size is 3 bytes')
+            return
+        msg_id = data[2]
+
+        if msg_id == mpl.NfuUdpMsgId.UDPMSGID_HEARTBEATV2:
+            self.update_heartbeat(data)
+        elif msg_id == mpl.NfuUdpMsgId.UDPMSGID_PERCEPTDATA:
+            self.update_percepts(data)
+
+    def update_heartbeat(self, data):
+        # When we get a heartbeat message, parse the message and update the battery voltage statistics
+        if len(data) < HEARTBEAT_V2_DTYPE.itemsize:
+            logging.warning('Heartbeat message too small: {} bytes'.format(len(data)))
+            return
+
+        heartbeat = np.frombuffer(data, dtype=HEARTBEAT_V2_DTYPE, count=1)[0]
+        status = self.mpl_status
+        status['nfu_state'] = open_nfu.nfu_state_name(int(heartbeat['nfu_state']))
+        status['lc_software_state'] = open_nfu.lc_state_name(int(heartbeat['lc_software_state']))
+        status['lmc_software_state'][:] = heartbeat['lmc_software_state']
+        status['bus_voltage'] = float(heartbeat['bus_voltage'])
+        status['nfu_ms_per_CMDDOM'] = float(heartbeat['nfu_ms_per_CMDDOM'])
+        status['nfu_ms_per_ACTUATEMPL'] = float(heartbeat['nfu_ms_per_ACTUATEMPL'])
+
+        self.update_status(status)
+
+    def update_percepts(self, data):
+        # Decode joint percepts into the preallocated array and publish them
+        num_bytes = len(data)
+        if (num_bytes > JOINT_PERCEPTS_OFFSET + 4 * JOINT_PERCEPTS_COUNT
+                and data[3] == LIMB_PERCEPTS_NONE and data[4] == JOINT_PERCEPTS_ALL_DOM_POS_VEL_TORQUE):
+            # first two bytes are length as uint16, last byte is the checksum
+            raw = np.frombuffer(data, dtype=np.uint8)
+            if int(raw[0]) + (int(raw[1]) << 8) != num_bytes - 2:
+                logging.error('NfuUdp invalid percept packet length: {}'.format(num_bytes))
+                return
+            if int(raw[:-1].sum()) % 256 != raw[-1]:
+                logging.error('NfuUdp invalid checksum in MPL percepts message')
+                return
+            self.joint_percepts.reshape(-1)[:] = np.frombuffer(
+                data, dtype='>f4', count=JOINT_PERCEPTS_COUNT, offset=JOINT_PERCEPTS_OFFSET)
+        else:
+            # Other percept layouts use the full parser
+            percepts = extract_percepts.extract(data)
+            if 'jointPercepts' not in percepts:
+                return
+            for row, name in enumerate(('position', 'velocity', 'torque', 'temperature')):
+                self.joint_percepts[row] = percepts['jointPercepts'][name]
+
+        self.last_percept_msg = data
+        self.percepts = self.joint_percept_dict
+        self.position['last_percept'] = self.joint_percepts[0]
+        self.percept_version += 1
+        self.update_percept_stats(self.joint_percepts[3], self.joint_percepts[2])
+
+        if logging.root.isEnabledFor(logging.INFO):
+            msg = 'Torque: ' + ','.join(['%.1f' % elem for elem in self.joint_percepts[2]])
+            logging.info(msg)
+            msg = 'Temp: ' + ','.join(['%d' % elem for elem in self.joint_percepts[3]])
+            logging.info(msg)
+            if self.verbosity['echoPercepts']:
+                print(msg)
+
+    def get_segment_percepts(self):
+        """ Decode the segment percepts (contact and FTSN sensors) of the last percept message """
+        if self.last_percept_msg is None:
+            return None
+        return extract_percepts.extract(self.last_percept_msg).get('segmentPercepts')
+
+    def send_udp_command(self, msg):
+        # transmit packets
+        if self.transport is None:
+            logging.warning('NfuUdp is not connected.  Call connect() first')
+            return
+        address = (self.udp['Hostname'], self.udp['CommandPort'])
+        if threading.get_ident() == self.loop_thread_id:
+            self.transport.sendto(msg, address)
+        else:
+            self.loop.call_soon_threadsafe(self.transport.sendto, msg, address)
+
+
+def main():
+    # Receive from the openNFU simulator and print the percept rate.  From the minivie folder:
+    # python -m mpl.open_nfu_asyncio
+    from utilities.user_config import read_user_config_file
+
+    read_user_config_file('user_config_default.xml')
+    sim = open_nfu.Simulator()
+    sim.start()
+
+    nfu = NfuUdp(hostname="127.0.0.1", udp_telem_port=9028, udp_command_port=9027)
+    nfu.verbosity['echoHeartbeat'] = False
+    nfu.connect()
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(nfu.wait_for_connection())
+        loop.run_until_complete(asyncio.sleep(2.0))
+        print('Percepts received: {}'.format(nfu.percept_version))
+        print(nfu.get_status_msg())
+    finally:
+        nfu.close()
+        sim.stop()
+
+
+if __name__ == '__main__':
+    main()
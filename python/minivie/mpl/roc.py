@@ -15,7 +15,7 @@ Revisions:
 import logging
 import xml.etree.cElementTree as xmlTree
 import numpy as np
-from scipy.interpolate import interp1d
+import bisect
 
 
 class RocElement:
@@ -25,6 +25,7 @@ class RocElement:
     waypoints = []  # array of waypoints
     angles = {}  # dictionary of angles for each waypoint
     impedance = {}  # dictionary of impedances for each waypoint
+    deltas = None  # angle change between successive waypoints, computed on first use
 
 
 # function to read in ROC xml file and store as dictionary
@@ -95,11 +96,37 @@ def get_roc_id(roc_table, roc_id):
     return None
 
 
-def get_roc_values(roc_elem, val):
-    x = np.array(roc_elem.waypoints)
+def get_roc_values(roc_elem, val, out=None):
+    """
+    Linearly interpolate the roc angles at val
+
+    val is a waypoint index (e.g. roc position 0 to 1) or an array of them.  A scalar val returns the joint angles
+    [nJoints] and can be written into a preallocated out array; an array of T values returns [T by nJoints]
+    """
+    x = roc_elem.waypoints
     y = roc_elem.angles
-    new_angles = interp1d(x, y, axis=0, kind='linear')(val)
-    return new_angles
+    if roc_elem.deltas is None:
+        roc_elem.deltas = np.diff(y, axis=0)
+    num_segments = len(x) - 1
+    if num_segments < 1:
+        raise ValueError('ROC {} needs at least 2 waypoints to interpolate'.format(roc_elem.name))
+
+    if np.ndim(val) == 0:
+        if val < x[0] or val > x[-1]:
+            raise ValueError('ROC value {} outside of the waypoint range [{}, {}]'.format(val, x[0], x[-1]))
+        i = min(bisect.bisect_right(x, val) - 1, num_segments - 1)
+        weight = (val - x[i]) / (x[i + 1] - x[i])
+        out = np.multiply(roc_elem.deltas[i], weight, out=out)
+        out += y[i]
+        return out
+
+    val = np.asarray(val, dtype=float)
+    if val.size and (val.min() < x[0] or val.max() > x[-1]):
+        raise ValueError('ROC values outside of the waypoint range [{}, {}]'.format(x[0], x[-1]))
+    x = np.asarray(x)
+    i = np.clip(np.searchsorted(x, val, side='right') - 1, 0, num_segments - 1)
+    weight = (val - x[i]) / (x[i + 1] - x[i])
+    return np.add(y[i], roc_elem.deltas[i] * weight[..., np.newaxis], out=out)
 
 
 def main():
@@ -40,6 +40,7 @@ Created on 4/29/2019
 """
 
 import asyncio
+import threading
 import time
 import struct
 import logging
@@ -53,6 +54,8 @@ from utilities import get_address
 from mpl.unity import extract_percepts
 from controls import timestep
 
+RAD_TO_DEG = 180.0 / np.pi
+
 
 class UdpProtocol(asyncio.DatagramProtocol):
     """ Extend the UDP Protocol for unity data communication
@@ -73,6 +76,113 @@ class UdpProtocol(asyncio.DatagramProtocol):
             self.parent.position['last_percept'] = None
 
 
+class ServoMap(object):
+    """
+    Joint to servo encoder mapping compiled into arrays
+
+    Each servo is driven by the sum of one or more joint angles (whole degrees), so the joint to servo angles are
+    servo = matrix * degrees.  Servo angles are then clamped to the servo limits and scaled to encoder counts for all
+    servos at once.  Bipolar servos span -encoder_max to encoder_max instead of 0 to encoder_max
+    """
+    def __init__(self, groups, limits, encoder_maxs, bipolar=()):
+        num_servos = len(groups)
+        self.matrix = np.zeros((num_servos, MplId.NUM_JOINTS))
+        for i, group in enumerate(groups):
+            for joint in group:
+                self.matrix[i, joint.value] += 1.0
+        self.lower = np.array([limit[0] for limit in limits], dtype=float)
+        self.upper = np.array([limit[1] for limit in limits], dtype=float)
+        self.span = self.upper - self.lower
+        self.encoder_max = np.array(encoder_maxs, dtype=float)
+        # percent rotated p is scaled as (gain * p - shift) * encoder_max
+        self.gain = np.array([2.0 if i in bipolar else 1.0 for i in range(num_servos)])
+        self.shift = self.gain - 1.0
+
+        self.__degrees = np.zeros(MplId.NUM_JOINTS)
+        self.__counts = np.zeros(num_servos)
+
+    def encode(self, angles):
+        """ Return a tuple of integer encoder counts for each servo given joint angles in radians """
+        degrees = self.__degrees
+        counts = self.__counts
+        # Joint angles are truncated to whole degrees before summing
+        np.trunc(np.multiply(angles, RAD_TO_DEG, out=degrees), out=degrees)
+        np.dot(self.matrix, degrees, out=counts)
+        np.clip(counts, self.lower, self.upper, out=counts)
+        counts -= self.lower
+        counts /= self.span
+        counts *= self.gain
+        counts -= self.shift
+        counts *= self.encoder_max
+        return tuple(counts.astype(int).tolist())
+
+
+class SerialWriter(object):
+    """
+    Write servo command frames to serial ports from a background thread
+
+    Frames are submitted as tuples of integers and written as '<v1,v2,...>\\n'.  Only the latest frame for each port is
+    kept, a frame equal to the last one submitted for that port is dropped, and each port is written at most once
+    every min_interval seconds.  submit() never blocks on the serial port
+    """
+    def __init__(self, pi, min_interval=0.02):
+        self.pi = pi
+        self.min_interval = min_interval
+        self.__pending = {}  # serial handle: frame waiting to be written
+        self.__last_frame = {}  # serial handle: last frame submitted
+        self.__last_write = {}  # serial handle: time of last write
+        self.__condition = threading.Condition()
+        self.__running = True
+        self.__thread = threading.Thread(target=self.run, name='ServoSerialWriter', daemon=True)
+        self.__thread.start()
+
+    def submit(self, handle, frame):
+        """ Queue a frame for the serial handle.  Returns False if the frame is unchanged and was dropped """
+        with self.__condition:
+            if self.__last_frame.get(handle) == frame:
+                return False
+            self.__last_frame[handle] = frame
+            self.__pending[handle] = frame
+            self.__condition.notify()
+        return True
+
+    def run(self):
+        while True:
+            with self.__condition:
+                ready = None
+                while self.__running:
+                    now = time.monotonic()
+                    ready = {handle: frame for handle, frame in self.__pending.items()
+                             if now - self.__last_write.get(handle, -np.inf) >= self.min_interval}
+                    if ready:
+                        break
+                    if self.__pending:
+                        # rate limited, wait for the first port to become available
+                        delay = min(self.__last_write[handle] + self.min_interval for handle in self.__pending) - now
+                        self.__condition.wait(delay)
+                    else:
+                        self.__condition.wait()
+                if not self.__running:
+                    return
+                for handle in ready:
+                    del self.__pending[handle]
+                    self.__last_write[handle] = now
+
+            for handle, frame in ready.items():
+                msg = ','.join(map(str, frame))
+                logging.debug('Servo serial {} JointCmd: {}'.format(handle, msg))
+                try:
+                    self.pi.serial_write(handle, "<%s>\n" % msg)
+                except Exception as e:
+                    logging.warning('Servo serial write failed: {}'.format(e))
+
+    def close(self):
+        with self.__condition:
+            self.__running = False
+            self.__condition.notify()
+        self.__thread.join(timeout=1.0)
+
+
 class Servo(DataSink):
     """
         % Left
@@ -112,6 +222,7 @@ class Servo(DataSink):
         self.pi = pigpio.pi()
         self.serial = self.pi.serial_open("/dev/serial0", 115200)
         self.serial2 = self.pi.serial_open("/dev/ttyAMA1", 115200)
+        self.writer = SerialWriter(self.pi, get_user_config_var('Servo.serial_min_interval', 0.02))
 
         self.offsets = [
             [MplId.INDEX_MCP, MplId.INDEX_PIP, MplId.INDEX_DIP],
@@ -140,10 +251,17 @@ class Servo(DataSink):
         logging.info("Encoder maxs: " + str(self.encoder_maxs))
         #self.servo_joint_limits.append(get_user_config_var(MplId(joint).name+'_LIMITS', (0.0, 100.0)))
 
+        # Wrist rotation spans from -max to max instead of 0 to max like the other joints
+        self.servo_map = ServoMap(self.offsets, self.limits, self.encoder_maxs, bipolar=(5,))
+
+        # Buffers reused on every send_joint_angles call
+        self.__joint_angles = np.zeros(MplId.NUM_JOINTS)
+        self.__packet = np.zeros(MplId.NUM_JOINTS, dtype='<f4')
+
     def load_config_parameters(self):
         # Load parameters from xml config file
 
-        self.joint_offset = [0.0] * MplId.NUM_JOINTS
+        self.joint_offset = np.zeros(MplId.NUM_JOINTS)
         for i in range(MplId.NUM_JOINTS):
             self.joint_offset[i] = np.deg2rad(get_user_config_var(MplId(i).name + '_OFFSET', 0.0))
 
@@ -184,7 +302,8 @@ class Servo(DataSink):
 
         send_joint_angles
 
-        encode and transmit MPL joint angles to unity using command port
+        encode and transmit MPL joint angles to the servo serial ports and to unity using command port.
+        Serial frames are written by a background SerialWriter only when the encoder values change
 
         :param values:
          Array of joint angles in radians.  Ordering is specified in mpl.JointEnum
@@ -207,60 +326,30 @@ class Servo(DataSink):
 
         if len(values) == 7:
             # Only upper arm angles passed.  Use zeros for hand angles
-            values = values + 20 * [0.0]
+            self.__joint_angles[7:] = 0.0
         elif len(values) != MplId.NUM_JOINTS:
             logging.info('Invalid command size for send_joint_angles(): len=' + str(len(values)))
             return
 
         # Apply joint offsets if needed
-        values = np.array(values) + self.joint_offset
-        rad_to_deg = 57.2957795  # 180/pi
-        degs = [int(angle*rad_to_deg) for angle in values]
-        
-        esp_angles = [0]*8
-        for i, joint in enumerate(self.offsets):
-            for subjoint in joint:
-                esp_angles[i] += degs[subjoint.value]
-            
-            # Bound
-            esp_angles[i] = max(self.limits[i][0], min(self.limits[i][1], esp_angles[i]))
-        
-            # Convert to encoder clicks
-            percent_rotated = (esp_angles[i] - self.limits[i][0]) / (self.limits[i][1] - self.limits[i][0])
-            if i != 5:
-                esp_angles[i] =  percent_rotated * self.encoder_maxs[i]
-            else: # Wrist rotation
-                # We assume that the rotation spans from -max to max instead of 0 to max like the other joints
-                esp_angles[i] = (2*percent_rotated - 1)*self.encoder_maxs[i]
-
-        esp1 = esp_angles[:5]
-
-        wrist_rot, wrist_fe, thumb_ab_ad = esp_angles[5:] #TODO: Use me
+        angles = self.__joint_angles
+        angles[:len(values)] = values
+        angles += self.joint_offset
+
+        esp_angles = self.servo_map.encode(angles)
+
+        wrist_rot, wrist_fe, thumb_ab_ad = esp_angles[5:]
         # The ESP expects <rot left, rot right, thumb ab ad>, where flexion is achieved through
         #   setting both rotations to positive.
-        esp2 = [0]*3
-        logging.info("Raw esp2 data: " + str(esp_angles[5:]))
-        if(wrist_rot < 0): # Rotate left
-            esp2[0] -= wrist_rot
-        else: # Rotate right
-            esp2[1] += wrist_rot
-        
-        esp2[0] = max(wrist_fe, esp2[0])
-        esp2[1] = max(wrist_fe, esp2[1])
-        esp2[2] = thumb_ab_ad
+        esp2 = (max(wrist_fe, -wrist_rot, 0), max(wrist_fe, wrist_rot, 0), thumb_ab_ad)
+
+        # Send data.  Frames are only written when the encoder values change
+        self.writer.submit(self.serial, tuple(esp_angles[:5]))
+        self.writer.submit(self.serial2, esp2)
 
-        # Send data
-        fmnt = lambda angle: str(int(angle))
-        msg1 = ','.join(map(fmnt, esp1))
-        msg2 = ",".join(map(fmnt, esp2))
-        logging.debug('ESP1 JointCmd: ' + msg1)  # 60 us
-        logging.debug('ESP2 JointCmd: ' + msg2)
-        self.pi.serial_write(self.serial, "<%s>\n" % msg1)
-        self.pi.serial_write(self.serial2, "<%s>\n" % msg2)
-        
         # Old code I'm putting back to unbreak mpl
-        packer = struct.Struct('27f')
-        packed_data = packer.pack(*values)
+        self.__packet[:] = angles
+        packed_data = self.__packet.tobytes()
 
         (addr, port) = get_address(self.remote_address)
 
@@ -272,7 +361,6 @@ class Servo(DataSink):
         else:
            print('Socket disconnected')
 
-
     def send_config_command(self, enable=0.0, color=(0.3, 0.4, 0.5), alpha=0.8):
         """
 
@@ -337,7 +425,9 @@ class Servo(DataSink):
 
     def close(self):
         logging.info("Closing Unity Socket @ {}".format(self.remote_address))
+        self.writer.close()
         self.pi.serial_close(self.serial)
+        self.pi.serial_close(self.serial2)
         self.transport.close()
 
 async def run_loop(sender):
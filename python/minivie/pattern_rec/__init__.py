@@ -9,6 +9,7 @@ from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
 import csv
 import logging
 import threading
+from collections import Counter
 import numpy as np
 from utilities.user_config import get_user_config_var
 
@@ -36,34 +37,46 @@ class FeatureExtract(object):
 
     """
     def __init__(self):
-        self.input_source = 0
         self.normalized_orientation = None
         self.attached_features = []
+        # feature index order that applies normalized_orientation, cached for the channel layout it was built for
+        self.orientation_permutation = None
+        self.orientation_key = None
 
-    def get_features(self, data_input):
+    def get_features(self, data_input, merge=None):
         """
         perform feature extraction
 
         this method supports numpy ndarray types in which features are computed directly and SignalSource objects in
         which the source's get data method is called, then features are extracted
 
+        If a merge stage (inputs.signal_merge.SignalMerge) of the sources is given, features are computed once over
+        its aligned [nSamples by nTotalChannels] frame instead of per source
+
         """
-        self.input_source = 0
         if data_input is None:
             # Can't get features
             return None, None, None, None
         elif isinstance(data_input, np.ndarray):
             # Extract features from the data provided
             f = self.feature_extract(data_input)
+            channel_counts = (data_input.shape[1],)
             imu = None
             rot_mat = None
         else:
             # input is a data source so call it's get_data method
 
             # Get features from emg data
-            f = np.array([])
-            for s in data_input:
-                f = np.append(f, self.feature_extract(s.get_data()*0.01))
+            if merge is not None:
+                f = self.feature_extract(merge.get_data() * 0.01)
+                channel_counts = tuple(sl.stop - sl.start for sl in merge.channel_slices)
+            else:
+                f = np.array([])
+                channel_counts = ()
+                for s in data_input:
+                    y = s.get_data()
+                    f = np.append(f, self.feature_extract(y*0.01))
+                    channel_counts += (y.shape[1],)
 
             imu = np.array([])
             for s in data_input:
@@ -85,16 +98,51 @@ class FeatureExtract(object):
                 else:
                     rot_mat = None
 
+        f = np.ravel(f)
+
+        # normalize features.  Rotating the channels of each source is a reordering of the feature vector
+        if self.normalized_orientation is not None:
+            f = f[self.get_orientation_permutation(channel_counts, f.size)]
+
         feature_list = f.tolist()
 
         # format the data in a way that sklearn wants it
-        f = np.squeeze(f)
         feature_learn = f.reshape(1, -1)
 
         return feature_list, feature_learn, imu, rot_mat
 
     def normalize_orientation(self, orientation):
         self.normalized_orientation = orientation
+        self.orientation_permutation = None
+        self.orientation_key = None
+
+    def get_orientation_permutation(self, channel_counts, num_values):
+        """
+        Return the feature index order that rotates the channels of each source by normalized_orientation
+
+        Features are ordered channel by channel, so a rotation of k channels within a source moves the features of
+        channel c to channel c + k.  The index is computed once for each channel layout and reused every update
+
+        :param channel_counts: number of channels of each source, in feature vector order
+        :param num_values: total length of the feature vector
+        """
+        key = (tuple(channel_counts), num_values)
+        if key == self.orientation_key:
+            return self.orientation_permutation
+
+        num_features = num_values // sum(channel_counts)
+        orientation = list(self.normalized_orientation) + [0] * (len(channel_counts) - len(self.normalized_orientation))
+
+        channel_order = []
+        start = 0
+        for num_channels, shift in zip(channel_counts, orientation):
+            channel_order.extend(start + (np.arange(num_channels) - shift) % num_channels)
+            start += num_channels
+        permutation = (np.array(channel_order)[:, None] * num_features + np.arange(num_features)).ravel()
+
+        self.orientation_permutation = permutation
+        self.orientation_key = key
+        return permutation
 
     def attach_feature(self, instance):
 
@@ -143,14 +191,6 @@ class FeatureExtract(object):
         # [ch1f1, ch1f2, ch1f3, ch1f4, ch2f1, ch2f2, ch2f3, ch2f4, ... chNf4]
         """
 
-        # normalize features
-        if self.normalized_orientation is not None:
-            # normalize incoming data according to myo
-            y = np.roll(y, self.normalized_orientation[self.input_source])
-
-        # update input source (ex. myo)
-        self.input_source += 1
-
         features_array = []
 
         # loops through instances and extracts features
@@ -259,6 +299,34 @@ class Classifier:
 
         return decision_id, status_msg
 
+    def predict_proba(self, features):
+        """
+
+        Call the classifier probability estimate with error checking
+
+        returns array of probabilities indexed by class id (0 for untrained classes) and status message
+
+        """
+        import logging
+
+        if self.classifier is None or features is None:
+            return None, 'UNTRAINED'
+
+        if not features.any():
+            return None, 'NO_DATA'
+
+        try:
+            # sklearn returns one column for each trained class, in the order of classifier.classes_
+            proba = self.classifier.predict_proba(features)[0]
+        except ValueError as e:
+            logging.warning('Unable to classify. Error was: ' + str(e))
+            return None, 'ERROR'
+
+        classes = self.classifier.classes_
+        probabilities = np.zeros(max(len(self.TrainingData.motion_names), classes.max() + 1))
+        probabilities[classes] = proba
+        return probabilities, 'RUNNING'
+
 
 class TrainingData:
     """Python Class for managing machine learning and Myo training operations."""
@@ -314,6 +382,7 @@ class TrainingData:
         self.time_stamp = []
         self.imu = []
         self.num_samples = 0
+        self.totals = Counter()  # Number of samples per class id, maintained as data is added or removed
 
         self.reset()
 
@@ -327,6 +396,7 @@ class TrainingData:
             self.name = []  # Name of each class
             self.time_stamp = []
             self.num_samples = 0
+            self.totals = Counter()
 
     def clear(self, motion_id):
         # Remove the class data for the matching index
@@ -344,6 +414,7 @@ class TrainingData:
                 del(self.imu[rev])
                 del(self.data[rev])
                 self.num_samples -= 1
+            self.totals[motion_id] = 0
 
         if self.num_samples == 0:
             self.reset()
@@ -367,6 +438,27 @@ class TrainingData:
             self.data.append(data_)
             self.imu.append(imu_)
             self.num_samples += 1
+            self.totals[id_] += 1
+
+    def add_batch(self, data_, id_, name_, imu_=None, time_stamp_=None):
+        # Add a list of samples of one class with a single lock
+        # imu_ and time_stamp_ are optional lists with one entry per sample
+        num_new = len(data_)
+        if num_new == 0:
+            return
+        if imu_ is None:
+            imu_ = [-1] * num_new
+        if time_stamp_ is None:
+            time_stamp_ = [time.time()] * num_new
+
+        with self.__lock:
+            self.time_stamp.extend(time_stamp_)
+            self.name.extend([name_] * num_new)
+            self.id.extend([id_] * num_new)
+            self.data.extend(data_)
+            self.imu.extend(imu_)
+            self.num_samples += num_new
+            self.totals[id_] += num_new
 
     def get_totals(self, motion_id=None):
         # Return a list of the total sample counts for each class
@@ -378,10 +470,10 @@ class TrainingData:
         if motion_id is None:
             total = [0] * num_motions
             for c_ in range(num_motions):
-                total[c_] = self.id.count(c_)
+                total[c_] = self.totals[c_]
                 logging.debug('{} [{}]'.format(self.motion_names[c_],total[c_]))
         else:
-            total = self.id.count(motion_id)
+            total = self.totals[motion_id]
 
         return total
 
@@ -425,6 +517,7 @@ class TrainingData:
                 self.time_stamp = time_stamp
                 self.imu = imu
                 self.num_samples = num_samples
+                self.totals = Counter(id)
 
                 # self.motion_names = motion_name
         else:
@@ -0,0 +1,208 @@
+"""
+Smoothing of classifier decisions over recent updates
+
+Each strategy takes the raw class decision of an update (and the class probabilities, if it uses them) and
+returns the smoothed decision.  All state is preallocated and updated incrementally, so the cost of an update
+does not depend on the number of votes.
+
+    MajorityVote - most frequent decision over the last num_votes updates (rest is passed immediately)
+    PosteriorAverage - most probable class of the class probabilities averaged over the last num_votes updates
+    OnsetGate - majority vote, but a change to a new movement must persist for onset_count updates (hysteresis)
+
+Usage:
+    smoother = create_smoother(motion_names)  # strategy selected by PatternRec.smoothing
+    decision_id = smoother.update(decision_id, probabilities)
+
+"""
+
+import numpy as np
+from utilities.user_config import get_user_config_var
+
+
+class DecisionRing(object):
+    """
+    Fixed length ring of class ids with a histogram of the ring contents
+
+    push() replaces the oldest entry and updates the histogram and the current mode in place.  The mode is only
+    rescanned when the oldest entry was a vote for the mode.  Ties keep the current mode
+    """
+
+    def __init__(self, length, num_classes=0):
+        self.length = max(int(length), 1)
+        self.ids = np.zeros(self.length, dtype=np.intp)
+        self.histogram = np.zeros(max(num_classes, 1), dtype=np.intp)
+        self.index = 0
+        self.count = 0
+        self.mode = None
+
+    def reset(self):
+        self.histogram[:] = 0
+        self.index = 0
+        self.count = 0
+        self.mode = None
+
+    def push(self, class_id):
+        """ Add a class id and return the most frequent id in the ring """
+        if class_id >= self.histogram.size:
+            self.histogram = np.concatenate((self.histogram, np.zeros(class_id + 1 - self.histogram.size, np.intp)))
+
+        hist = self.histogram
+        rescan = False
+        if self.count == self.length:
+            oldest = self.ids[self.index]
+            hist[oldest] -= 1
+            rescan = oldest == self.mode
+        else:
+            self.count += 1
+
+        self.ids[self.index] = class_id
+        self.index = (self.index + 1) % self.length
+        hist[class_id] += 1
+
+        if rescan:
+            best = int(np.argmax(hist))
+            if hist[best] > hist[self.mode]:
+                self.mode = best
+        if self.mode is None or hist[class_id] > hist[self.mode]:
+            self.mode = class_id
+        return self.mode
+
+
+class MajorityVote(object):
+    """ Majority vote over the last num_votes decisions.  A rest decision is passed immediately to stop motion """
+
+    use_probabilities = False
+
+    def __init__(self, num_votes=25, rest_id=0, num_classes=0):
+        self.rest_id = rest_id
+        self.ring = DecisionRing(num_votes, num_classes)
+
+    def reset(self):
+        self.ring.reset()
+
+    def update(self, decision_id, probabilities=None):
+        mode = self.ring.push(decision_id)
+        if decision_id == self.rest_id:
+            return decision_id
+        return mode
+
+
+class PosteriorAverage(object):
+    """
+    Average the class probabilities over the last num_votes updates and return the most probable class
+
+    The running sum is updated by subtracting the oldest probability vector and adding the newest.  A rest
+    decision is passed immediately
+    """
+
+    use_probabilities = True
+
+    def __init__(self, num_votes=25, rest_id=0, num_classes=0):
+        self.rest_id = rest_id
+        self.length = max(int(num_votes), 1)
+        self.num_classes = num_classes
+        self.ring = None
+        self.total = None
+        self.index = 0
+        self.count = 0
+
+    def reset(self):
+        self.ring = None
+        self.total = None
+        self.index = 0
+        self.count = 0
+
+    def update(self, decision_id, probabilities=None):
+        if probabilities is None:
+            return decision_id
+
+        if self.ring is None or self.ring.shape[1] != probabilities.size:
+            # (re)allocate for the number of classes
+            self.ring = np.zeros((self.length, probabilities.size))
+            self.total = np.zeros(probabilities.size)
+            self.index = 0
+            self.count = 0
+
+        row = self.ring[self.index]
+        if self.count == self.length:
+            self.total -= row
+        else:
+            self.count += 1
+        row[:] = probabilities
+        self.total += row
+        self.index = (self.index + 1) % self.length
+
+        if decision_id == self.rest_id:
+            return decision_id
+        return int(np.argmax(self.total))
+
+
+class OnsetGate(object):
+    """
+    Majority vote with hysteresis on movement onset
+
+    The output only changes to a new movement class once the vote has favored it for onset_count consecutive
+    updates, which suppresses brief misclassifications at the start of a motion.  A rest decision is passed
+    immediately
+    """
+
+    use_probabilities = False
+
+    def __init__(self, num_votes=25, rest_id=0, num_classes=0, onset_count=3):
+        self.rest_id = rest_id
+        self.onset_count = onset_count
+        self.ring = DecisionRing(num_votes, num_classes)
+        self.output = rest_id
+        self.candidate = None
+        self.candidate_count = 0
+
+    def reset(self):
+        self.ring.reset()
+        self.output = self.rest_id
+        self.candidate = None
+        self.candidate_count = 0
+
+    def update(self, decision_id, probabilities=None):
+        mode = self.ring.push(decision_id)
+        if decision_id == self.rest_id:
+            self.output = decision_id
+            self.candidate = None
+            return decision_id
+
+        if mode == self.output:
+            self.candidate = None
+        elif mode == self.candidate:
+            self.candidate_count += 1
+            if self.candidate_count >= self.onset_count:
+                self.output = mode
+                self.candidate = None
+        else:
+            self.candidate = mode
+            self.candidate_count = 1
+            if self.onset_count <= 1:
+                self.output = mode
+                self.candidate = None
+        return self.output
+
+
+def create_smoother(motion_names, strategy=None, num_votes=None):
+    """
+    Create the decision smoother selected in the user config
+
+        PatternRec.smoothing - 'majority' (default), 'posterior', or 'onset'
+        PatternRec.num_majority_votes - number of updates to smooth over
+        PatternRec.onset_count - updates a new movement must persist for (onset strategy)
+    """
+    if strategy is None:
+        strategy = get_user_config_var('PatternRec.smoothing', 'majority')
+    if num_votes is None:
+        num_votes = get_user_config_var('PatternRec.num_majority_votes', 25)
+
+    rest_id = motion_names.index('No Movement') if 'No Movement' in motion_names else None
+    num_classes = len(motion_names)
+
+    if strategy == 'posterior':
+        return PosteriorAverage(num_votes, rest_id, num_classes)
+    elif strategy == 'onset':
+        return OnsetGate(num_votes, rest_id, num_classes, get_user_config_var('PatternRec.onset_count', 3))
+    return MajorityVote(num_votes, rest_id, num_classes)
@@ -12,7 +12,10 @@ import tornado.web
 import tornado.websocket
 import tornado.template
 from pattern_rec.training_interface import TrainingInterface
+import json
+import time
 import logging
+import threading
 from utilities.user_config import get_user_config_var
 
 
@@ -146,13 +149,16 @@ class TrainingManagerWebsocket(TrainingInterface):
 
         self.last_msg = message_history
 
-        # keep count of skipped messages so we can send at some nominal rate
-        self.msg_skip_count = 0
+        # Outbound messages are coalesced and sent to clients at the ui frame rate rather than from the control loop
+        self.bus = MessageBus(self.last_msg,
+                              frame_rate=get_user_config_var('MobileApp.frame_rate', 15.0),
+                              slow_client_timeout=get_user_config_var('MobileApp.slow_client_timeout', 5.0))
 
         self.thread = tornado.ioloop.IOLoop.instance
 
     def setup(self, port=9090):
         self.application.listen(port)
+        self.bus.start()
 
     def add_message_handler(self, func):
         # attach a function to receive commands from websocket
@@ -161,39 +167,118 @@ class TrainingManagerWebsocket(TrainingInterface):
             func_handle.append(func)
 
     def send_message(self, msg_id, msg):
-        # send message but only when the string changes (or timeout occurs)
+        # queue message to be sent on the next frame, but only when the string changes
+        self.bus.publish(msg_id, msg)
 
-        if not self.last_msg[msg_id] == msg:
-            self.last_msg[msg_id] = msg
-            try:
-                logging.debug(msg_id + ':' + msg)
-                for ws in wss:
-                    ws.write_message(msg_id + ':' + msg)
+    def close(self):
+        self.bus.stop()
 
-            except Exception as e:
-                logging.error(e)
 
-            return
-        else:
-            self.msg_skip_count += 1
+class MessageBus(object):
+    """
+    Outbound message queue for websocket clients
 
-        # add a timeout so that we get 'some' messages as a nominal rate
-        if self.msg_skip_count > 500:
+    publish() only records the latest value for each message id, so it is cheap to call from the control loop.
+    A periodic callback on the tornado ioloop sends all changed values to each client as a single frame:
 
-            # re-send all messages
-            for key, val in self.last_msg.items():
-                try:
-                    logging.debug(key + ':' + val)
-                    for ws in wss:
-                        ws.write_message(key + ':' + val)
-                except Exception as e:
-                    logging.error(e)
+        batch:{"msg_id": "msg", ...}
 
-            # reset counter
-            self.msg_skip_count = 0
+    A client that has not finished receiving its previous frame is skipped (and later sent a full snapshot of all
+    values) rather than queuing more data.  Clients that stay blocked longer than slow_client_timeout are closed.
+    Newly connected clients receive a full snapshot on the next frame.
+    """
 
-    def close(self):
-        pass
+    def __init__(self, last_msg=None, frame_rate=15.0, slow_client_timeout=5.0):
+        # latest value of every message id
+        self.last_msg = {} if last_msg is None else last_msg
+        # message ids changed since the last frame, with their latest value
+        self.pending = {}
+        self.lock = threading.Lock()
+
+        self.frame_rate = frame_rate
+        self.slow_client_timeout = slow_client_timeout
+
+        # per client state {ws: {'future', 'snapshot', 'blocked_since'}}
+        self.clients = {}
+        self.num_frames = 0
+        self.num_skipped = 0
+        self.num_dropped_clients = 0
+
+        self.periodic_callback = None
+
+    def start(self):
+        """ Begin sending frames from the tornado ioloop """
+        self.periodic_callback = tornado.ioloop.PeriodicCallback(self.flush, 1000.0 / self.frame_rate)
+        self.periodic_callback.start()
+
+    def stop(self):
+        if self.periodic_callback is not None:
+            self.periodic_callback.stop()
+            self.periodic_callback = None
+
+    def publish(self, msg_id, msg):
+        """ Set the latest value of a message.  Unchanged values are ignored """
+        with self.lock:
+            if self.last_msg.get(msg_id) == msg:
+                return
+            self.last_msg[msg_id] = msg
+            self.pending[msg_id] = msg
+
+    def flush(self):
+        """ Send changed messages to all clients as one frame per client """
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+            snapshot = None
+
+        # forget clients that have disconnected
+        for ws in [ws for ws in self.clients if ws not in wss]:
+            del self.clients[ws]
+
+        frame = None
+        for ws in list(wss):
+            client = self.clients.get(ws)
+            if client is None:
+                client = self.clients[ws] = {'future': None, 'snapshot': True, 'blocked_since': None}
+
+            if client['future'] is not None and not client['future'].done():
+                # previous frame still being written.  Skip and send everything once the client catches up
+                self.num_skipped += 1
+                client['snapshot'] = True
+                if client['blocked_since'] is None:
+                    client['blocked_since'] = time.monotonic()
+                elif time.monotonic() - client['blocked_since'] > self.slow_client_timeout:
+                    logging.warning('Closing slow websocket client')
+                    self.num_dropped_clients += 1
+                    del self.clients[ws]
+                    if ws in wss:
+                        wss.remove(ws)
+                    ws.close()
+                continue
+            client['blocked_since'] = None
+
+            if client['snapshot']:
+                if snapshot is None:
+                    with self.lock:
+                        snapshot = 'batch:' + json.dumps(self.last_msg)
+                data = snapshot
+                client['snapshot'] = False
+            elif pending:
+                if frame is None:
+                    frame = 'batch:' + json.dumps(pending)
+                data = frame
+            else:
+                continue
+
+            try:
+                client['future'] = ws.write_message(data)
+            except tornado.websocket.WebSocketClosedError:
+                client['future'] = None
+            except Exception as e:
+                logging.error(e)
+                client['future'] = None
+
+        self.num_frames += 1
 
 
 class TrainingManagerSpacebrew(TrainingInterface):
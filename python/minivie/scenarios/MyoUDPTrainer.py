@@ -43,14 +43,11 @@ import sys
 import time
 import math
 import argparse
-import socket
-import errno
+import asyncio
 import random
 import traceback
 import struct
 
-from enum import Enum
-
 # Allow access to minivie packages from current path in scenarios folder
 if os.path.split(os.getcwd())[1] == 'scenarios':
     import sys
@@ -62,12 +59,12 @@ else:
     
 print('Current path: ' + os.path.split(os.getcwd())[1])
     
-from pattern_rec import TrainingData, FeatureExtract, Classifier
+from pattern_rec import TrainingData, FeatureExtract, Classifier, features_selected
 
-from inputs.myo import MyoUdp
-from controls.plant import Plant, class_map
+from inputs.myo_asyncio import MyoUdp
+from controls.plant import Plant
 
-from mpl.unity import UnityUdp
+from mpl.unity_asyncio import UnityUdp
 
 if os.path.split(os.getcwd())[1] == 'scenarios':
     #change directory to minivie
@@ -187,7 +184,7 @@ def main(args):
     {NAK} (\0x15)       "Negative Acknowledge"      **currently unused**
     o                   "counter out of bounds"     (sent when 'tn' or 'tp' is received and counter would progress past -1, or len(classes)) (i.e. counter at start or end of class list)
     q                   "quit (main program)"       Only works if called from the main flow control loop
-    e                   "end (current loop)"        ends the execution of the currently running infinite loop ("predict multiple (infinity)", or "train continuously")
+    e                   "end (current loop)"        ends the currently running training or prediction loop (e.g. "predict multiple (infinity)", or "train continuously")
     
     
     
@@ -243,206 +240,28 @@ def main(args):
 
     print('Running UDP driven trainer. Progress will only continue if proper UDP cues are returned.\n')
 
-    # state machine variable. (Out of date) Same states are mirrored in Unity script.
-    class STATES(Enum):
-        waitingHandshake = 0
-        waitingStart = 1
-        setupRecord = 2
-        waitingRecord = 3
-        recording = 4
-        cooldown = 5
-        inactive = 6
-        off = 7
-        none = 8
-        
-    # initial state is waiting for Handshake from Unity
-    state = STATES.waitingHandshake
-
     # Machine learning Myo UDP trainer controller
     trainer = MyoUDPTrainer(args)
 
-    if not args.DEBUG:
-        # handshake between unity and python
-        trainer.handshake()
-    else:
-        print('Skipping UDP handshake for DEBUG mode.')
+    loop = asyncio.get_event_loop()
+    try:
+        loop.run_until_complete(trainer.run(handshake=not args.DEBUG))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        trainer.close()
 
-    state = STATES.waitingStart
 
-    data, addr = None, None  # current UDP packet received from Unity
-    curPose = 0  # index of the current pose being operated on
+class CommandProtocol(asyncio.DatagramProtocol):
+    """Receive UDP cues for the trainer. Cues are queued in arrival order and handled by MyoUDPTrainer.run()"""
 
-    # handle generic UDP cues
-    print('Start of UDP flow control section.')
-    while data is None or data[0] != ord('q'):  # 'q' UDP cue for "quit"
-        try:
-            print('Waiting for UDP data packet...')
-            
-            data, addr = trainer.receiveBlock()
-            data = bytearray(data)
-            #print out recieved data formatted according to python 2 or 3
-            if sys.version_info[0] == 2:
-                print('Received packet: "' + str(data) + '"')
-            elif sys.version_info[0] == 3:
-                print('Received packet: "' + str(data)[12:-2] + '"')
+    def __init__(self, parent):
+        self.parent = parent
 
-            if len(data) == 0:  # check for empty string
-                data = ' '
-                print('Recieved empty string\n')
-                continue
-            
-            if data[0] == ord('f'):  # file
-                if data[1] == ord('s'):  # save
-                    trainer.save()
-
-                elif data[1] == ord('l'):  # load
-                    trainer.load()
-
-                elif data[1] == ord('d'):  # delete
-                    trainer.delete()
-
-                elif data[1] == ord('c'):  # copy
-                    trainer.copy()
-
-            elif data[0] == ord('c'):  # class (poses)
-                if data[1] == ord('d'):  # defaults (reset to)
-                    trainer.reset()
-                
-                elif data[1] == ord('c'):  # clear
-                    className = data[2:].decode('utf-8')
-                    trainer.clear_class(className)
-                
-                elif data[1] == ord('a'):  # add
-                    className = data[2:].decode('utf-8')
-                    trainer.add_class(className)
-
-                elif data[1] == ord('r'):  # remove
-                    className = data[2:].decode('utf-8')
-                    trainer.remove_class(className)
-                    
-                elif data[1] == ord('f'):  # fit to model
-                    trainer.fit()
-
-            elif data[0] == ord('o'):  # output
-                if data[1] == ord('s'):  # tostring
-                    print(str(trainer))
-
-                elif data[1] == ord('p'):  # plant
-                    trainer.ouput()# output plant. not sure how this would be used...
-                    pass
-
-            elif data[0] == ord('p'):  # predict
-                if data[1] == ord('m'):  # multiple
-                    if len(data) == 3:
-                        trainer.predictMult(data[2])
-                    elif len(data) > 3 and data[2:].decode('utf-8').lower() == 'infinity':
-                        #send UDP cue 'e' to end infinite prediction cycle
-                        trainer.predictMult(-1)
-                    else:
-                        trainer.predictMult()  # use settings in object
-
-                elif data[1] == ord('s'):  # single
-                    id, status = trainer.predictSingle()  
-                    print(trainer.TrainingData.motion_names[id])
-                    print(status)
+    def datagram_received(self, data, addr):
+        self.parent.receive_command(bytearray(data), addr)
 
-            elif data[0] == ord('t'):  # train 
-            #(handles sequence for training poses, e.g. progressing to next pose, training current pose, etc.)
-                
-                if data[1] == ord('a'):  # all poses
-                    if len(data) >= 3:
-                        cycles = 1 if len(data) == 3 else data[3]
-                        trainer.trainAll(data[2], cycles)
-                    else:
-                        trainer.trainAll()
-
-                elif data[1] == ord('s'):  # single pose
-                    if len(data) >= 3:
-                        trainer.trainSingle(curPose, samples=data[2], pause=0)
-                    else:
-                        trainer.trainSingle(curPose, pause=0)
-                
-                elif data[1] == ord('r'):  # start recording current pose
-                    #send UDP 'e' to end recording
-                    trainer.trainContinuous(curPose)
-
-                elif data[1] == ord('n'):  # (goto) next pose
-                    if curPose + 1 < len(trainer.TrainingData.motion_names):
-                        curPose += 1
-                        print('Current pose set to "' + trainer.TrainingData.motion_names[curPose] + '."\n')
-                        trainer.send(trainer.TrainingData.motion_names[curPose])
-                    else:
-                        # curPose = 0  #may want to delete this line
-                        print('Already at last pose "' + trainer.TrainingData.motion_names[curPose] + '."\n')
-                        trainer.send('o')  # pose overflow
-
-                elif data[1] == ord('p'):  # (goto) previous pose
-                    if curPose > 0:
-                        curPose -= 1
-                        print('Current pose set to "' + trainer.TrainingData.motion_names[curPose] + '."\n')
-                        trainer.send(trainer.TrainingData.motion_names[curPose])
-                    else:
-                        # curPose = len(trainer.TrainingData.motion_names) - 1 #may want to delete this line.
-                        print('Already at first pose "' + trainer.TrainingData.motion_names[curPose] + '."\n')
-                        trainer.send('o')
-
-                elif data[1] == ord('f'):  # (goto) first pose
-                    curPose = 0
-                    print('Current pose set to "' + trainer.TrainingData.motion_names[curPose] + '."\n')
-                    trainer.send(trainer.TrainingData.motion_names[curPose])
-
-                elif data[1] == ord('l'):  # (goto) last pose
-                    curPose = len(trainer.TrainingData.motion_names) - 1
-                    print('Current pose set to "' + trainer.TrainingData.motion_names[curPose] + '."\n')
-                    trainer.send(trainer.TrainingData.motion_names[curPose])
-
-            elif data[0] == ord('g'):  # get (over UDP)
-                
-                if data[1] == ord('c'):  # current pose
-                    trainer.send(trainer.TrainingData.motion_names[curPose])
-                    print('')
-
-                elif data[1] == ord('i'):  # index of current pose
-                    trainer.send(struct.pack('B', curPose))
-                    print('')
-                    
-                elif data[1] == ord('n'):  # number of poses
-                    trainer.send(struct.pack('B', len(trainer.TrainingData.motion_names)))
-                    print('')
-                    
-                elif data[1] == ord('s'):  # saved data exists?
-                    trainer.send(str(trainer.checkSaved()).lower())
-                    print('')
-            
-            
-            
-            elif data[0] == ord('q'):       # quit the UDP loop
-                print('Quit signal recieved.')
-
-            else:
-                print('Unrecognized data packet. Restarting control loop.\n')
-
-        # error handling
-        except Exception as err:  # print the exception, and continue running UDP flow control loop
-            try:
-                exc_info = sys.exc_info()
-            finally:
-                print('\nError occured in execution loop.')
-                traceback.print_exception(*exc_info)
-                print('')
-                del exc_info
-    
-    # End of UDP flow control loop
-
-    print('Exiting UDP flow control section.\n')
 
-    trainer.close()
-    # print('\nEnding program in 5 seconds...')
-    # time.sleep(5)
-    
-    pass
-
-        
 class MyoUDPTrainer:
     """Python Class for managing machine learning and Myo training operations."""
     
@@ -450,6 +269,7 @@ class MyoUDPTrainer:
         
         self.TrainingData = TrainingData()
         self.FeatureExtract = FeatureExtract()
+        features_selected.FeaturesSelected(self.FeatureExtract).create_instance_list()
         self.Classifier = None
         
         #Not implemented in pattern_rec.TrainingData class
@@ -464,31 +284,289 @@ class MyoUDPTrainer:
         self.pcycles = args.PREDICT         # how many cycles to predict for. setting to -1 means infinite cycles
         self.hMyo = MyoUdp()                # Signal Source get external bio-signal data
         self.hMyo.connect()
+        self.SignalSource = [self.hMyo]
         self.ROCPath = '../../WrRocDefaults.xml'    # Path to ROC file for plant
         self.Plant = Plant(self.dt, self.ROCPath)   # Plant maintains current limb state (positions) during control
         self._MyoUDPTrainer__gain_value = 1         # Not sure about what this line does. Got an error from the plant without it though
         self._MyoUDPTrainer__hand_gain_value = 1    # Same deal as above
         self.class_decision = 0     
         self.DataSink = UnityUdp()  # ("192.168.1.24")     # Sink is output to ouside world (in this case to VIE)
+        self.DataSink.connect()
         
         self.UDP_IP = args.UDP_IP                   # IP address to communicate with unity through (directed to localhost).
         self.PYTHON_SEND_PORT = args.PYTHON_PORT    # from python send data to unity using this port
         self.UNITY_RECEIVE_PORT = args.UNITY_PORT   # from unity receive data in python using this port
 
-        # UDP communication to and from Unity
-        self.UnityReceiverSock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.UnityReceiverSock.bind((self.UDP_IP, self.UNITY_RECEIVE_PORT))
-        self.UnityReceiverSock.setblocking(0)
-        # https://docs.python.org/2/library/socket.html consider settimeout(<small number>) instead of disabling blocking
+        # UDP communication to and from Unity.  The command endpoint is opened in run()
+        self.transport = None
+        self.commands = asyncio.Queue()     # received (data, addr) cues waiting to be handled
+        self.task = None                    # currently running training or prediction loop
+        self.curPose = 0                    # index of the current pose being operated on
+
+    async def run(self, handshake=True):
+        """
+        Receive UDP cues and handle them in order until the 'q' cue is received.
+
+        Training and prediction loops run as tasks so that the 'e' cue can end them. Other cues received while a
+        loop is running are handled once it ends.
+
+        Keyword Arguments:
+        self -- pointer to this object
+        handshake -- (Optional) perform the UDP handshake before handling cues
+        """
+
+        loop = asyncio.get_event_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: CommandProtocol(self), local_addr=(self.UDP_IP, int(self.UNITY_RECEIVE_PORT)))
         print('UDP Program Control IP: ' + str(self.UDP_IP))
         print('Listening to Port: ' + str(self.UNITY_RECEIVE_PORT))
-
-        self.PythonSenderSock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        # print('PythonUDP UI IP: ' + str(self.UDP_IP))
         print('Sending to Port: ' + str(self.PYTHON_SEND_PORT))
         print('')
 
-    def trainAll(self, samples=None, cycles=None):
+        if handshake:
+            # handshake between unity and python
+            await self.handshake()
+        else:
+            print('Skipping UDP handshake for DEBUG mode.')
+
+        # handle generic UDP cues
+        print('Start of UDP flow control section.')
+        data = None
+        while data is None or data[0] != ord('q'):  # 'q' UDP cue for "quit"
+            print('Waiting for UDP data packet...')
+            data, addr = await self.commands.get()
+
+            # cues are handled in order, so finish the running loop first
+            if self.task is not None and not self.task.done():
+                await asyncio.wait([self.task])
+
+            print('Received packet: "' + data.decode('utf-8', 'replace') + '"')
+            if len(data) == 0:  # check for empty string
+                print('Recieved empty string\n')
+                continue
+
+            try:
+                self.handle_command(data)
+            except Exception:  # print the exception, and continue running UDP flow control loop
+                print('\nError occured in execution loop.')
+                traceback.print_exc()
+                print('')
+
+        # End of UDP flow control loop
+
+        print('Exiting UDP flow control section.\n')
+
+    def receive_command(self, data, addr):
+        """
+        Queue a UDP cue received by the command endpoint.
+
+        The 'e' (end) and 'q' (quit) cues stop the running training or prediction loop immediately.
+        """
+        if len(data) > 0 and data[0] in (ord('e'), ord('q')) and self.task is not None and not self.task.done():
+            self.task.cancel()
+            if data[0] == ord('e'):
+                return
+        self.commands.put_nowait((data, addr))
+
+    def start_task(self, coro):
+        """Run a training or prediction loop as a task. Only one loop runs at a time"""
+        self.task = asyncio.ensure_future(coro)
+        self.task.add_done_callback(self.task_done)
+
+    def task_done(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            print('\nError occured in execution loop.')
+            traceback.print_exception(type(task.exception()), task.exception(), task.exception().__traceback__)
+            print('')
+
+    def handle_command(self, data):
+        """
+        Handle a single UDP cue (see main() for the list of cues).
+
+        Keyword Arguments:
+        self -- pointer to this object
+        data -- bytearray of the received cue
+        """
+
+        if data[0] == ord('f'):  # file
+            if data[1] == ord('s'):  # save
+                self.save()
+
+            elif data[1] == ord('l'):  # load
+                self.load()
+
+            elif data[1] == ord('d'):  # delete
+                self.delete()
+
+            elif data[1] == ord('c'):  # copy
+                self.copy()
+
+        elif data[0] == ord('c'):  # class (poses)
+            if data[1] == ord('d'):  # defaults (reset to)
+                self.reset()
+
+            elif data[1] == ord('c'):  # clear
+                className = data[2:].decode('utf-8')
+                self.clear_class(className)
+
+            elif data[1] == ord('a'):  # add
+                className = data[2:].decode('utf-8')
+                self.add_class(className)
+
+            elif data[1] == ord('r'):  # remove
+                className = data[2:].decode('utf-8')
+                self.remove_class(className)
+
+            elif data[1] == ord('f'):  # fit to model
+                self.fit()
+
+        elif data[0] == ord('o'):  # output
+            if data[1] == ord('s'):  # tostring
+                print(str(self))
+
+            elif data[1] == ord('p'):  # plant
+                self.output()  # output plant. not sure how this would be used...
+
+        elif data[0] == ord('p'):  # predict
+            if data[1] == ord('m'):  # multiple
+                if len(data) == 3:
+                    self.start_task(self.predictMult(data[2]))
+                elif len(data) > 3 and data[2:].decode('utf-8').lower() == 'infinity':
+                    #send UDP cue 'e' to end infinite prediction cycle
+                    self.start_task(self.predictMult(-1))
+                else:
+                    self.start_task(self.predictMult())  # use settings in object
+
+            elif data[1] == ord('s'):  # single
+                id, status = self.predictSingle()
+                print(self.TrainingData.motion_names[id])
+                print(status)
+
+        elif data[0] == ord('t'):  # train
+        #(handles sequence for training poses, e.g. progressing to next pose, training current pose, etc.)
+
+            if data[1] == ord('a'):  # all poses
+                if len(data) >= 3:
+                    cycles = 1 if len(data) == 3 else data[3]
+                    self.start_task(self.trainAll(data[2], cycles))
+                else:
+                    self.start_task(self.trainAll())
+
+            elif data[1] == ord('s'):  # single pose
+                if len(data) >= 3:
+                    self.start_task(self.trainSingle(self.curPose, samples=data[2], pause=0))
+                else:
+                    self.start_task(self.trainSingle(self.curPose, pause=0))
+
+            elif data[1] == ord('r'):  # start recording current pose
+                #send UDP 'e' to end recording
+                self.start_task(self.trainContinuous(self.curPose))
+
+            elif data[1] == ord('n'):  # (goto) next pose
+                if self.curPose + 1 < len(self.TrainingData.motion_names):
+                    self.curPose += 1
+                    print('Current pose set to "' + self.TrainingData.motion_names[self.curPose] + '."\n')
+                    self.send(self.TrainingData.motion_names[self.curPose])
+                else:
+                    print('Already at last pose "' + self.TrainingData.motion_names[self.curPose] + '."\n')
+                    self.send('o')  # pose overflow
+
+            elif data[1] == ord('p'):  # (goto) previous pose
+                if self.curPose > 0:
+                    self.curPose -= 1
+                    print('Current pose set to "' + self.TrainingData.motion_names[self.curPose] + '."\n')
+                    self.send(self.TrainingData.motion_names[self.curPose])
+                else:
+                    print('Already at first pose "' + self.TrainingData.motion_names[self.curPose] + '."\n')
+                    self.send('o')
+
+            elif data[1] == ord('f'):  # (goto) first pose
+                self.curPose = 0
+                print('Current pose set to "' + self.TrainingData.motion_names[self.curPose] + '."\n')
+                self.send(self.TrainingData.motion_names[self.curPose])
+
+            elif data[1] == ord('l'):  # (goto) last pose
+                self.curPose = len(self.TrainingData.motion_names) - 1
+                print('Current pose set to "' + self.TrainingData.motion_names[self.curPose] + '."\n')
+                self.send(self.TrainingData.motion_names[self.curPose])
+
+        elif data[0] == ord('g'):  # get (over UDP)
+
+            if data[1] == ord('c'):  # current pose
+                self.send(self.TrainingData.motion_names[self.curPose])
+                print('')
+
+            elif data[1] == ord('i'):  # index of current pose
+                self.send(struct.pack('B', self.curPose))
+                print('')
+
+            elif data[1] == ord('n'):  # number of poses
+                self.send(struct.pack('B', len(self.TrainingData.motion_names)))
+                print('')
+
+            elif data[1] == ord('s'):  # saved data exists?
+                self.send(str(self.checkSaved()).lower())
+                print('')
+
+        elif data[0] == ord('e'):       # end (current loop)
+            print('No loop running.\n')
+
+        elif data[0] == ord('q'):       # quit the UDP loop
+            print('Quit signal recieved.')
+
+        else:
+            print('Unrecognized data packet. Restarting control loop.\n')
+
+    async def acquire(self, samples=-1):
+        """
+        Asynchronous generator of features from the current Myo data, one set every self.dt seconds.
+
+        Sample times are scheduled from a fixed deadline so that processing time does not add drift. If a
+        sample is late the schedule restarts from the current time rather than collecting extra samples to catch up.
+
+        Keyword Arguments:
+        self -- pointer to this object
+        samples -- (Optional) number of feature sets to generate. Negative numbers run until cancelled
+
+        Yield Arguments:
+        f_list, f_learn, imu -- feature list, feature array [1 x nFeatures] and imu data
+        """
+
+        deadline = time.perf_counter()
+        i = 0
+        while samples < 0 or i < samples:
+            loopStart = time.perf_counter()
+            f_list, f_learn, imu, rot_mat = self.FeatureExtract.get_features(self.SignalSource)
+            if self.verb >= 2:
+                print('Feature extraction time: ' + str(time.perf_counter() - loopStart) + 's')
+
+            yield f_list, f_learn, imu
+            i += 1
+
+            deadline += self.dt
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                print("Timing Overload")
+                deadline = time.perf_counter()
+                await asyncio.sleep(0)
+
+    def add_training_data(self, classID, batch):
+        """
+        Add a batch of samples of a pose to the training data.
+
+        Keyword Arguments:
+        self -- pointer to this object
+        classID -- class id of the pose
+        batch -- list of (feature list, imu, time stamp) for each sample
+        """
+        if len(batch) == 0:
+            return
+        data, imu, time_stamp = zip(*batch)
+        self.TrainingData.add_batch(data, classID, self.TrainingData.motion_names[classID], imu, time_stamp)
+
+    async def trainAll(self, samples=None, cycles=None):
         """
         Run training regime for all poses sequentially.
         
@@ -506,18 +584,20 @@ class MyoUDPTrainer:
         if samples > 0:
             print('\n\nBeginning training Regime in 5 seconds...')
             print('(Ready for first pose "' + self.TrainingData.motion_names[0] + '"')
-            time.sleep(5)
+            await asyncio.sleep(5)
 
             print('')
             for cycle in list(range(cycles)):
                 print('Training Cycle #' + str(cycle) + '\n')
                 for classNum, className in enumerate(self.TrainingData.motion_names):
-                    self.trainSingle(classNum, samples)
+                    await self.trainSingle(classNum, samples)
         print('Finished training all poses.\n')
     
-    def trainSingle(self, classID, samples=None, pause=3):
+    async def trainSingle(self, classID, samples=None, pause=3):
         """
         Run training regime for single specified pose.
+
+        Samples are added to the training data together once collection ends (or is ended with the 'e' cue).
         
         Keyword Arguments:
         self -- pointer to this object
@@ -526,46 +606,25 @@ class MyoUDPTrainer:
         """
         
         start = time.time()
-        
-        
+
         if samples == None:
             samples = self.tsamples
 
-        className = self.TrainingData.motion_names[classID]
-        
         if self.verb >= 0:
             print('pose: ' + self.TrainingData.motion_names[classID])
-        time.sleep(pause)
+        await asyncio.sleep(pause)
 
         if self.verb == 0:
             print('Collecting EMG samples...')
 
-        for i in list(range(samples)):
-            loopStart = time.time()
-            emgData = self.hMyo.get_data() * 0.01
-            f_list, f_learn = self.FeatureExtract.get_features(emgData)
-            
-            #format for storing data
-            f_list = f_list[0]
-            f_learn = f_learn[0]
-
-            f = f_learn
-            
-            self.TrainingData.add_data(f, classID, className)
-            
-
-            if self.verb >= 1:
-                print('%8.4f %8.4f %8.4f %8.4f' % (f[0], f[8], f[16], f[24]))
-            if self.verb >= 2:
-                print('Get training data loop extraction time: ' + str(time.time() - loopStart) + 's')
-                # if self.verb >= 3:
-                # print('Emg Buffer:\n' + str(emgData))
-
-            loopTime = time.time() - loopStart
-            if loopTime < self.dt:
-                time.sleep(self.dt - loopTime)
-            else:
-                print("Timing Overload")
+        batch = []
+        try:
+            async for f, f_learn, imu in self.acquire(samples):
+                batch.append((f, imu, time.time()))
+                if self.verb >= 1:
+                    print('%8.4f %8.4f %8.4f %8.4f' % (f[0], f[8], f[16], f[24]))
+        finally:
+            self.add_training_data(classID, batch)
 
         if self.verb == 0:
             print('Done.')
@@ -576,33 +635,33 @@ class MyoUDPTrainer:
         if self.verb >= 0:
             print('')
     
-    def trainContinuous(self, classID):
+    async def trainContinuous(self, classID):
         """
-        continuously train the currently set motion until quit signal recieved
-        
+        continuously train the currently set motion until the 'e' (end) cue is received
+
+        Samples are added to the training data in batches of about one second
         """
         
         start = time.time()
-        
-        #set length of pause/number of samples for trainSingle() function
-        samples=1
-        pause=0
-        
         s = 0   #how many samples have been recorded
-        
-        data, addr = None, None  # current UDP packet received from Unity
+        batch_size = max(int(round(1.0 / self.dt)), 1)
+        batch = []
 
-        while data == None or ord(data[0]) != ord('e'):
-            data, addr = self.receiveNoBlock()  # receive UDP data to allow for exiting infinite loop
-            loopStart = time.time()
-            self.trainSingle(classID, samples, pause)
-            s += 1 #update cound of samples recorded
-            
-        if self.verb >= 2:
-            print('Trained ' + self.TrainingData.motion_names[classID] + ' for ' + str(time.time() - start) + 's')
-        if self.verb >= 1:
-            print('Recorded ' + str(s) + ' samples')
-        print('')
+        try:
+            async for f, f_learn, imu in self.acquire():
+                batch.append((f, imu, time.time()))
+                s += 1 #update count of samples recorded
+                if len(batch) >= batch_size:
+                    self.add_training_data(classID, batch)
+                    batch = []
+        finally:
+            self.add_training_data(classID, batch)
+
+            if self.verb >= 2:
+                print('Trained ' + self.TrainingData.motion_names[classID] + ' for ' + str(time.time() - start) + 's')
+            if self.verb >= 1:
+                print('Recorded ' + str(s) + ' samples')
+            print('')
         
     def fit(self):
         """
@@ -627,9 +686,10 @@ class MyoUDPTrainer:
 
         print('')
     
-    def predictMult(self, cycles=None):
+    async def predictMult(self, cycles=None):
         """
         Run the LDA or QDA classifier prediction based on current myo data for multiple cycles.
+        The 'e' (end) cue ends the predictions early.
         
         Keyword Arguments:
         self -- pointer to this object
@@ -640,32 +700,19 @@ class MyoUDPTrainer:
         if cycles == None:
             cycles = self.pcycles
 
-        data, addr = None, None  # current UDP packet received from Unity
-
-        i = 0
-        while i != cycles and (data == None or ord(data[0]) != ord('e')):
-            data, addr = self.receiveNoBlock()  # receive UDP data to allow for exiting infinite loop
-            loopStart = time.time()
-            id, status = self.predictSingle()
-            prediction = self.TrainingData.motion_names[id]
-            if self.verb >= 1:
-                print('prediction: ' + prediction)
-            if self.verb >= 2:
-                print(status)
-                print(('QDA' if self.quadratic else 'LDA') + ' prediction execution time: ' + str(
-                    time.time() - loopStart) + 's')
-
-            #self.output(prediction, True)
-
-            loopTime = time.time() - loopStart
-            if loopTime < self.dt:
-                time.sleep(self.dt - loopTime)
-            else:
-                print("Timing Overload")
-
-            i += 1
-
-        print('')
+        try:
+            async for f, f_learn, imu in self.acquire(cycles):
+                loopStart = time.perf_counter()
+                id, status = self.predict(f_learn)
+                prediction = self.TrainingData.motion_names[id]
+                if self.verb >= 1:
+                    print('prediction: ' + prediction)
+                if self.verb >= 2:
+                    print(status)
+                    print(('QDA' if self.quadratic else 'LDA') + ' prediction execution time: ' + str(
+                        time.perf_counter() - loopStart) + 's')
+        finally:
+            print('')
         
     def predictSingle(self):
         """
@@ -678,9 +725,21 @@ class MyoUDPTrainer:
         id -- class id of predicted pose
         status -- status message from prediction error checking
         """
-        emgData = self.hMyo.get_data() * 0.01
-        f_list, f_learn = self.FeatureExtract.get_features(emgData)
-        
+        f_list, f_learn, imu, rot_mat = self.FeatureExtract.get_features(self.SignalSource)
+        return self.predict(f_learn)
+
+    def predict(self, f_learn):
+        """
+        Classify a feature array and update the plant / output with the decision.
+
+        Keyword Arguments:
+        self -- pointer to this object
+        f_learn -- feature array [1 x nFeatures]
+
+        Return Arguments:
+        id -- class id of predicted pose
+        status -- status message from prediction error checking
+        """
         id, status = self.Classifier.predict(f_learn)
         self.class_decision = id
         self.output(id)
@@ -717,11 +776,11 @@ class MyoUDPTrainer:
         # TODO: add majority vote
 
         # get decision name
-        class_decision = self.TrainingData.motion_names[decision_id]
+        #class_decision = self.TrainingData.motion_names[decision_id]
         #self.output['decision'] = class_decision
 
-        # parse decision type as arm, grasp, etc
-        class_info = class_map(class_decision)
+        # look up decision type as arm, grasp, etc
+        action = self.Plant.get_class_actions(self.TrainingData.motion_names)[decision_id]
 
         # Set joint velocities
         self.Plant.new_step()
@@ -735,17 +794,17 @@ class MyoUDPTrainer:
 
         # set the mapped class into either a hand or arm motion
         #pause_hand = self.is_paused('Hand') or self.is_paused('All')
-        if class_info['IsGrasp']:# and not pause_hand:
+        if action.is_grasp:# and not pause_hand:
             # the motion class is either a grasp type or hand open
-            if class_info['GraspId'] is not None and self.Plant.grasp_position < 0.2:
+            if action.grasp_id is not None and self.Plant.grasp_position < 0.2:
                 # change the grasp state if still early in the grasp motion
-                self.Plant.grasp_id = class_info['GraspId']
-            self.Plant.set_grasp_velocity(class_info['Direction'] * self.__hand_gain_value)
+                self.Plant.grasp_id = action.grasp_id
+            self.Plant.set_grasp_velocity(action.direction * self.__hand_gain_value)
 
         #pause_arm = self.is_paused('Arm') or self.is_paused('All')
-        if not class_info['IsGrasp']:# and not pause_arm:
+        if not action.is_grasp:# and not pause_arm:
             # the motion class is an arm movement
-            self.Plant.set_joint_velocity(class_info['JointId'], class_info['Direction'] * self.__gain_value)
+            self.Plant.set_joint_velocity(action.joint_id, action.direction * self.__gain_value)
 
         self.Plant.update()
 
@@ -959,6 +1018,10 @@ class MyoUDPTrainer:
         print('')
         print('Cleaning up...')
         print('')
+        if self.task is not None:
+            self.task.cancel()
+        if self.transport is not None:
+            self.transport.close()
         self.DataSink.close()
         self.hMyo.close()
 
@@ -968,62 +1031,13 @@ class MyoUDPTrainer:
         
         Keyword Arguments:
         self -- pointer to this object
-        message -- string to send to Unity via UDP
-        """
-        self.PythonSenderSock.sendto(bytearray(message, 'utf-8'), (self.UDP_IP, self.PYTHON_SEND_PORT))
-
-    def receiveNoBlock(self, timeout=0.0):
-        """
-        Receive data from Unity while allowing timeout.
-        
-        Keyword Arguments:
-        self -- pointer to this object
-        timeout -- (Optional) If passed in, sets the amount of time the receiver will wait for before it times out, no data
-        
-        Return Arguments:
-        data, addr -- data string and data address for message received from Unity. Set to None, None if timeout occurs
-        
-        Notes: 
-        for more information see: https://docs.python.org/2/library/socket.html
-        """
-
-        # receiver that will return None, None if it doesn't receive immediately/within timout limit
-        # self.UnityReceiverSock.setblocking(0)
-        self.UnityReceiverSock.settimeout(timeout)
-
-        try:
-            data, addr = self.UnityReceiverSock.recvfrom(1024)  # buffer size is 1024 bytes
-        except socket.error as e:
-            err = e.args[0]
-            if err == errno.EAGAIN or err == errno.EWOULDBLOCK or errno.ETIMEDOUT:
-                return None, None
-            else:
-                # a "real" error occurred
-                print(e)
-                sys.exit(1)
-        else:
-            # do stuff with data from receiver
-            return data, addr
-
-    def receiveBlock(self):
-        """
-        Receive data from Unity while while waiting indefinitely until received.
-        
-        Keyword Arguments:
-        self -- pointer to this object
-        
-        Return Arguments:
-        data, addr -- data string and data address for message received from Unity.
-        
-        Notes: 
-        for more information see: https://docs.python.org/2/library/socket.html
+        message -- string (or bytes) to send to Unity via UDP
         """
+        if isinstance(message, str):
+            message = bytearray(message, 'utf-8')
+        self.transport.sendto(message, (self.UDP_IP, int(self.PYTHON_SEND_PORT)))
 
-        # receiver that will wait until it receives data
-        self.UnityReceiverSock.setblocking(1)
-        return self.UnityReceiverSock.recvfrom(1024)  # buffer size is 1024 bytes
-
-    def handshake(self):
+    async def handshake(self):
         """Perform handshake with Unity over UDP to ensure that Unity and Python are synced"""
 
         # wait to receive data [A] and then send [A+1,B]
@@ -1032,20 +1046,15 @@ class MyoUDPTrainer:
 
         # IMPORTANT NOTE: if A=255, then the expected A+1=0 because only a single byte is checked
 
-        # self.UnityReceiverSock.setblocking(1)
         acquainted = False  # has the handshake been successful
 
         while not acquainted:
             print('Attempting handshake with UDP driver.')
             
-            data = ''
+            data = None
             
             while data is None or len(data) == 0:
-                data, addr = self.receiveBlock()
-                if data is None:
-                    print('Failed handshake. Retrying...\n')
-                    continue
-                data = bytearray(data)
+                data, addr = await self.commands.get()
                 if len(data) == 0:
                     print('Failed handshake. Retrying...\n')
                     continue
@@ -1057,11 +1066,7 @@ class MyoUDPTrainer:
             self.send(str((data[0] + 1) % 256) + ' ' + str(response))
 
             # wait for second response
-            data, addr = self.receiveBlock()
-            if data is None:
-                print('Failed handshake. Retrying...\n')
-                continue
-            data = bytearray(data)
+            data, addr = await self.commands.get()
             if len(data) == 0:
                 print('Failed handshake. Retrying...\n')
                 continue
@@ -1073,7 +1078,6 @@ class MyoUDPTrainer:
                 continue
 
         print('Successful handshake between Unity and Python.\n')
-        self.UnityReceiverSock.setblocking(0)
 
     def __str__(self):
         """
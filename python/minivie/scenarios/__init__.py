@@ -1,17 +1,25 @@
 import logging
 import time
+import functools
+import threading
+import asyncio
 import numpy as np
-from collections import Counter, deque
 import utilities
 import utilities.user_config
 import utilities.sys_cmd
 import mpl
 import controls.plant
 from inputs import daqEMGDevice
-from pattern_rec import features_selected
+from pattern_rec import features_selected, smoothing
 from utilities.user_config import get_user_config_var as get_config_var
 
 
+def _join_values(values, decimals=0):
+    """ Format an array as a comma separated string of values rounded to the given decimal places (nan kept) """
+    fmt = '%.{}f'.format(decimals)
+    return ','.join([fmt % value for value in np.asarray(values, dtype=float).tolist()])
+
+
 class Scenario(object):
     """
     Define the building blocks of the MiniVIE
@@ -25,6 +33,7 @@ class Scenario(object):
     def __init__(self):
         # import socket
         self.SignalSource = None
+        self.SignalMerge = None  # Optional stage that aligns multiple sources into one frame
         self.SignalClassifier = None
         self.FeatureExtract = None
         self.TrainingData = None
@@ -36,9 +45,11 @@ class Scenario(object):
         # self.DebugSock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
         # Loop control parameters
-        self.loop_time = time.strftime("%c")  # store the system time for timing status messages
+        self.status_time_next = 0.0  # monotonic time at which to send the next status message
         self.loop_dt_last = 0.0  # store the duration of the last execution loop for monitoring processor load
         self.loop_counter = 0  # count the number of loops to distribute messaging rate
+        self.num_steps = 0  # number of control steps run
+        self.step_times = None  # duration of each control step, when recording (see MplScenario.run)
 
         # Training parameters
         self.add_data = False  # Control whether to add data samples on the current timestep
@@ -50,11 +61,22 @@ class Scenario(object):
         self.num_channels = 0
         self.auto_open = False  # Automatically open hand if in rest state
 
-        # Create a buffer for storing recent class decisions for majority voting
-        self.decision_buffer = deque([], get_config_var('PatternRec.num_majority_votes', 25))
+        # Smooths class decisions over recent updates (e.g. majority vote).  Rebuilt when the class names change and
+        # reset when the classifier is retrained (see get_decision_smoother)
+        self.DecisionSmoother = None
+        self.smoother_names = None
+        self.smoother_classifier = None
 
         self.output = None  # Will contain latest status message
 
+        # Cache of the last processed window.  When no signal source has advanced its sample counter since the last
+        # update, the features and classifier decision are reused rather than recomputed on identical data
+        self.last_sample_counts = None
+        self.last_classifier = None
+        self.cached_features = None
+        self.cached_decision = None
+        self.stale_count = 0  # number of consecutive updates without new data
+
         # User should access values through the is_paused method
         self.__pause = {'All': False, 'Arm': False, 'Hand': False}
 
@@ -79,6 +101,13 @@ class Scenario(object):
         # Futures for event loop
         self.futures = None
 
+        # Go-to motion (GotoHome / GotoPark) running on the event loop
+        self.goto_task = None
+
+        # Event loop that runs go-to motions, and its thread.  Commands can arrive on other threads (e.g. Spacebrew)
+        self.loop = None
+        self.loop_thread_id = None
+
     def set_precision_mode(self, value):
         # Select between precision mode or default mode.
         # When switching, gain values for alternate mode will be preserved.
@@ -104,6 +133,23 @@ class Scenario(object):
             self.hand_gain_value_precision = self.hand_gain_value  # preserve this for later
             self.hand_gain_value = self.hand_gain_value_last
 
+    def get_decision_smoother(self):
+        """
+        Return the decision smoother for the current class names
+
+        The smoother is rebuilt if the class names have changed, and its vote history is cleared if the classifier
+        has been retrained, so that votes for the old classes or model are not carried over
+        """
+        motion_names = self.TrainingData.motion_names
+        classifier = getattr(self.SignalClassifier, 'classifier', None)
+        if self.DecisionSmoother is None or motion_names is not self.smoother_names:
+            self.DecisionSmoother = smoothing.create_smoother(motion_names)
+            self.smoother_names = motion_names
+        elif classifier is not self.smoother_classifier:
+            self.DecisionSmoother.reset()
+        self.smoother_classifier = classifier
+        return self.DecisionSmoother
+
     def is_paused(self, scope='All'):
         # return the pause value for the given context ['All' 'Arm' 'Hand']
         return self.__pause[scope]
@@ -148,6 +194,47 @@ class Scenario(object):
         if self.hand_gain_value > get_config_var('MPL.HandSpeedMax', 5):
             self.hand_gain_value = get_config_var('MPL.HandSpeedMax', 5)
 
+    def start_goto(self, angles):
+        """
+        Move the limb smoothly to angles.  The motion runs as a task on the event loop with control paused, and is
+        stopped by cancel_goto() (e.g. when a new user command arrives).  Calls from other threads are handed to the
+        event loop
+        """
+        if self.loop is not None and threading.get_ident() != self.loop_thread_id:
+            self.loop.call_soon_threadsafe(self.start_goto, angles)
+            return
+        self.cancel_goto()
+        self.goto_task = asyncio.ensure_future(self.goto(angles))
+
+    def cancel_goto(self):
+        # stop a go-to motion in progress and resume control from where the limb stopped
+        if self.loop is not None and threading.get_ident() != self.loop_thread_id:
+            self.loop.call_soon_threadsafe(self.cancel_goto)
+            return
+        if self.goto_task is not None and not self.goto_task.done():
+            self.goto_task.cancel()
+            self.end_goto()
+        self.goto_task = None
+
+    def end_goto(self):
+        # synch percept position and plant position, then resume control
+        if self.DataSink.position['last_percept'] is not None:
+            self.Plant.joint_position[:] = self.DataSink.position['last_percept']
+        self.pause('All', False)
+
+    async def goto(self, angles):
+        self.pause('All', True)
+        try:
+            await self.DataSink.goto_smooth_async(angles)
+            # allow percepts to settle before synchronizing the plant
+            await asyncio.sleep(0.1)
+        except asyncio.CancelledError:
+            # cancel_goto() has already resumed control (and a new go-to may have paused it again)
+            raise
+        except Exception:
+            logging.exception('Go-to motion failed')
+        self.end_goto()
+
     def command_string(self, value):
         """
         This function accepts training commands
@@ -193,6 +280,10 @@ class Scenario(object):
             cmd_type = parsed[0]
             cmd_data = parsed[1]
 
+        # a new user command stops a go-to motion in progress
+        if cmd_type in ('Cls', 'Cmd'):
+            self.cancel_goto()
+
         if cmd_type == 'Cls':
             # Parse a Class Message
 
@@ -287,24 +378,10 @@ class Scenario(object):
                 self.DataSink.load_config_parameters()
 
             elif cmd_data == 'GotoHome':
-                self.pause('All', True)
-                angles = [0.0] * mpl.JointEnum.NUM_JOINTS
-                self.DataSink.goto_smooth(angles)
-                time.sleep(0.1)
-                # synch percept position and plant position
-                self.Plant.joint_position = self.DataSink.position['last_percept'][:]
-                time.sleep(0.1)
-                self.pause('All', False)
+                self.start_goto([0.0] * mpl.JointEnum.NUM_JOINTS)
 
             elif cmd_data == 'GotoPark':
-                self.pause('All', True)
-                angles = self.DataSink.position['park']
-                self.DataSink.goto_smooth(angles)
-                time.sleep(0.1)
-                # synch percept position and plant position
-                self.Plant.joint_position = self.DataSink.position['last_percept'][:]
-                time.sleep(0.1)
-                self.pause('All', False)
+                self.start_goto(self.DataSink.position['park'])
 
             ######################
             # Myo Control Options
@@ -332,8 +409,7 @@ class Scenario(object):
             elif cmd_data == 'ChangeMyoSet2':
                 utilities.sys_cmd.change_myo(2)
             elif cmd_data == 'NormUnity':
-                self.Plant.ref_frame_upper = np.eye(4)
-                self.Plant.ref_frame_lower = np.eye(4)
+                self.Plant.reset_motion_tracking()
 
             #################
             # System Options
@@ -489,8 +565,28 @@ class Scenario(object):
 
             return
 
+        # check whether any source has new samples.  Sources that never report samples (count of 0) are always
+        # treated as new so that inputs without a sample counter are not mistaken for stalled
+        sample_counts = tuple(src.get_sample_count() for src in self.SignalSource)
+        is_stale = (sample_counts == self.last_sample_counts and all(sample_counts)
+                    and self.cached_decision is not None
+                    and self.last_classifier is getattr(self.SignalClassifier, 'classifier', None))
+        self.last_sample_counts = sample_counts
+        self.last_classifier = getattr(self.SignalClassifier, 'classifier', None)
+
+        if is_stale:
+            self.stale_count += 1
+        elif self.stale_count:
+            logging.info('Signal data resumed after {} stale updates'.format(self.stale_count))
+            self.stale_count = 0
+
         # get data / features
-        self.output['features'], f, imu, rot_mat = self.FeatureExtract.get_features(self.SignalSource)
+        if is_stale:
+            self.output['features'], f, imu, rot_mat = self.cached_features
+        else:
+            self.output['features'], f, imu, rot_mat = self.FeatureExtract.get_features(self.SignalSource,
+                                                                                         self.SignalMerge)
+            self.cached_features = (self.output['features'], f, imu, rot_mat)
 
         # Debug stream:
         # values = self.output['features']
@@ -500,7 +596,8 @@ class Scenario(object):
         # self.DebugSock.sendto(packed_data, ('192.168.7.1', 23456))
 
         # if simultaneously training the system, add the current results to the data buffer
-        if self.add_data and f.any():
+        # (a repeated window is not a new training sample)
+        if self.add_data and f.any() and not is_stale:
             self.TrainingData.add_data(self.output['features'], self.training_id, self.training_motion, imu)
 
         # save out training data if auto_save is on, data just finished being added
@@ -511,27 +608,37 @@ class Scenario(object):
         self.add_data_last = self.add_data
 
         # classify
-        decision_id, self.output['status'] = self.SignalClassifier.predict(f)
-        # decision_id, self.output['status'] = (1, 'Movement')
-        if decision_id is None:
-            return
+        if is_stale:
+            # hold the last voted decision, but report that the input has stalled
+            decision_id = self.cached_decision[0]
+            self.output['status'] = 'STALE DATA'
+            if decision_id is None:
+                return
+        else:
+            smoother = self.get_decision_smoother()
+
+            probabilities = None
+            if smoother.use_probabilities:
+                probabilities, self.output['status'] = self.SignalClassifier.predict_proba(f)
+                decision_id = None if probabilities is None else int(np.argmax(probabilities))
+            else:
+                decision_id, self.output['status'] = self.SignalClassifier.predict(f)
+            # decision_id, self.output['status'] = (1, 'Movement')
+            if decision_id is None:
+                self.cached_decision = (None, self.output['status'])
+                return
 
-        # perform majority vote
-        # Note Counter used here instead of statistics.mode since that will raise error if equal frequency of values,
-        # which can happen even if the buffer length is odd
-        self.decision_buffer.append(decision_id)
-        counter = Counter(self.decision_buffer)
+            # smooth decision (e.g. majority vote).  No movement is passed through immediately to stop motion
+            decision_id = smoother.update(decision_id, probabilities)
 
-        if self.TrainingData.motion_names[decision_id] != 'No Movement':
-            # Immediately stop if class is no movement, otherwise use majority vote
-            decision_id = counter.most_common(1)[0][0]
+            self.cached_decision = (decision_id, self.output['status'])
 
         # get decision name
         class_decision = self.TrainingData.motion_names[decision_id]
         self.output['decision'] = class_decision
 
-        # parse decision type as arm, grasp, etc
-        class_info = controls.plant.class_map(class_decision)
+        # look up decision type as arm, grasp, etc
+        action = self.Plant.get_class_actions(self.TrainingData.motion_names)[decision_id]
 
         # Set joint velocities
         self.Plant.new_step()
@@ -545,19 +652,19 @@ class Scenario(object):
 
         # set the mapped class into either a hand or arm motion
         pause_hand = self.is_paused('Hand') or self.is_paused('All')
-        if class_info['IsGrasp'] and not pause_hand:
+        if action.is_grasp and not pause_hand:
             # the motion class is either a grasp type or hand open
-            if class_info['GraspId'] is not None and self.Plant.grasp_position < 0.2:
+            if action.grasp_id is not None and self.Plant.grasp_position < 0.2:
                 # change the grasp state if still early in the grasp motion
-                self.Plant.grasp_id = class_info['GraspId']
-            self.Plant.set_grasp_velocity(class_info['Direction'] * self.hand_gain_value)
+                self.Plant.grasp_id = action.grasp_id
+            self.Plant.set_grasp_velocity(action.direction * self.hand_gain_value)
 
         pause_arm = self.is_paused('Arm') or self.is_paused('All')
-        if not class_info['IsGrasp'] and not pause_arm:
-            self.Plant.set_joint_velocity(class_info['JointId'], class_info['Direction'] * self.gain_value)
+        if not action.is_grasp and not pause_arm:
+            self.Plant.set_joint_velocity(action.joint_id, action.direction * self.gain_value)
 
         # Automatically open hand if auto open set and no movement class
-        if self.TrainingData.motion_names[decision_id] == 'No Movement' and self.auto_open:
+        if class_decision == 'No Movement' and self.auto_open:
             self.Plant.set_grasp_velocity(-self.hand_gain_value)
 
         # track arm motion
@@ -575,19 +682,26 @@ class Scenario(object):
         return
 
     def update_interface(self):
-        # send gui updates
+        """
+        Publish status and telemetry to the training interface (web app)
+
+        This is called from run_interface() at its own rate rather than from the control loop.  The system status
+        is sent once a second, and percept messages are sent in turn, one per call
+        """
 
-        if self.TrainingInterface is None:
+        if self.TrainingInterface is None or self.output is None:
             return
 
-        # Send new status only once a second based on date string changing
-        current_time = time.strftime("%c")
-        if current_time != self.loop_time:
-            self.loop_time = current_time
+        # Send new status only once a second
+        now = time.monotonic()
+        if now >= self.status_time_next:
+            self.status_time_next = now + 1.0
             msg = '<br>' + self.DataSink.get_status_msg()  # Limb Status
             msg += ' ' + self.output['status']  # Classifier Status
             for src in self.SignalSource:
                 msg += '<br>' + src.get_status_msg()
+            if self.SignalMerge is not None:
+                msg += '<br>' + self.SignalMerge.get_status_msg()
             msg += '<br>' + 'Step Time: {:.0f}'.format(self.loop_dt_last * 1000) + 'ms'
             msg += '<br>' + time.strftime("%c")
 
@@ -602,32 +716,45 @@ class Scenario(object):
         self.TrainingInterface.send_message("training_class", msg)
 
         if self.enable_percept_stream:
-            self.loop_counter += 1
-            if self.loop_counter == 5:
-                msg = ','.join(['%.f' % np.rad2deg(elem) for elem in self.Plant.joint_position])
+            self.loop_counter = (self.loop_counter + 1) % 4
+            if self.loop_counter == 0:
+                msg = _join_values(np.rad2deg(self.Plant.joint_position))
                 self.TrainingInterface.send_message("joint_cmd", msg)
-            if self.loop_counter == 10:
-                p = self.DataSink.get_percepts()
-                try:
-                    msg = ','.join(['%.f' % np.rad2deg(elem) for elem in p['jointPercepts']['position']])
+                return
+
+            p = self.DataSink.get_percepts()
+            try:
+                if self.loop_counter == 1:
+                    msg = _join_values(np.rad2deg(p['jointPercepts']['position']))
                     self.TrainingInterface.send_message("joint_pos", msg)
-                except TypeError or KeyError:
-                    pass
-            if self.loop_counter == 15:
-                p = self.DataSink.get_percepts()
-                try:
-                    msg = ','.join(['%.1f' % elem for elem in p['jointPercepts']['torque']])
+                elif self.loop_counter == 2:
+                    msg = _join_values(p['jointPercepts']['torque'], decimals=1)
                     self.TrainingInterface.send_message("joint_torque", msg)
-                except TypeError or KeyError:
-                    pass
-            if self.loop_counter == 20:
-                p = self.DataSink.get_percepts()
-                try:
-                    msg = ','.join(['%.0f' % elem for elem in p['jointPercepts']['temperature']])
+                else:
+                    msg = _join_values(p['jointPercepts']['temperature'])
                     self.TrainingInterface.send_message("joint_temp", msg)
-                except TypeError or KeyError:
-                    pass
-                self.loop_counter = 0
+            except (TypeError, KeyError):
+                pass
+
+    async def run_interface(self, rate=10.0):
+        """ Call update_interface at a fixed rate, separate from the control loop """
+        import asyncio
+
+        while True:
+            try:
+                self.update_interface()
+            except Exception:
+                logging.exception('Error updating interface')
+            await asyncio.sleep(1.0 / rate)
+
+    async def wait_for_samples(self, num_samples):
+        """
+        Wait until every signal source has received at least num_samples new samples
+
+        Used by the event driven loop so that update() runs when new data is available rather than on a timer
+        """
+        import asyncio
+        await asyncio.gather(*[src.wait_for_samples(num_samples) for src in self.SignalSource])
 
     def close(self):
         # Close input and output objects
@@ -689,27 +816,54 @@ class MplScenario(Scenario):
         import pattern_rec as pr
         # from mpl.unity import UnityUdp
         from mpl.unity_asyncio import UnityUdp
-        from mpl.open_nfu import NfuUdp
+        from mpl.open_nfu_asyncio import NfuUdp
         from mpl.servo import Servo
         from controls.plant import Plant
 
+        # go-to motions are run on this thread's event loop
+        self.loop = asyncio.get_event_loop()
+        self.loop_thread_id = threading.get_ident()
+
         ################################################
         # Configure Inputs
         ################################################
         source_list = None
         input_device = get_config_var('input_device', 'myo')
         if input_device == 'myo':
+            if get_config_var('MyoUdpClient.batch_receive', 0):
+                # Threaded receiver that drains all pending datagrams on each wakeup
+                from inputs import myo as myo_threaded
+                myo_udp = functools.partial(myo_threaded.MyoUdp, batch_receive=True)
+            else:
+                myo_udp = myo.MyoUdp
             if get_config_var('MyoUdpClient.num_devices', 1) == 1:
                 local_port_1 = get_config_var('MyoUdpClient.local_address_1', '//0.0.0.0:15001')
-                source_list = [myo.MyoUdp(source=local_port_1)]
+                source_list = [myo_udp(source=local_port_1)]
             elif get_config_var('MyoUdpClient.num_devices', 1) == 2:
                 # Dual Armband Case
                 local_port_1 = get_config_var('MyoUdpClient.local_address_1', '//0.0.0.0:15001')
                 local_port_2 = get_config_var('MyoUdpClient.local_address_2', '//0.0.0.0:15002')
-                source_list = [myo.MyoUdp(source=local_port_1), myo.MyoUdp(source=local_port_2)]
+                if get_config_var('SignalMerge.enable', 1):
+                    # Align the armbands on a common clock.  Source buffers are longer than the merged window so
+                    # that the window is still covered when one armband is ahead of the other
+                    from inputs.signal_merge import SignalMerge
+                    num_samples = get_config_var('SignalMerge.num_samples', 50)
+                    buffer_len = num_samples + get_config_var('SignalMerge.max_skew_samples', 20)
+                    source_list = [myo_udp(source=local_port_1, num_samples=buffer_len),
+                                   myo_udp(source=local_port_2, num_samples=buffer_len)]
+                    self.SignalMerge = SignalMerge(source_list, num_samples=num_samples,
+                                                   rate=get_config_var('SignalMerge.rate', 200.0))
+                else:
+                    source_list = [myo_udp(source=local_port_1), myo_udp(source=local_port_2)]
             self.attach_source(source_list)
         elif input_device == 'daq':
-            src = daqEMGDevice.DaqEMGDevice(get_config_var('DaqDevice.device_name_and_channels', 'Dev1/ai0:7'))
+            sample_rate = get_config_var('DaqDevice.sample_rate', 1000.0)
+            backend = None
+            if get_config_var('DaqDevice.simulate', 0):
+                backend = daqEMGDevice.SimulatedDaq(sample_rate=sample_rate)
+            src = daqEMGDevice.DaqEMGDevice(get_config_var('DaqDevice.device_name_and_channels', 'Dev1/ai0:7'),
+                                            samples_per_read=get_config_var('DaqDevice.samples_per_read', 5),
+                                            sample_rate=sample_rate, backend=backend)
 
             self.attach_source([src])
         elif input_device == 'ctrl':
@@ -822,10 +976,13 @@ class MplScenario(Scenario):
                 log = logging.getLogger()
                 log.exception('Error from DCELL:')
 
-    async def run(self):
+    async def run(self, duration=None):
         """
             Main function that involves setting up devices,
             looping at a fixed time interval, and performing cleanup
+
+            :param duration: seconds to run before cleanup, or None to run until interrupted.  When a duration is
+                given, the time of every step is recorded in self.step_times (e.g. for performance testing)
         """
         import sys
         import time
@@ -841,7 +998,6 @@ class MplScenario(Scenario):
         # Run the control loop
         # ##########################
         time_elapsed = 0.0
-        self.loop_time = time.strftime("%c")
         dt = self.Plant.dt
         print(dt)
 
@@ -857,18 +1013,53 @@ class MplScenario(Scenario):
             for i in range(0, len(self.Plant.joint_position)):
                 self.Plant.joint_position[i] = self.DataSink.position['last_percept'][i]
 
-        while True:
+        # Optionally run the model each time new samples arrive instead of on a fixed timer.  The wait is bounded
+        # so that the limb is still commanded (and a stalled source is reported) if data stops flowing
+        event_driven = get_config_var('PatternRec.event_driven', 0)
+        new_samples_per_update = get_config_var('PatternRec.new_samples_per_update', 4)
+
+        # Interface updates (web app status and percepts) run as a separate task at their own rate
+        interface_task = asyncio.ensure_future(self.run_interface(get_config_var('MobileApp.status_rate', 10.0)))
+
+        # Optionally stream decimated signal plots to the web app
+        signal_task = None
+        if self.TrainingInterface is not None and get_config_var('MobileApp.signal_stream', 0):
+            from gui.signal_stream import SignalStreamer
+            streamer = SignalStreamer(self.SignalSource, self.TrainingInterface,
+                                      rate=get_config_var('MobileApp.signal_stream_rate', 5.0))
+            signal_task = asyncio.ensure_future(streamer.run())
+
+        self.num_steps = 0
+        self.step_times = [] if duration is not None else None
+        time_stop = None if duration is None else time.perf_counter() + duration
+
+        while time_stop is None or time.perf_counter() < time_stop:
             try:
+                if event_driven:
+                    try:
+                        await asyncio.wait_for(self.wait_for_samples(new_samples_per_update), timeout=2 * dt)
+                    except asyncio.TimeoutError:
+                        pass
+
+                    time_begin = time.perf_counter()
+                    self.update()
+                    time_elapsed = time.perf_counter() - time_begin
+                    self.loop_dt_last = time_elapsed
+                    self.record_step(time_elapsed)
+                    # yield to other tasks (e.g. websocket, udp) before waiting again
+                    await asyncio.sleep(0)
+                    continue
+
                 # Fixed rate loop.  get start time, run model, get end time; delay for duration
                 time_begin = time.perf_counter()
 
                 # Run the actual model
                 self.update()
-                self.update_interface()
 
                 time_end = time.perf_counter()
                 time_elapsed = time_end - time_begin
                 self.loop_dt_last = time_elapsed
+                self.record_step(time_elapsed)
                 if dt > time_elapsed:
                     # time.sleep(dt - time_elapsed)
                     await asyncio.sleep(dt - time_elapsed)
@@ -882,6 +1073,10 @@ class MplScenario(Scenario):
             except KeyboardInterrupt:
                 break
 
+        interface_task.cancel()
+        if signal_task is not None:
+            signal_task.cancel()
+
         print("")
         print("Last time_elapsed was: ", time_elapsed)
         print("")
@@ -890,6 +1085,11 @@ class MplScenario(Scenario):
 
         self.close()
 
+    def record_step(self, time_elapsed):
+        self.num_steps += 1
+        if self.step_times is not None:
+            self.step_times.append(time_elapsed)
+
 
 def test_scenarios():
     print('Testing Scenario File')
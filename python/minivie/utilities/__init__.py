@@ -1,5 +1,6 @@
 import threading
 import socket
+import select
 import logging
 import time
 from urllib.parse import urlparse
@@ -29,6 +30,13 @@ class Udp(threading.Thread):
         # default callback is just the print function.  this can be overwritten. also for i in callbacks??
         self.onmessage = lambda s: 1 + 1
         # self.onmessage = print
+
+        # In batch receive mode, all pending datagrams are drained on each wakeup.  If onbatch is assigned it is
+        # called once with the list of datagrams, otherwise onmessage is called for each datagram
+        self.batch_receive = False
+        self.max_batch_size = 64
+        self.onbatch = None
+        self.batch_stats = BatchStats()
         pass
 
     def connect(self):
@@ -37,7 +45,11 @@ class Udp(threading.Thread):
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1) # Enable broadcasting
         self.sock.bind((self.udp['LocalHostname'], self.udp['LocalPort']))
-        self.sock.settimeout(self.timeout)
+        if self.batch_receive:
+            # non-blocking socket, wait for data using select
+            self.sock.setblocking(False)
+        else:
+            self.sock.settimeout(self.timeout)
         self.is_connected = True
 
         # Create a thread for processing new data
@@ -66,6 +78,10 @@ class Udp(threading.Thread):
 
         self.run_control = True
 
+        if self.batch_receive:
+            self.run_batch()
+            return
+
         while self.run_control:
             # Blocking call until data received
             try:
@@ -96,6 +112,52 @@ class Udp(threading.Thread):
             # Execute the callback function assigned to self.onmessage
             self.onmessage(data_bytes)
 
+    def run_batch(self):
+        # Receive loop for batch mode
+        #
+        # Wait for the socket to become readable then drain every pending datagram before processing
+
+        stride = self.read_buffer_size
+        batch_buffer = bytearray(stride * self.max_batch_size)
+        batch_lengths = [0] * self.max_batch_size
+        view = memoryview(batch_buffer)
+
+        while self.run_control:
+            try:
+                readable, _, _ = select.select([self.sock], [], [], self.timeout)
+                if not readable:
+                    # the data stream has stopped.  don't break the thread, just continue to wait
+                    self.is_data_received = False
+                    self.on_connection_lost()
+                    continue
+                t_wake = time.perf_counter()
+                count = recv_batch(self.sock, batch_buffer, batch_lengths, stride)
+
+            except (socket.error, ValueError):
+                # The connection has been closed
+                msg = "{} Socket Closed on IP={} Port={}.".format(
+                    self.name, self.udp['LocalHostname'], self.udp['LocalPort'])
+                logging.info(msg)
+                # break so that the thread can terminate
+                self.run_control = False
+                break
+
+            if count == 0:
+                continue
+
+            if not self.is_data_received:
+                logging.info('{} Connection is Active: Data received'.format(self.name))
+                self.is_data_received = True
+
+            messages = [bytes(view[i * stride:i * stride + batch_lengths[i]]) for i in range(count)]
+            if self.onbatch is not None:
+                self.onbatch(messages)
+            else:
+                for data_bytes in messages:
+                    self.onmessage(data_bytes)
+
+            self.batch_stats.update(count, t_wake)
+
     def send(self, msg_bytes, address=None):
         """
         Send msg_bytes to remote host using either the established parameters stored as properties, or those
@@ -178,6 +240,72 @@ class FixedRateLoop(object):
         print("")
 
 
+class BatchStats(object):
+    """
+    Running metrics for batched datagram receive
+
+    Tracks the number of datagrams drained per wakeup and the latency from wakeup until the batch is committed
+    """
+
+    def __init__(self):
+        self.num_wakeups = 0
+        self.num_datagrams = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.last_latency = 0.0  # seconds
+        self.max_latency = 0.0  # seconds
+
+    def update(self, count, t_wake):
+        """Record a batch of count datagrams received at perf_counter time t_wake"""
+        latency = time.perf_counter() - t_wake
+        self.num_wakeups += 1
+        self.num_datagrams += count
+        self.last_batch_size = count
+        self.max_batch_size = max(self.max_batch_size, count)
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def get_metrics(self):
+        """Return a dictionary of batch receive metrics"""
+        per_wakeup = self.num_datagrams / self.num_wakeups if self.num_wakeups else 0.0
+        return {'wakeups': self.num_wakeups,
+                'datagrams': self.num_datagrams,
+                'datagrams_per_wakeup': per_wakeup,
+                'max_datagrams_per_wakeup': self.max_batch_size,
+                'latency_ms': self.last_latency * 1000,
+                'max_latency_ms': self.max_latency * 1000}
+
+
+def recv_batch(sock, batch_buffer, batch_lengths, stride):
+    """
+    Drain all pending datagrams from a non-blocking socket into a preallocated buffer
+
+    Datagram i is written to batch_buffer[i*stride:(i+1)*stride] and its length stored in batch_lengths[i].
+    Reading stops when the socket would block or the buffer is full.  Datagrams longer than stride are truncated
+
+    :param sock:
+        non-blocking datagram socket
+    :param batch_buffer:
+        writable buffer (e.g. bytearray) of at least len(batch_lengths) * stride bytes
+    :param batch_lengths:
+        list or array to receive the length of each datagram
+    :param stride:
+        maximum datagram size
+    :return:
+        number of datagrams received
+    """
+    view = memoryview(batch_buffer)
+    max_count = len(batch_lengths)
+    count = 0
+    while count < max_count:
+        try:
+            batch_lengths[count] = sock.recv_into(view[count * stride:(count + 1) * stride])
+        except BlockingIOError:
+            break
+        count += 1
+    return count
+
+
 def get_address(url):
     """
     convert address url string to get hostname and port as tuple for socket interface
@@ -0,0 +1,73 @@
+"""
+Orientation math for IMU quaternions
+
+Quaternions are (w, x, y, z).  A normalized quaternion gives an orthonormal rotation matrix directly, so no
+re-orthonormalization (e.g. by SVD) is needed, and the inverse of a rotation is its transpose.
+
+OrientationCache keeps the rotation matrix for the most recent quaternion of an input so that it is only
+recomputed when a new IMU sample arrives, rather than on every call.
+
+Usage:
+    cache = OrientationCache()
+    R = cache.get_rotation(myo.quat)  # 3x3, recomputed only when myo.quat is replaced
+    R_rel = relative_rotation(R_ref, R)  # R_ref' * R
+
+"""
+
+import numpy as np
+
+
+def quat_normalize(quat):
+    """ Return the unit quaternion of quat as a float array.  A zero quaternion returns identity (1, 0, 0, 0) """
+    q = np.asarray(quat, dtype=float)
+    norm = np.sqrt(q.dot(q))
+    if norm == 0.0:
+        return np.array([1.0, 0.0, 0.0, 0.0])
+    return q / norm
+
+
+def quat_to_rotation(quat, out=None):
+    """ Return the 3x3 rotation matrix of a quaternion.  The quaternion is normalized first """
+    w, x, y, z = quat_normalize(quat)
+    if out is None:
+        out = np.empty((3, 3))
+    xx, yy, zz = x * x, y * y, z * z
+    xy, xz, yz = x * y, x * z, y * z
+    wx, wy, wz = w * x, w * y, w * z
+    out[0, 0] = 1 - 2 * (yy + zz)
+    out[0, 1] = 2 * (xy - wz)
+    out[0, 2] = 2 * (xz + wy)
+    out[1, 0] = 2 * (xy + wz)
+    out[1, 1] = 1 - 2 * (xx + zz)
+    out[1, 2] = 2 * (yz - wx)
+    out[2, 0] = 2 * (xz - wy)
+    out[2, 1] = 2 * (yz + wx)
+    out[2, 2] = 1 - 2 * (xx + yy)
+    return out
+
+
+def relative_rotation(rot_ref, rot):
+    """ Rotation of rot relative to rot_ref (rot_ref' * rot).  The inverse of a rotation is its transpose """
+    return rot_ref.T @ rot
+
+
+class OrientationCache(object):
+    """
+    Rotation matrix of the latest quaternion of an input
+
+    Inputs replace their quaternion object when a new IMU sample arrives, so the rotation is only recomputed when
+    a different quaternion object is passed in.  The returned matrix is read only and shared between calls
+    """
+
+    def __init__(self):
+        self.quat = None
+        self.rotation = np.eye(3)
+        self.rotation.flags.writeable = False
+
+    def get_rotation(self, quat):
+        if quat is not self.quat:
+            rotation = quat_to_rotation(quat)
+            rotation.flags.writeable = False
+            self.rotation = rotation
+            self.quat = quat
+        return self.rotation
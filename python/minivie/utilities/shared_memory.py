@@ -0,0 +1,243 @@
+"""
+Shared-memory transport for streaming small packets between processes on the same host
+
+This is a drop-in local replacement for the localhost UDP link between a streaming server (e.g. myo_server)
+and a receiver (e.g. MyoUdp).  Packets are written into a fixed size ring of slots in a memory mapped file
+under /dev/shm, and the reader is woken through a named pipe (fifo).  The reader can drain every pending packet
+in a single wakeup rather than making one recvfrom() call per packet.
+
+Each slot is guarded by a sequence number (seqlock).  For message index i the writer sets the slot sequence
+to 2*i+1 before copying the payload and to 2*i+2 once the payload is complete.  The reader only accepts a slot
+whose sequence is exactly the value it expects, so partially written or overwritten slots are never returned.
+
+Both sides select the transport by address scheme, so a config entry such as:
+
+    <add key="MyoUdpServer.remote_address_1"    value="shm://myo1"/>
+    <add key="MyoUdpClient.local_address_1"     value="shm://myo1"/>
+
+replaces the UDP link with a shared memory ring named 'myo1'.  UDP addresses (//host:port) are unchanged.
+
+Note: the named pipe wakeup is only supported under linux
+
+Usage:
+    # writer (server) process
+    ring = ShmRing('myo1')
+    ring.create()
+    ring.write(data_bytes)
+
+    # reader (client) process
+    ring = ShmRing('myo1')
+    ring.open()
+    if ring.wait(1.0):
+        for data_bytes in ring.read_all():
+            pass
+
+"""
+
+import os
+import time
+import mmap
+import errno
+import select
+import struct
+import logging
+import tempfile
+from urllib.parse import urlparse
+
+SHM_SCHEME = 'shm'
+
+# Header: magic, version, num_slots, slot_size, generation, reserved, head (count of messages written)
+_HEADER = struct.Struct('<4sIIIII Q')
+_MAGIC = b'MVSR'
+_VERSION = 1
+_HEAD_OFFSET = 24
+
+# Slot: sequence number, payload length, padding, then payload bytes
+_SLOT_SEQ = struct.Struct('<Q')
+_SLOT_LEN = struct.Struct('<H')
+_SLOT_HEADER_SIZE = 16
+
+
+def get_shm_name(url):
+    """
+    Return the ring name for a shared memory address, or None for any other address
+
+    E.g. shm://myo1 becomes 'myo1', //127.0.0.1:15001 becomes None
+
+    :param url:
+        url string in format 'shm://name'
+    :return:
+        ring name string or None
+    """
+    a = urlparse(url)
+    if a.scheme != SHM_SCHEME:
+        return None
+    return a.netloc
+
+
+def _shm_dir():
+    # Use the ram backed filesystem where available
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+class ShmRing(object):
+    """
+    Single producer, single consumer ring of fixed size packet slots in shared memory
+
+    The writer calls create() then write().  The reader calls open() and then uses fileno() with select (or an
+    asyncio loop.add_reader) to be notified of new data, followed by read_all() to drain all pending packets.
+    """
+
+    def __init__(self, name, num_slots=256, slot_size=64):
+        self.name = name
+        self.num_slots = num_slots
+        self.slot_size = slot_size
+        self.slot_stride = _SLOT_HEADER_SIZE + slot_size
+
+        self.file_name = os.path.join(_shm_dir(), 'minivie_' + name)
+        self.fifo_name = self.file_name + '.wake'
+        self.size = _HEADER.size + self.num_slots * self.slot_stride
+
+        self.buffer = None
+        self.wake_fd = None
+        self.is_writer = False
+
+        self.head = 0  # next message index to be written (writer)
+        self.tail = 0  # next message index to be read (reader)
+        self.generation = None
+
+        # Reader statistics
+        self.num_received = 0
+        self.num_dropped = 0
+
+    def _map(self):
+        fd = os.open(self.file_name, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            if os.fstat(fd).st_size < self.size:
+                os.ftruncate(fd, self.size)
+            self.buffer = mmap.mmap(fd, self.size)
+        finally:
+            os.close(fd)
+
+        try:
+            os.mkfifo(self.fifo_name, 0o666)
+        except FileExistsError:
+            pass
+
+    def create(self):
+        """ Create (or reset) the ring for writing """
+        logging.info('Creating shared memory ring {} at {}'.format(self.name, self.file_name))
+        self._map()
+        self.is_writer = True
+
+        # Clear all slots so stale sequence numbers from a previous writer can't match, then mark a new generation
+        self.buffer[_HEADER.size:] = bytes(self.size - _HEADER.size)
+        self.generation = int(time.time() * 1000) & 0xFFFFFFFF
+        _HEADER.pack_into(self.buffer, 0, _MAGIC, _VERSION, self.num_slots, self.slot_size, self.generation, 0, 0)
+        self.head = 0
+
+        # O_RDWR so that the open never blocks or fails when no reader is attached
+        self.wake_fd = os.open(self.fifo_name, os.O_RDWR | os.O_NONBLOCK)
+
+    def open(self):
+        """ Attach to the ring for reading.  The writer may be started before or after the reader """
+        logging.info('Opening shared memory ring {} at {}'.format(self.name, self.file_name))
+        self._map()
+        self.is_writer = False
+        # O_RDWR so that the pipe never reports hangup (always readable) once a writer exits or restarts
+        self.wake_fd = os.open(self.fifo_name, os.O_RDWR | os.O_NONBLOCK)
+        self.tail = self._read_head()
+        self.generation = self._read_generation()
+
+    def fileno(self):
+        """ File descriptor that becomes readable when new packets are written """
+        return self.wake_fd
+
+    def write(self, data):
+        """ Write one packet into the ring and wake the reader """
+        length = len(data)
+        if length > self.slot_size:
+            logging.warning('ShmRing {}: packet of {} bytes exceeds slot size'.format(self.name, length))
+            return
+
+        index = self.head
+        offset = _HEADER.size + (index % self.num_slots) * self.slot_stride
+        buf = self.buffer
+
+        _SLOT_SEQ.pack_into(buf, offset, 2 * index + 1)  # mark slot as being written
+        _SLOT_LEN.pack_into(buf, offset + 8, length)
+        start = offset + _SLOT_HEADER_SIZE
+        buf[start:start + length] = data
+        _SLOT_SEQ.pack_into(buf, offset, 2 * index + 2)  # mark slot complete
+
+        self.head = index + 1
+        struct.pack_into('<Q', buf, _HEAD_OFFSET, self.head)
+
+        try:
+            os.write(self.wake_fd, b'\x00')
+        except OSError as e:
+            # A full pipe just means the reader has a wakeup pending already
+            if e.errno != errno.EAGAIN:
+                raise
+
+    def wait(self, timeout=None):
+        """ Block until the ring has been written to or timeout (seconds) elapses.  Returns True if woken """
+        readable, _, _ = select.select([self.wake_fd], [], [], timeout)
+        return len(readable) > 0
+
+    def read_all(self):
+        """ Drain the wakeup pipe and return a list of all packets written since the last read """
+        try:
+            os.read(self.wake_fd, 4096)
+        except BlockingIOError:
+            pass
+
+        generation = self._read_generation()
+        if generation != self.generation:
+            # The writer has been restarted, start again from the beginning of the new stream
+            self.generation = generation
+            self.tail = 0
+
+        buf = self.buffer
+        packets = []
+        while True:
+            offset = _HEADER.size + (self.tail % self.num_slots) * self.slot_stride
+            expected = 2 * self.tail + 2
+            seq = _SLOT_SEQ.unpack_from(buf, offset)[0]
+            if seq < expected:
+                # Nothing new (or slot still being written)
+                break
+            if seq == expected:
+                length = _SLOT_LEN.unpack_from(buf, offset + 8)[0]
+                start = offset + _SLOT_HEADER_SIZE
+                data = bytes(buf[start:start + length])
+                if _SLOT_SEQ.unpack_from(buf, offset)[0] == expected:
+                    packets.append(data)
+                    self.tail += 1
+                    continue
+
+            # The writer has lapped the reader.  Skip ahead to the oldest slot that is still intact
+            new_tail = max(self._read_head() - self.num_slots + 1, self.tail + 1)
+            self.num_dropped += new_tail - self.tail
+            self.tail = new_tail
+
+        self.num_received += len(packets)
+        return packets
+
+    def _read_head(self):
+        return struct.unpack_from('<Q', self.buffer, _HEAD_OFFSET)[0]
+
+    def _read_generation(self):
+        return _HEADER.unpack_from(self.buffer, 0)[4]
+
+    def close(self):
+        """ Release the memory map and wakeup pipe """
+        logging.info('Closing shared memory ring {}'.format(self.name))
+        if self.wake_fd is not None:
+            os.close(self.wake_fd)
+            self.wake_fd = None
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
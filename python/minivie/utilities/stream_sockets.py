@@ -0,0 +1,94 @@
+"""
+Datagram sockets for local streaming addresses
+
+Stream addresses are url strings:
+    //127.0.0.1:15001 - udp unicast
+    //239.255.1.1:15101 - udp multicast.  Any number of local processes can receive the same group and port
+    unix:///tmp/myo1_plot.sock - unix domain datagram socket bound to a file path
+
+Multicast receive sockets use SO_REUSEADDR and join the group on all interfaces.  Multicast send sockets use a ttl of
+1 with loopback enabled, so packets stay on the local network and are delivered to receivers on the same machine.
+
+Usage:
+    sock = open_receive_socket('//239.255.1.1:15101')
+    data, addr = sock.recvfrom(1024)
+
+"""
+
+import ipaddress
+import os
+import socket
+from urllib.parse import urlparse
+
+UNIX_SCHEME = 'unix'
+
+
+def get_unix_path(url):
+    """
+    Return the socket file path for a unix domain address, or None for any other address
+
+    E.g. unix:///tmp/myo1.sock becomes '/tmp/myo1.sock', //127.0.0.1:15001 becomes None
+    """
+    a = urlparse(url)
+    if a.scheme != UNIX_SCHEME:
+        return None
+    return a.path
+
+
+def is_multicast(hostname):
+    """ True if hostname is an IPv4 multicast group address (224.0.0.0 to 239.255.255.255) """
+    try:
+        return ipaddress.ip_address(hostname).is_multicast
+    except ValueError:
+        return False
+
+
+def get_destination(url):
+    """ Return the sendto destination of an address: a file path for unix sockets, otherwise (hostname, port) """
+    path = get_unix_path(url)
+    if path is not None:
+        return path
+    a = urlparse(url)
+    return a.hostname, a.port
+
+
+def open_receive_socket(url):
+    """ Create a datagram socket bound to receive from the address """
+    path = get_unix_path(url)
+    if path is not None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        # remove a socket file left behind by a previous receiver
+        if os.path.exists(path):
+            os.unlink(path)
+        sock.bind(path)
+        return sock
+
+    hostname, port = get_destination(url)
+    if not is_multicast(hostname):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((hostname, port))
+        return sock
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    # allow multiple sockets to use the same PORT number
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    # Bind to the port that we know will receive multicast data
+    sock.bind(('', port))
+    # Tell the kernel that we want to add ourselves to the multicast group
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                    socket.inet_aton(hostname) + socket.inet_aton('0.0.0.0'))
+    return sock
+
+
+def open_send_socket(url):
+    """ Create a non-blocking datagram socket for sending to the address """
+    if get_unix_path(url) is not None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        hostname, _ = get_destination(url)
+        if is_multicast(hostname):
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+    sock.setblocking(False)
+    return sock
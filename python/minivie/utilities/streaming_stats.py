@@ -0,0 +1,200 @@
+"""
+Streaming statistics with threshold events
+
+RunningStats keeps statistics of a stream of scalar or array samples (e.g. bus voltage, or the temperature of each
+joint) with O(1) work per sample:
+    value - the last sample
+    mean - mean of the last `window` samples (running sum over a ring buffer)
+    ema - exponential moving average with smoothing factor alpha
+    min / max - extremes of all samples since reset
+    trend - least squares slope of the last `window` samples, in units per sample
+
+The running sums are recomputed from the ring buffer once per window so that round off does not accumulate.
+
+StatMonitor checks thresholds on a RunningStats each time a sample is added and passes a ThresholdEvent to the
+threshold callback on a worker thread, so a slow callback (e.g. a shutdown procedure) never holds up the code adding
+samples.  Events are edge triggered: one when a statistic goes outside its limits (active=True) and one when it
+comes back (active=False).  For array samples a threshold is exceeded if any element is outside the limits
+
+Usage:
+    monitor = StatMonitor(RunningStats(window=15))
+    monitor.add_threshold('low_battery', on_low_battery, stat='mean', lower=20.5)
+    monitor.update(22.9)
+
+"""
+
+import logging
+import queue
+import threading
+from collections import namedtuple
+import numpy as np
+
+STATS = ('value', 'mean', 'ema', 'min', 'max', 'trend')
+
+ThresholdEvent = namedtuple('ThresholdEvent', ['name', 'stat', 'value', 'lower', 'upper', 'active'])
+
+
+class RunningStats(object):
+    """ Windowed mean and trend, exponential moving average, and min / max of a stream of samples """
+
+    def __init__(self, window=15, alpha=0.1, shape=()):
+        self.window = window
+        self.alpha = alpha
+        self.shape = tuple(np.atleast_1d(shape)) if shape != () else ()
+        self.buffer = np.zeros((window,) + self.shape)
+        # sample positions within the window, oldest first
+        self.__positions = np.arange(window, dtype=float)
+        self.count = 0
+        self.index = 0
+        self.last = np.zeros(self.shape)
+        self.sum = np.zeros(self.shape)
+        self.sum_iy = np.zeros(self.shape)  # sum of position * sample over the window
+        self.ema = np.zeros(self.shape)
+        self.min = np.full(self.shape, np.inf)
+        self.max = np.full(self.shape, -np.inf)
+
+    def reset(self):
+        self.count = 0
+        self.index = 0
+        self.sum[...] = 0.0
+        self.sum_iy[...] = 0.0
+        self.ema[...] = 0.0
+        self.min[...] = np.inf
+        self.max[...] = -np.inf
+
+    @property
+    def num_samples(self):
+        """ Number of samples in the window """
+        return min(self.count, self.window)
+
+    def update(self, value):
+        """ Add a sample """
+        if self.count >= self.window:
+            # drop the oldest sample; the others each move down one position
+            self.sum -= self.buffer[self.index]
+            self.sum_iy -= self.sum
+            position = self.window - 1
+        else:
+            position = self.count
+
+        self.buffer[self.index] = value
+        self.last[...] = value
+        self.sum += self.buffer[self.index]
+        self.sum_iy += position * self.buffer[self.index]
+
+        if self.count == 0:
+            self.ema[...] = value
+        else:
+            self.ema += self.alpha * (self.last - self.ema)
+        np.minimum(self.min, self.last, out=self.min)
+        np.maximum(self.max, self.last, out=self.max)
+
+        self.count += 1
+        self.index += 1
+        if self.index == self.window:
+            self.index = 0
+            # buffer is now oldest first, so refresh the running sums exactly
+            np.sum(self.buffer, axis=0, out=self.sum)
+            self.sum_iy[...] = np.tensordot(self.__positions, self.buffer, axes=1)
+
+    @property
+    def mean(self):
+        return self.sum / max(self.num_samples, 1)
+
+    @property
+    def trend(self):
+        n = self.num_samples
+        if n < 2:
+            return np.zeros(self.shape)[()]
+        sum_i = n * (n - 1) / 2.0
+        sum_ii = (n - 1) * n * (2 * n - 1) / 6.0
+        return (n * self.sum_iy - sum_i * self.sum) / (n * sum_ii - sum_i * sum_i)
+
+    def get(self, stat):
+        """ Return a statistic by name: 'value', 'mean', 'ema', 'min', 'max', or 'trend' """
+        if stat == 'value':
+            return self.last[()]
+        elif stat == 'mean':
+            return self.mean
+        elif stat == 'ema':
+            return self.ema[()]
+        elif stat == 'min':
+            return self.min[()]
+        elif stat == 'max':
+            return self.max[()]
+        elif stat == 'trend':
+            return self.trend
+        raise ValueError('Unknown statistic {}.  Options are {}'.format(stat, ', '.join(STATS)))
+
+
+class Threshold(object):
+    """ Limits on one statistic.  A limit of None is not checked """
+
+    def __init__(self, name, callback, stat='mean', lower=None, upper=None, min_samples=1):
+        if stat not in STATS:
+            raise ValueError('Unknown statistic {}.  Options are {}'.format(stat, ', '.join(STATS)))
+        self.name = name
+        self.callback = callback
+        self.stat = stat
+        self.lower = lower
+        self.upper = upper
+        self.min_samples = min_samples
+        self.active = False
+
+    def is_exceeded(self, value):
+        if self.lower is not None and np.any(value < self.lower):
+            return True
+        if self.upper is not None and np.any(value > self.upper):
+            return True
+        return False
+
+
+class StatMonitor(object):
+    """ Add samples to a RunningStats and dispatch threshold events to callbacks on a worker thread """
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.thresholds = []
+        self.__queue = queue.Queue()
+        self.__thread = None
+
+    def add_threshold(self, name, callback, stat='mean', lower=None, upper=None, min_samples=1):
+        """ Add a threshold and return it.  The limits can be changed later through the returned Threshold """
+        threshold = Threshold(name, callback, stat, lower, upper, min_samples)
+        self.thresholds.append(threshold)
+        return threshold
+
+    def update(self, value):
+        """ Add a sample and check thresholds """
+        self.stats.update(value)
+        for threshold in self.thresholds:
+            if self.stats.count < threshold.min_samples:
+                continue
+            stat_value = self.stats.get(threshold.stat)
+            exceeded = threshold.is_exceeded(stat_value)
+            if exceeded != threshold.active:
+                threshold.active = exceeded
+                self.dispatch(threshold.callback, ThresholdEvent(threshold.name, threshold.stat, np.copy(stat_value),
+                                                                 threshold.lower, threshold.upper, exceeded))
+
+    def dispatch(self, callback, event):
+        """ Queue a callback to run on the worker thread """
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.run_callbacks, name='StatMonitor', daemon=True)
+            self.__thread.start()
+        self.__queue.put((callback, event))
+
+    def run_callbacks(self):
+        while True:
+            callback, event = self.__queue.get()
+            if callback is None:
+                return
+            try:
+                callback(event)
+            except Exception:
+                logging.exception('Error in threshold callback {}'.format(event.name))
+
+    def close(self):
+        if self.__thread is not None:
+            self.__queue.put((None, None))
+            self.__thread = None
@@ -0,0 +1,303 @@
+# Throughput benchmark for the NFU message decoders
+#
+# Compares the structured dtype decoders in mpl/nfu.py against the previous per-byte struct.unpack
+# implementations (reproduced below as legacy_*) using the recorded messages in this folder, and checks
+# that both produce the same values.
+#
+# Usage: python benchmark_nfu_decode.py [num_iterations]
+
+import os
+import sys
+import struct
+import timeit
+import numpy as np
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../minivie')))
+
+from mpl import nfu
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Previous implementations for comparison
+# ---------------------------------------------------------------------------------------------------------------
+
+def legacy_decode_heartbeat_msg(msg_bytes):
+    # Log: Translated to Python by COP on 12OCT2016
+
+    # Check if b is input as bytes, if so, convert to uint8
+    if isinstance(msg_bytes, (bytes, bytearray)):
+        msg_bytes = struct.unpack('B' * len(msg_bytes), msg_bytes)
+        msg_bytes = np.array(msg_bytes, np.uint8)
+
+    # List of software states
+    nfu_states = [
+        'SW_STATE_INIT',
+        'SW_STATE_PRG',
+        'SW_STATE_FS',
+        'SW_STATE_NOS_CONTROL_STIMULATION',
+        'SW_STATE_NOS_IDLE',
+        'SW_STATE_NOS_SLEEP',
+        'SW_STATE_NOS_CONFIGURATION',
+        'SW_STATE_NOS_HOMING',
+        'SW_STATE_NOS_DATA_ACQUISITION',
+        'SW_STATE_NOS_DIAGNOSTICS',
+        'SW_STATE_NUM_STATES',
+    ]
+
+    msg = {
+        'SW_STATE': msg_bytes[0:4].view(np.uint32)[0],
+        'strState': '',
+        'numMsgs': msg_bytes[4:8].view(np.uint32)[0],
+        'nfuStreaming': msg_bytes[8:16].view(np.uint64)[0],
+        'lcStreaming': msg_bytes[16:24].view(np.uint64)[0],
+        'cpchStreaming': msg_bytes[24:32].view(np.uint64)[0],
+        'busVoltageCounts': msg_bytes[32:34].view(np.uint16)[0],
+        'busVoltage': 0.0,
+    }
+    msg['strState'] = nfu_states[msg['SW_STATE']]
+    msg['busVoltage'] = msg['busVoltageCounts'].astype(float) / 148.95
+
+    return msg
+
+
+def legacy_decode_cpch_msg(b):
+    # Log: Translated to Python by COP on 12OCT2016
+
+    # Check if b is input as bytes, if so, convert to uint8
+    if isinstance(b, (bytes, bytearray)):
+        b = struct.unpack('B' * len(b), b)
+        b = np.array(b, np.uint8)
+
+    # Determine expected packet size
+    num_packet_header_bytes = 6
+    num_samples_per_packet = 20
+    num_sample_header_bytes = 4
+    num_channels_per_packet = 32
+    num_bytes_per_channel = 2
+    num_bytes_per_sample = num_channels_per_packet * num_bytes_per_channel + num_sample_header_bytes
+    cpch_packet_size = num_packet_header_bytes + num_bytes_per_sample * num_samples_per_packet
+
+    # First 6 bytes of message are global header
+    data = b[num_packet_header_bytes:cpch_packet_size].reshape(
+        num_bytes_per_sample, num_samples_per_packet, order='F')
+
+    # First 5 bytes per sample are header
+    data_bytes = data[num_sample_header_bytes:, :]
+
+    # Reshape into vector and then convert to int16
+    s = data_bytes.reshape(1, data_bytes.size, order='F')[0, :].view(np.int16).reshape(
+        num_channels_per_packet, num_samples_per_packet, order='F')
+
+    sequence_number = data[2, :].astype('int16')
+    s[-1, :] = sequence_number
+
+    signal_dict = {'s': s, 'sequence_number': sequence_number}
+    return signal_dict
+
+
+def legacy_decode_percept_msg(b):
+    # Log: Translated to Python by COP on 12OCT2016
+
+    tlm = {}
+    # Enable Flags
+    percept_enable_actuated_percepts = 1
+    percept_enable_unactuated_percepts = 2
+    # percept_enable_index_ftsn = 3
+    # percept_enable_middle_ftsn = 4
+    # percept_enable_ring_ftsn = 5
+    # percept_enable_little_ftsn = 6
+    # percept_enable_thumb_ftsn = 7
+    percept_enable_contact = 8
+    percept_enable_num_ids = 8
+
+    # Actuated
+    # perceptid_index_ab_ad = 1
+    # perceptid_index_mcp = 2
+    # perceptid_middle_mcp = 3
+    # perceptid_ring_mcp = 4
+    # perceptid_little_ab_ad = 5
+    # perceptid_little_mcp = 6
+    # perceptid_thumb_cmc_ad_ab = 7
+    # perceptid_thumb_cmc_fe = 8
+    # perceptid_thumb_mcp = 9
+    # perceptid_thumb_dip = 10
+    percept_num_ids = 10
+
+    # UnActuated
+    # perceptid_index_pip = 1
+    # perceptid_index_dip = 2
+    # perceptid_middle_pip = 3
+    # perceptid_middle_dip = 4
+    # perceptid_ring_pip = 5
+    # perceptid_ring_dip = 6
+    # perceptid_little_pip = 7
+    # perceptid_little_dip = 8
+    unactuated_percept_num_ids = 8
+
+    # FTSN
+    # perceptid_index_ftsn = 1
+    # perceptid_middle_ftsn = 2
+    # perceptid_ring_ftsn = 3
+    # perceptid_little_ftsn = 4
+    # perceptid_thumb_ftsn = 5
+    ftsn_percept_num_ids = 5
+
+    # Check if b is input as bytes, if so, convert to uint8
+    if isinstance(b, (bytes, bytearray)):
+        b = struct.unpack('B' * len(b), b)
+        b = np.array(b, np.uint8)
+
+    data = b[4:]
+    # data_bytes = b[0:4].view(np.uint32)
+
+    percepts_config = np.fliplr([np.unpackbits(data[0])[8 - percept_enable_num_ids:]])[0]
+    ftsn_config = np.fliplr([np.unpackbits(data[1])[8 - ftsn_percept_num_ids:]])[0]
+
+    # index_size = data[0]
+
+    data_index = int(2)
+
+    tlm['Percept'] = []
+    if percepts_config[percept_enable_actuated_percepts - 1]:
+        for i in np.linspace(0, percept_num_ids - 1, percept_num_ids):
+            i = int(i)
+            d = {}
+            pos_start_idx = data_index + i * 7
+            d['Position'] = data[pos_start_idx: pos_start_idx + 2].view(np.int16)[0]
+            vel_start_idx = data_index + 2 + i * 7
+            d['Velocity'] = data[vel_start_idx: vel_start_idx + 2].view(np.int16)[0]
+            torq_start_idx = data_index + 4 + i * 7
+            d['Torque'] = data[torq_start_idx: torq_start_idx + 2].view(np.int16)[0]
+            d['Temperature'] = data[data_index + 6 + i * 7]
+            tlm['Percept'].append(d)
+
+        data_index += 70
+
+    tlm['UnactuatedPercept'] = []
+    if percepts_config[percept_enable_unactuated_percepts - 1]:
+        for i in np.linspace(0, unactuated_percept_num_ids - 1, unactuated_percept_num_ids):
+            i = int(i)
+            d = {}
+            pos_start_idx = data_index + i * 2
+            d['Position'] = data[pos_start_idx: pos_start_idx + 2].view(np.int16)[0]
+            tlm['UnactuatedPercept'].append(d)
+
+        data_index += 16
+
+    tlm['FtsnPercept'] = []
+    for i in np.linspace(0, ftsn_percept_num_ids - 1, ftsn_percept_num_ids):
+        i = int(i)
+        if percepts_config[i + 1]:
+            d = {'forceConfig': ftsn_config[i]}
+
+            if ftsn_config[i]:  # new style
+                force = []
+                for _ in np.linspace(0, 13, 14):
+                    force.append(data[data_index])
+                    data_index += 1
+                d['force'] = force
+
+                d['acceleration_x'] = data[data_index]
+                data_index += 1
+                d['acceleration_y'] = data[data_index]
+                data_index += 1
+                d['acceleration_z'] = data[data_index]
+                data_index += 1
+
+            else:  # old style
+                d['force_pressure'] = data[data_index: data_index + 2].view(np.int16)[0]
+                data_index += 2
+                d['force_shear'] = data[data_index: data_index + 2].view(np.int16)[0]
+                data_index += 2
+                d['force_axial'] = data[data_index: data_index + 2].view(np.int16)[0]
+                data_index += 2
+
+                d['acceleration_x'] = data[data_index]
+                data_index += 1
+                d['acceleration_y'] = data[data_index]
+                data_index += 1
+                d['acceleration_z'] = data[data_index]
+                data_index += 1
+
+            tlm['FtsnPercept'].append(d)
+
+    if percepts_config[percept_enable_contact - 1]:
+        contact_data = data[data_index:data_index + 12]
+
+        tlm['ContactSensorPercept'] = []
+        d = {'index_contact_sensor': contact_data[0], 'middle_contact_sensor': contact_data[1],
+             'ring_contact_sensor': contact_data[2], 'little_contact_sensor': contact_data[3],
+             'index_abad_contact_sensor_1': contact_data[4], 'index_abad_contact_sensor_2': contact_data[5],
+             'little_abad_contact_sensor_1': contact_data[6], 'little_abad_contact_sensor_2': contact_data[7]}
+
+        tlm['ContactSensorPercept'].append(d)
+
+    if len(b) > 518:
+        lmc = b[-308:].reshape(44, 7, order='F')
+    else:
+        lmc = []
+
+    tlm['LMC'] = lmc
+
+    return tlm
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------------------------------------------
+
+def check_equivalent(heartbeat, cpch, percept):
+    """ Verify the new decoders return the same values as the previous implementation """
+    new = nfu.decode_heartbeat_msg(heartbeat)
+    old = legacy_decode_heartbeat_msg(heartbeat)
+    for key in old:
+        assert new[key] == old[key], key
+
+    new = nfu.decode_cpch_msg(cpch)
+    old = legacy_decode_cpch_msg(cpch)
+    assert np.array_equal(new['s'], old['s'])
+    assert np.array_equal(new['sequence_number'], old['sequence_number'])
+
+    new = nfu.decode_percept_msg(percept)
+    old = legacy_decode_percept_msg(percept)
+    for i, d in enumerate(old['Percept']):
+        for key in d:
+            assert new['Percept'][i][key] == d[key], key
+    for i, d in enumerate(old['UnactuatedPercept']):
+        assert new['UnactuatedPercept'][i]['Position'] == d['Position']
+    assert len(new['FtsnPercept']) == len(old['FtsnPercept'])
+    for i, d in enumerate(old['FtsnPercept']):
+        for key, value in d.items():
+            assert np.array_equal(new['FtsnPercept'][i][key], value), key
+    if 'ContactSensorPercept' in old:
+        for key, value in old['ContactSensorPercept'][0].items():
+            assert new['ContactSensorPercept'][0][key] == value, key
+    assert np.array_equal(new['LMC'], old['LMC'])
+
+
+def main(num_iterations=2000):
+    heartbeat = np.fromfile(os.path.join(TEST_DIR, 'heartbeat.bin'), dtype=np.uint8).tobytes()
+    u = np.fromfile(os.path.join(TEST_DIR, 'percepts.bin'), dtype=np.uint8)
+    cpch = u[:1366].tobytes()
+    percept = u[1366:].tobytes()
+
+    check_equivalent(heartbeat, cpch, percept)
+    print('Decoded values match previous implementation')
+
+    cases = [
+        ('heartbeat (36 bytes)', legacy_decode_heartbeat_msg, nfu.decode_heartbeat_msg, heartbeat),
+        ('cpch (1366 bytes)', legacy_decode_cpch_msg, nfu.decode_cpch_msg, cpch),
+        ('percept (824 bytes)', legacy_decode_percept_msg, nfu.decode_percept_msg, percept),
+    ]
+
+    print('{:<24}{:>14}{:>14}{:>10}'.format('message', 'old msg/s', 'new msg/s', 'speedup'))
+    for name, old_fcn, new_fcn, msg in cases:
+        t_old = min(timeit.repeat(lambda: old_fcn(msg), number=num_iterations, repeat=3))
+        t_new = min(timeit.repeat(lambda: new_fcn(msg), number=num_iterations, repeat=3))
+        print('{:<24}{:>14.0f}{:>14.0f}{:>9.1f}x'.format(
+            name, num_iterations / t_old, num_iterations / t_new, t_old / t_new))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
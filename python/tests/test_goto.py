@@ -0,0 +1,99 @@
+# Unit tests of the scenario go-to motions (GotoHome / GotoPark)
+#
+# Usage (from the tests folder):
+#
+#   python -m pytest test_goto.py
+
+import os
+import sys
+import asyncio
+import threading
+from types import SimpleNamespace
+import numpy as np
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(TEST_DIR, '..', 'minivie')))
+
+import mpl
+from scenarios import Scenario
+
+
+class GotoSink(object):
+    # Stand-in data sink that records go-to motions and reports the limb at the last go-to angles
+    def __init__(self):
+        self.angles = []
+        self.position = {'last_percept': None, 'park': [0.1] * mpl.JointEnum.NUM_JOINTS}
+
+    async def goto_smooth_async(self, angles):
+        await asyncio.sleep(0.2)
+        self.angles.append(list(angles))
+        self.position['last_percept'] = np.array(angles, dtype=float)
+
+
+def make_scenario(loop):
+    vie = Scenario()
+    vie.Plant = SimpleNamespace(joint_position=np.ones(mpl.JointEnum.NUM_JOINTS))
+    vie.DataSink = GotoSink()
+    vie.loop = loop
+    vie.loop_thread_id = threading.get_ident()
+    return vie
+
+
+def run_command_in_thread(vie, command):
+    # send a command from a worker thread, as the Spacebrew websocket does, and wait for the go-to to finish
+    errors = []
+
+    def send():
+        try:
+            vie.command_string(command)
+        except Exception as e:
+            errors.append(e)
+
+    async def main():
+        worker = threading.Thread(target=send)
+        worker.start()
+        while worker.is_alive():
+            await asyncio.sleep(0.01)
+        # let the callbacks handed over by the worker run
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        if vie.goto_task is not None:
+            await vie.goto_task
+
+    vie.loop.run_until_complete(main())
+    return errors
+
+
+def test_goto_home_from_worker_thread():
+    loop = asyncio.new_event_loop()
+    try:
+        vie = make_scenario(loop)
+        assert run_command_in_thread(vie, 'Cmd:GotoHome') == []
+        assert vie.DataSink.angles == [[0.0] * mpl.JointEnum.NUM_JOINTS]
+        assert not vie.is_paused('All')
+        np.testing.assert_array_equal(vie.Plant.joint_position, 0.0)
+    finally:
+        loop.close()
+
+
+def test_new_command_cancels_goto_from_worker_thread():
+    loop = asyncio.new_event_loop()
+    try:
+        vie = make_scenario(loop)
+
+        async def start_and_cancel():
+            vie.start_goto(vie.DataSink.position['park'])
+            await asyncio.sleep(0)
+            assert vie.is_paused('All')
+            worker = threading.Thread(target=vie.command_string, args=('Cmd:SpeedUp',))
+            worker.start()
+            while worker.is_alive():
+                await asyncio.sleep(0.001)
+            await asyncio.sleep(0)
+
+        loop.run_until_complete(start_and_cancel())
+        assert vie.goto_task is None
+        assert vie.DataSink.angles == []
+        assert not vie.is_paused('All')
+    finally:
+        loop.close()
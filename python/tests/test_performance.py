@@ -0,0 +1,213 @@
+# End to end performance test of the MiniVIE control loop
+#
+# Runs MplScenario without hardware:
+#   simulated Myo armband(s) stream EMG packets over UDP (as from myo_server)
+#   a simulated Unity vMPL receives the joint commands
+#   a temporary user config points both at free localhost ports
+#
+# The control loop runs headless for a fixed duration, then throughput (steps/s), step latency and packet loss
+# are checked against thresholds and written to a json report.
+#
+# Usage (from the tests folder):
+#
+#   python -m pytest test_performance.py
+#
+# Settings can be overridden with environment variables:
+#
+#   MINIVIE_PERF_DURATION   seconds to run the control loop (default 5.0)
+#   MINIVIE_PERF_MIN_RATE   minimum fraction of the nominal step rate (default 0.9)
+#   MINIVIE_PERF_MAX_P99    maximum 99th percentile step time in seconds (default 0.5 * timestep)
+#   MINIVIE_PERF_MAX_LOSS   maximum fraction of emg packets lost (default 0.01)
+#   MINIVIE_PERF_REPORT     path of the json report (default perf_report.json in the tests folder)
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import platform
+import threading
+import numpy as np
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+MINIVIE_DIR = os.path.abspath(os.path.join(TEST_DIR, '..', 'minivie'))
+ROC_FILE = os.path.abspath(os.path.join(TEST_DIR, '..', '..', 'WrRocDefaults.xml'))
+sys.path.insert(0, MINIVIE_DIR)
+
+TIMESTEP = 0.02
+EMG_PACKET_RATE = 100.0  # Myo streams 200Hz EMG as 2 samples per packet
+NUM_DEVICES = 1
+
+DURATION = float(os.environ.get('MINIVIE_PERF_DURATION', 5.0))
+MIN_RATE = float(os.environ.get('MINIVIE_PERF_MIN_RATE', 0.9))
+MAX_P99 = float(os.environ.get('MINIVIE_PERF_MAX_P99', 0.5 * TIMESTEP))
+MAX_LOSS = float(os.environ.get('MINIVIE_PERF_MAX_LOSS', 0.01))
+REPORT_FILE = os.environ.get('MINIVIE_PERF_REPORT', os.path.join(TEST_DIR, 'perf_report.json'))
+
+
+def get_free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def write_config(file, settings):
+    with open(file, 'w') as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n<userSettings>\n')
+        for key, value in settings.items():
+            f.write('    <add key="{}" value="{}"/>\n'.format(key, value))
+        f.write('</userSettings>\n')
+
+
+class MyoSimulator(threading.Thread):
+    """ Send 16 byte Myo EMG packets (2 samples of 8 channels) to a port at a fixed rate """
+
+    def __init__(self, port, rate=EMG_PACKET_RATE, duration=1.0, seed=0):
+        super(MyoSimulator, self).__init__(name='MyoSimulator{}'.format(port), daemon=True)
+        self.port = port
+        self.rate = rate
+        self.duration = duration
+        self.num_sent = 0
+        self.rng = np.random.default_rng(seed)
+
+    def run(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        packets = self.rng.integers(-128, 128, size=(256, 16), dtype=np.int8)
+        num_packets = int(self.rate * self.duration)
+        deadline = time.perf_counter()
+        for i in range(num_packets):
+            deadline += 1.0 / self.rate
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            sock.sendto(packets[i % len(packets)].tobytes(), ('127.0.0.1', self.port))
+            self.num_sent += 1
+        sock.close()
+
+
+class UnitySimulator(threading.Thread):
+    """ Receive and count joint command packets (27 floats) sent to the vMPL """
+
+    def __init__(self, port):
+        super(UnitySimulator, self).__init__(name='UnitySimulator', daemon=True)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', port))
+        self.sock.settimeout(0.1)
+        self.num_received = 0
+        self.running = True
+
+    def run(self):
+        while self.running:
+            try:
+                data = self.sock.recv(1024)
+            except socket.timeout:
+                continue
+            if len(data) == 27 * 4:
+                self.num_received += 1
+
+    def stop(self):
+        self.running = False
+        self.join()
+        self.sock.close()
+
+
+def add_training_data(vie, num_samples=50):
+    """ Train the classifier on synthetic features so that every step runs the full pipeline """
+    _, f, _, _ = vie.FeatureExtract.get_features(vie.SignalSource)
+    rng = np.random.default_rng(1)
+    for class_id, name in enumerate(vie.TrainingData.motion_names[:3]):
+        center = rng.uniform(0, 10, f.shape[1])
+        for _ in range(num_samples):
+            vie.TrainingData.add_data((center + rng.normal(0, 0.1, f.shape[1])).tolist(), class_id, name)
+    vie.SignalClassifier.fit()
+
+
+def test_control_loop_performance(tmp_path, monkeypatch):
+    from utilities import user_config
+    from scenarios import MplScenario
+
+    myo_ports = [get_free_port() for _ in range(NUM_DEVICES)]
+    unity_port = get_free_port()
+
+    settings = {
+        'input_device': 'myo',
+        'MyoUdpClient.num_devices': NUM_DEVICES,
+        'DataSink': 'Unity',
+        'UnityUdp.local_address': '//127.0.0.1:{}'.format(get_free_port()),
+        'UnityUdp.remote_address': '//127.0.0.1:{}'.format(unity_port),
+        'MPL.connection_check': 0,
+        'MPL.roc_table': ROC_FILE,
+        'MobileApp.server_type': 'None',
+        'timestep': TIMESTEP,
+    }
+    for i, port in enumerate(myo_ports):
+        settings['MyoUdpClient.local_address_{}'.format(i + 1)] = '//127.0.0.1:{}'.format(port)
+
+    # run from an empty folder so that no saved training data is loaded (or overwritten)
+    config_file = str(tmp_path / 'user_config.xml')
+    write_config(config_file, settings)
+    monkeypatch.chdir(tmp_path)
+    user_config.read_user_config_file(file=config_file)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    unity = UnitySimulator(unity_port)
+    unity.start()
+
+    vie = MplScenario()
+    vie.setup()
+    vie.setup_interfaces()
+    add_training_data(vie)
+
+    # stop sending before the loop ends so that every packet sent has had time to be received
+    myo = [MyoSimulator(port, duration=DURATION - 0.5, seed=i) for i, port in enumerate(myo_ports)]
+    for m in myo:
+        m.start()
+
+    try:
+        loop.run_until_complete(vie.run(duration=DURATION))
+    finally:
+        for m in myo:
+            m.join()
+        unity.stop()
+        loop.close()
+        asyncio.set_event_loop(None)
+
+    step_times = np.array(vie.step_times)
+    num_sent = sum(m.num_sent for m in myo)
+    # each emg packet holds 2 samples
+    num_received = sum(src.get_sample_count() for src in vie.SignalSource) / 2
+    loss = 1.0 - num_received / num_sent if num_sent else 1.0
+    step_rate = vie.num_steps / DURATION
+
+    report = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'duration': DURATION,
+        'timestep': TIMESTEP,
+        'num_devices': NUM_DEVICES,
+        'num_steps': vie.num_steps,
+        'step_rate': step_rate,
+        'step_time_mean': float(step_times.mean()),
+        'step_time_p50': float(np.percentile(step_times, 50)),
+        'step_time_p99': float(np.percentile(step_times, 99)),
+        'step_time_max': float(step_times.max()),
+        'packets_sent': num_sent,
+        'packets_received': num_received,
+        'packet_loss': loss,
+        'commands_received': unity.num_received,
+        'thresholds': {'min_step_rate': MIN_RATE / TIMESTEP, 'max_p99': MAX_P99, 'max_loss': MAX_LOSS},
+    }
+    with open(REPORT_FILE, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    assert step_rate >= MIN_RATE / TIMESTEP, 'Step rate {:.1f}/s below {:.1f}/s'.format(step_rate,
+                                                                                       MIN_RATE / TIMESTEP)
+    assert report['step_time_p99'] <= MAX_P99, 'p99 step time {:.4f}s above {:.4f}s'.format(
+        report['step_time_p99'], MAX_P99)
+    assert loss <= MAX_LOSS, 'Packet loss {:.2%} above {:.2%}'.format(loss, MAX_LOSS)
+    assert unity.num_received >= vie.num_steps * MIN_RATE, 'Only {} of {} joint commands received'.format(
+        unity.num_received, vie.num_steps)
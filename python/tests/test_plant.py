@@ -0,0 +1,99 @@
+# Unit tests of the batched plant simulation (controls.plant)
+#
+# Usage (from the tests folder):
+#
+#   python -m pytest test_plant.py
+
+import os
+import sys
+import time
+import numpy as np
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(TEST_DIR, '..', 'minivie')))
+
+from controls import plant
+
+ROC_FILE = os.path.abspath(os.path.join(TEST_DIR, '..', '..', 'WrRocDefaults.xml'))
+NAMES = ['No Movement', 'Hand Open', 'Spherical Grasp', 'Tip Grasp', 'Elbow Flexion', 'Elbow Extension',
+         'Wrist Rotate In', 'Wrist Rotate Out', 'Shoulder Abduction']
+
+
+def integrate_loop(initial, steps, lower, upper):
+    x = np.empty_like(steps)
+    value = initial
+    for t, step in enumerate(steps):
+        value = np.clip(value + step, lower, upper)
+        x[t] = value
+    return x
+
+
+def replay_decisions(p, decisions, motion_names, gain, hand_gain, auto_open):
+    # set commands as in Scenario.update and call update() once per decision
+    actions = p.get_class_actions(motion_names)
+    path = np.empty((len(decisions), len(p.joint_position)))
+    for t, decision in enumerate(decisions):
+        p.new_step()
+        action = actions[decision]
+        if action.is_grasp:
+            if action.grasp_id is not None and p.grasp_position < 0.2:
+                p.grasp_id = action.grasp_id
+            p.set_grasp_velocity(action.direction * hand_gain)
+        elif action.joint_id is not None:
+            p.set_joint_velocity(action.joint_id, action.direction * gain)
+        if auto_open and motion_names[decision] == 'No Movement':
+            p.set_grasp_velocity(-hand_gain)
+        p.update()
+        path[t] = p.joint_position
+    return path
+
+
+def hold_decisions(num_steps, num_classes, seed):
+    # class decisions held for random lengths, as a smoothed classifier would produce
+    rng = np.random.RandomState(seed)
+    decisions = np.repeat(rng.randint(num_classes, size=num_steps), rng.randint(1, 60, size=num_steps))
+    return decisions[:num_steps]
+
+
+def test_integrate_clipped_matches_loop():
+    rng = np.random.RandomState(0)
+    for num_steps in (1, 255, 256, 257, 1000):
+        steps = rng.randn(num_steps, 5) * 0.3
+        lower = np.array([-1.0, 0.0, -0.5, -2.0, -0.1])
+        upper = np.array([1.0, 0.2, 0.5, 2.0, 0.1])
+        expected = integrate_loop(np.zeros(5), steps, lower, upper)
+        np.testing.assert_allclose(plant.integrate_clipped(0.0, steps, lower, upper), expected, atol=1e-12)
+
+
+def test_integrate_clipped_limit_bounce():
+    # steps that hit the upper and lower limit on alternate passes
+    steps = np.tile(np.r_[np.full(20, 0.1), np.full(20, -0.1)], 50)
+    expected = integrate_loop(0.0, steps, 0.0, 0.5)
+    np.testing.assert_allclose(plant.integrate_clipped(0.0, steps, 0.0, 0.5), expected, atol=1e-12)
+
+
+def test_integrate_clipped_long_bounce_is_linear():
+    steps = np.tile(np.r_[np.full(20, 0.1), np.full(20, -0.1)], 2500)
+    start = time.perf_counter()
+    x = plant.integrate_clipped(0.0, steps, 0.0, 0.5)
+    assert time.perf_counter() - start < 2.0
+    np.testing.assert_allclose(x[-40:], integrate_loop(0.0, steps[:40], 0.0, 0.5), atol=1e-12)
+
+
+def test_simulate_decisions_matches_update():
+    for auto_open in (False, True):
+        decisions = hold_decisions(3000, len(NAMES), seed=1)
+        p = plant.Plant(0.02, ROC_FILE)
+        path = p.simulate_decisions(decisions, NAMES, gain=1.5, hand_gain=2.0, auto_open=auto_open)
+        expected = replay_decisions(p, decisions, NAMES, 1.5, 2.0, auto_open)
+        np.testing.assert_allclose(path, expected, atol=1e-12)
+
+
+def test_simulate_decisions_long_run():
+    decisions = hold_decisions(90000, len(NAMES), seed=2)
+    p = plant.Plant(0.02, ROC_FILE)
+    start = time.perf_counter()
+    path = p.simulate_decisions(decisions, NAMES, gain=1.5, hand_gain=2.0)
+    assert time.perf_counter() - start < 5.0
+    np.testing.assert_allclose(path[:2000], replay_decisions(p, decisions[:2000], NAMES, 1.5, 2.0, False),
+                               atol=1e-12)
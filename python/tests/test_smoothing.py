@@ -0,0 +1,111 @@
+# Unit tests of the classifier decision smoothers (pattern_rec.smoothing)
+#
+# Usage (from the tests folder):
+#
+#   python -m pytest test_smoothing.py
+
+import os
+import sys
+from types import SimpleNamespace
+import numpy as np
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(TEST_DIR, '..', 'minivie')))
+
+from pattern_rec import smoothing
+
+NAMES = ('No Movement', 'Hand Open', 'Hand Close', 'Wrist Rotate In')
+REST, OPEN, CLOSE, ROTATE = range(4)
+
+
+def run(smoother, decisions):
+    return [smoother.update(d) for d in decisions]
+
+
+def test_ring_mode_follows_window():
+    ring = smoothing.DecisionRing(3, num_classes=4)
+    assert [ring.push(d) for d in (OPEN, CLOSE, CLOSE, OPEN, OPEN)] == [OPEN, OPEN, CLOSE, CLOSE, OPEN]
+
+
+def test_ring_tie_keeps_current_mode():
+    ring = smoothing.DecisionRing(4)
+    assert [ring.push(d) for d in (OPEN, OPEN, CLOSE, CLOSE)] == [OPEN, OPEN, OPEN, OPEN]
+
+
+def test_ring_grows_for_new_class_id():
+    ring = smoothing.DecisionRing(3, num_classes=1)
+    assert [ring.push(d) for d in (5, 5, 2)] == [5, 5, 5]
+
+
+def test_majority_vote():
+    smoother = smoothing.MajorityVote(num_votes=3, rest_id=REST, num_classes=4)
+    assert run(smoother, (OPEN, CLOSE, CLOSE, OPEN, OPEN)) == [OPEN, OPEN, CLOSE, CLOSE, OPEN]
+
+
+def test_majority_vote_passes_rest_immediately():
+    smoother = smoothing.MajorityVote(num_votes=5, rest_id=REST, num_classes=4)
+    assert run(smoother, (OPEN, OPEN, OPEN, REST, OPEN)) == [OPEN, OPEN, OPEN, REST, OPEN]
+
+
+def test_majority_vote_reset_clears_history():
+    smoother = smoothing.MajorityVote(num_votes=5, rest_id=REST, num_classes=4)
+    run(smoother, (OPEN, OPEN, OPEN))
+    smoother.reset()
+    assert run(smoother, (CLOSE,)) == [CLOSE]
+
+
+def test_onset_requires_persistent_vote():
+    smoother = smoothing.OnsetGate(num_votes=1, rest_id=REST, num_classes=4, onset_count=3)
+    assert run(smoother, (OPEN, OPEN, OPEN, CLOSE, OPEN, CLOSE, CLOSE, CLOSE)) == \
+        [REST, REST, OPEN, OPEN, OPEN, OPEN, OPEN, CLOSE]
+
+
+def test_onset_rest_stops_immediately():
+    smoother = smoothing.OnsetGate(num_votes=1, rest_id=REST, num_classes=4, onset_count=2)
+    assert run(smoother, (OPEN, OPEN, REST, OPEN, OPEN)) == [REST, OPEN, REST, REST, OPEN]
+
+
+def test_onset_count_of_one_is_majority_vote():
+    onset = smoothing.OnsetGate(num_votes=3, rest_id=REST, num_classes=4, onset_count=1)
+    vote = smoothing.MajorityVote(num_votes=3, rest_id=REST, num_classes=4)
+    decisions = (OPEN, CLOSE, CLOSE, OPEN, OPEN, ROTATE, ROTATE, ROTATE)
+    assert run(onset, decisions) == run(vote, decisions)
+
+
+def test_posterior_average():
+    smoother = smoothing.PosteriorAverage(num_votes=2, rest_id=REST, num_classes=3)
+    p1 = np.array([0.1, 0.8, 0.1])
+    p2 = np.array([0.1, 0.3, 0.6])
+    p3 = np.array([0.1, 0.2, 0.7])
+    assert smoother.update(OPEN, p1) == OPEN
+    assert smoother.update(CLOSE, p2) == OPEN  # mean of p1, p2 still favors OPEN
+    assert smoother.update(CLOSE, p3) == CLOSE  # p1 has left the window
+    assert smoother.update(REST, p1) == REST
+
+
+def test_create_smoother_strategy():
+    assert isinstance(smoothing.create_smoother(NAMES, 'majority', 5), smoothing.MajorityVote)
+    assert isinstance(smoothing.create_smoother(NAMES, 'posterior', 5), smoothing.PosteriorAverage)
+    assert isinstance(smoothing.create_smoother(NAMES, 'onset', 5), smoothing.OnsetGate)
+    assert smoothing.create_smoother(NAMES, 'majority', 5).rest_id == REST
+
+
+def test_scenario_smoother_follows_classes_and_training():
+    from scenarios import Scenario
+
+    vie = Scenario()
+    vie.TrainingData = SimpleNamespace(motion_names=NAMES)
+    vie.SignalClassifier = SimpleNamespace(classifier=object())
+
+    smoother = vie.get_decision_smoother()
+    assert vie.get_decision_smoother() is smoother
+    run(smoother, (OPEN,) * 10)
+
+    # retraining clears the vote history
+    vie.SignalClassifier.classifier = object()
+    assert vie.get_decision_smoother() is smoother
+    assert smoother.update(CLOSE) == CLOSE
+
+    # a new class list builds a new smoother
+    vie.TrainingData.motion_names = NAMES + ('Elbow Flexion',)
+    assert vie.get_decision_smoother() is not smoother
@@ -0,0 +1,48 @@
+// signalPlot.js draws decimated signal frames streamed from the minivie headless signal viewer
+//
+// Frames arrive as 'signal_frame' messages containing JSON:
+//   {"x": [sample index, ...], "y": [[channel 1 values], [channel 2 values], ...]}
+// Each channel is drawn in its own horizontal strip, scaled to the frame min/max
+
+var signalColors = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2", "#7f7f7f",
+                    "#bcbd22", "#17becf", "#aec7e8", "#ffbb78", "#98df8a", "#ff9896", "#c5b0d5", "#c49c94"];
+
+function drawSignalFrame(cmd_data) {
+  var canvas = document.getElementById("ID_SIGNAL_CANVAS");
+  if (!canvas || canvas.offsetParent === null) {
+    // canvas is not on the visible page
+    return;
+  }
+  var frame = JSON.parse(cmd_data);
+  var x = frame.x;
+  var ctx = canvas.getContext("2d");
+  var width = canvas.width;
+  var height = canvas.height;
+  ctx.clearRect(0, 0, width, height);
+
+  var numChannels = frame.y.length;
+  var stripHeight = height / numChannels;
+  var xMin = x[0];
+  var xScale = width / Math.max(x[x.length - 1] - xMin, 1);
+
+  for (var c = 0; c < numChannels; c++) {
+    var y = frame.y[c];
+    var yMin = Math.min.apply(null, y);
+    var yMax = Math.max.apply(null, y);
+    var yScale = stripHeight / Math.max(yMax - yMin, 1e-6);
+    var yBase = (c + 1) * stripHeight;
+
+    ctx.strokeStyle = signalColors[c % signalColors.length];
+    ctx.beginPath();
+    for (var i = 0; i < y.length; i++) {
+      var px = (x[i] - xMin) * xScale;
+      var py = yBase - (y[i] - yMin) * yScale;
+      if (i === 0) {
+        ctx.moveTo(px, py);
+      } else {
+        ctx.lineTo(px, py);
+      }
+    }
+    ctx.stroke();
+  }
+}
@@ -43,7 +43,15 @@ function setupWebsockets(){
       var split_id = value.indexOf(":");
       var cmd_type = value.slice(0,split_id);
       var cmd_data = value.slice(split_id+1);
-      routeMessage(cmd_type, cmd_data);
+      if (cmd_type == "batch") {
+        // batched frame of the latest values {cmd_type: cmd_data, ...}
+        var batch = JSON.parse(cmd_data);
+        for (var key in batch) {
+          dispatchMessage(key, batch[key]);
+        }
+      } else {
+        dispatchMessage(cmd_type, cmd_data);
+      }
     }  // socket.onmessage
 
     socket.onclose = function(){
@@ -67,6 +75,15 @@ function setupWebsockets(){
 
 } // setupWebsockets
 
+function dispatchMessage(cmd_type, cmd_data) {
+  // signal frames are drawn by signalPlot.js, all other messages update the page
+  if (cmd_type === "signal_frame") {
+    drawSignalFrame(cmd_data);
+  } else {
+    routeMessage(cmd_type, cmd_data);
+  }
+}
+
 function sendCmd(cmd) {
   // global sendCmd function called from index.html and galleryLinks.js
   console.log("SEND:" + cmd);